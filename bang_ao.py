@@ -0,0 +1,257 @@
+from tkinter import ttk
+
+# Bảng ảo (virtual list) cho ttk.Treeview: Treeview chỉ giữ đúng số dòng đang hiển thị,
+# dữ liệu được lấy từng trang khi người dùng cuộn (keyset pagination), kèm một ít dòng
+# đệm trước/sau. Chi phí vẽ phụ thuộc kích thước khung nhìn chứ không phụ thuộc số dòng.
+
+HEADER_HEIGHT = 28  # chiều cao ước lượng của dòng tiêu đề Treeview (px)
+
+
+class _OffsetSource:
+    """
+    Nguồn chỉ lấy được theo vị trí (fetch_page(offset, limit)), vd: kết quả tìm kiếm xếp
+    theo độ liên quan. Khóa keyset của mỗi dòng chính là vị trí của nó trong danh sách.
+    """
+
+    def __init__(self, fetch_page, count):
+        self.fetch_page = fetch_page
+        self.count = count
+
+    def fetch(self, after=None, before=None, offset=0, limit=50):
+        if after is not None:
+            start = after + 1
+        elif before is not None:
+            start = max(0, before - limit)
+            limit = before - start
+        else:
+            start = offset
+        return list(enumerate(self.fetch_page(start, limit), start))
+
+    @staticmethod
+    def key(item):
+        return item[0]
+
+
+class _ListSource(_OffsetSource):
+    """Nguồn dữ liệu từ một list có sẵn trong RAM (vd: bảng tổng hợp theo danh mục)."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        super().__init__(lambda offset, limit: self.rows[offset:offset + limit],
+                         lambda: len(self.rows))
+
+
+class VirtualTreeview:
+    """
+    Gắn vào một Treeview + Scrollbar có sẵn. Nguồn dữ liệu gồm:
+    - fetch(after=None, before=None, offset=0, limit=n) -> list dòng, thứ tự hiển thị
+    - count() -> tổng số dòng (nên lấy từ truy vấn tổng hợp, không đếm từng dòng)
+    - key(row) -> khóa keyset của dòng (vd: (date_key, id))
+    - format_row(vị trí, row) -> tuple giá trị hiển thị
+    - descending: dòng có khóa lớn hơn đứng trước (mới nhất lên đầu)
+    Khi dữ liệu đổi ít (vd: vừa thêm một khoản chi), insert_rows / update_rows / delete_keys
+    sửa thẳng bộ đệm thay vì đếm và truy vấn lại; chỉ item có giá trị khác mới được vẽ lại.
+    """
+
+    def __init__(self, tree, scrollbar, prefetch=2):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.prefetch = prefetch     # số "màn hình" giữ thêm ở mỗi phía
+        self.total = 0
+        self.top = 0                 # vị trí dòng đầu tiên đang hiển thị
+        self._fetch = self._count = self._key = None
+        self._format = None
+        self._cache_start = 0
+        self._cache = []             # các dòng liên tiếp bắt đầu từ _cache_start
+        self._iids = []              # các item Treeview đang dùng lại (không xóa/tạo lại)
+        self._shown = {}             # iid -> giá trị đang hiển thị (bỏ qua tree.item nếu không đổi)
+        self._descending = True
+
+        scrollbar.configure(command=self._on_scroll)
+        tree.bind("<Configure>", lambda e: self._render())
+        tree.bind("<MouseWheel>", self._on_wheel)
+        tree.bind("<Button-4>", lambda e: self.scroll(-3))
+        tree.bind("<Button-5>", lambda e: self.scroll(3))
+        tree.bind("<Prior>", lambda e: self.scroll(-self.visible_rows()))
+        tree.bind("<Next>", lambda e: self.scroll(self.visible_rows()))
+
+    # --- Nguồn dữ liệu ---
+    def set_source(self, fetch, count, key, format_row, descending=True):
+        """Đổi nguồn dữ liệu (vd: đổi tháng / danh mục) và về đầu danh sách."""
+        self._fetch, self._count, self._key, self._format = fetch, count, key, format_row
+        self._descending = descending
+        self.reload()
+
+    def set_offset_source(self, fetch_page, count, format_row):
+        """Nguồn không có khóa keyset: fetch_page(offset, limit) -> list dòng theo thứ tự hiển thị."""
+        src = _OffsetSource(fetch_page, count)
+        self.set_source(src.fetch, src.count, src.key, lambda i, item: format_row(i, item[1]),
+                        descending=False)
+
+    def set_rows(self, rows, format_row):
+        """Hiển thị một list có sẵn (ít dòng) qua cùng cơ chế."""
+        src = _ListSource(rows)
+        self.set_source(src.fetch, src.count, src.key, lambda i, item: format_row(i, item[1]),
+                        descending=False)
+
+    def reload(self):
+        """Đếm lại, xóa bộ đệm và cuộn về đầu."""
+        self.top = 0
+        self.refresh()
+
+    def refresh(self):
+        """Đếm lại và lấy lại dữ liệu nhưng giữ nguyên vị trí cuộn (sau khi dữ liệu thay đổi)."""
+        self.total = self._count() if self._count else 0
+        self._cache = []
+        self._cache_start = 0
+        self._render()
+
+    # --- Sửa tại chỗ theo thay đổi (không truy vấn lại) ---
+    def _precedes(self, a, b):
+        """Khóa a đứng trước khóa b trong thứ tự hiển thị."""
+        return a > b if self._descending else a < b
+
+    def _find(self, key):
+        for i, row in enumerate(self._cache):
+            if self._key(row) == key:
+                return i
+        return None
+
+    def insert_rows(self, rows):
+        """
+        Thêm các dòng mới (bên gọi đã biết chúng khớp bộ lọc hiện tại) vào đúng vị trí theo
+        khóa. Dòng rơi vào phía trên cửa sổ đang xem thì cửa sổ dịch theo, các dòng đang
+        nhìn thấy giữ nguyên chỗ; dòng nằm ngoài bộ đệm chỉ làm tăng tổng số dòng.
+        """
+        for row in rows:
+            k = self._key(row)
+            old_total, self.total = self.total, self.total + 1
+            if not self._cache:
+                continue
+            i = 0
+            while i < len(self._cache) and self._precedes(self._key(self._cache[i]), k):
+                i += 1
+            if i == 0 and self._cache_start > 0:
+                self._cache_start += 1   # nằm đâu đó phía trên bộ đệm
+                pos = self._cache_start - 1
+            elif i == len(self._cache) and self._cache_start + i < old_total:
+                continue                 # nằm phía dưới bộ đệm
+            else:
+                self._cache.insert(i, row)
+                pos = self._cache_start + i
+            if pos < self.top:
+                self.top += 1
+        self._render()
+
+    def update_rows(self, rows):
+        """Thay các dòng đang có trong bộ đệm có cùng khóa. Trả về số dòng đã thay."""
+        n = 0
+        for row in rows:
+            i = self._find(self._key(row))
+            if i is not None:
+                self._cache[i] = row
+                n += 1
+        if n:
+            self._render()
+        return n
+
+    def delete_keys(self, keys):
+        """Bỏ các dòng có khóa trong keys (bên gọi đã biết chúng thuộc danh sách hiện tại)."""
+        for k in keys:
+            self.total = max(0, self.total - 1)
+            i = self._find(k)
+            if i is not None:
+                del self._cache[i]
+                pos = self._cache_start + i
+            elif self._cache and self._precedes(k, self._key(self._cache[0])):
+                self._cache_start = max(0, self._cache_start - 1)
+                pos = self._cache_start
+            else:
+                continue
+            if pos < self.top:
+                self.top -= 1
+        self._render()
+
+    # --- Cuộn ---
+    def visible_rows(self):
+        h = self.tree.winfo_height()
+        if h <= 1:  # chưa hiển thị lên màn hình
+            return int(self.tree.cget("height"))
+        rowheight = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        return max(1, (h - HEADER_HEIGHT) // rowheight)
+
+    def scroll(self, rows):
+        self.top += rows
+        self._render()
+
+    def _on_scroll(self, *args):
+        n = self.visible_rows()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * self.total)
+        elif args[0] == "scroll":
+            step = int(args[1])
+            self.top += step * n if args[2] == "pages" else step
+        self._render()
+
+    def _on_wheel(self, event):
+        # Windows: delta = ±120 mỗi nấc; macOS: giá trị nhỏ
+        step = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        self.scroll(step * 3)
+
+    # --- Lấy dữ liệu cho cửa sổ [start, start + n) ---
+    def _ensure(self, start, n):
+        end = min(start + n, self.total)
+        cs, ce = self._cache_start, self._cache_start + len(self._cache)
+        if cs <= start and end <= ce:
+            return
+        page = n * (self.prefetch + 1)
+        if self._cache and cs <= start <= ce:
+            # Cuộn xuống sát phần đã có: lấy tiếp sau dòng cuối (keyset)
+            self._cache.extend(self._fetch(after=self._key(self._cache[-1]), limit=max(end - ce, page)))
+        elif self._cache and cs <= end <= ce:
+            # Cuộn lên: lấy các dòng ngay trước dòng đầu
+            rows = self._fetch(before=self._key(self._cache[0]), limit=max(cs - start, page))
+            self._cache[:0] = rows
+            self._cache_start -= len(rows)
+        else:
+            # Nhảy xa (kéo thanh cuộn): lấy theo offset, chừa đệm phía trên
+            off = max(0, start - n * self.prefetch)
+            self._cache = self._fetch(offset=off, limit=(start - off) + page)
+            self._cache_start = off
+
+        # Giới hạn bộ đệm quanh cửa sổ đang xem
+        lo = max(self._cache_start, start - n * self.prefetch)
+        hi = end + n * self.prefetch
+        self._cache = self._cache[lo - self._cache_start:hi - self._cache_start]
+        self._cache_start = lo
+
+    def _render(self):
+        n = self.visible_rows()
+        self.top = max(0, min(self.top, self.total - n))
+        rows = []
+        if self.total and self._fetch:
+            self._ensure(self.top, n)
+            i = self.top - self._cache_start
+            rows = self._cache[i:i + n]
+
+        while len(self._iids) < len(rows):
+            self._iids.append(self.tree.insert("", "end"))
+        while len(self._iids) > len(rows):
+            iid = self._iids.pop()
+            self._shown.pop(iid, None)
+            self.tree.delete(iid)
+        for pos, (iid, row) in enumerate(zip(self._iids, rows), start=self.top):
+            values = self._format(pos, row)
+            if self._shown.get(iid) != values:
+                self.tree.item(iid, values=values)
+                self._shown[iid] = values
+
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min(1.0, (self.top + n) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def row_for_item(self, iid):
+        """Dòng dữ liệu gốc ứng với một item đang hiển thị (vd: dòng được chọn)."""
+        i = self._iids.index(iid)
+        return self._cache[self.top - self._cache_start + i]
@@ -0,0 +1,206 @@
+import asyncio
+import importlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import database
+
+# Giao diện asyncio cho các hàm truy cập dữ liệu (chi_tieu, danh_muc, database, xuat_excel...)
+# để nhúng vào dịch vụ async. Mọi hàm gốc đều chặn (blocking), nên chúng chạy trên pool luồng:
+# - pool ĐỌC: nhiều luồng, mỗi luồng một kết nối riêng (database.get_conn theo luồng) đặt
+#   PRAGMA query_only — WAL cho phép các kết nối đọc song song cả khi đang ghi
+# - pool GHI: đúng một luồng, nên mọi lệnh ghi được xếp hàng tuần tự (không tranh khóa ghi)
+# Giới hạn số yêu cầu đang chờ mỗi pool (backpressure); hủy task asyncio thì tác vụ chưa chạy
+# bị bỏ, tác vụ đang chạy bị ngắt bằng Connection.interrupt().
+#
+#     async with AsyncLedger(readers=4) as db:
+#         await db.add_expense("15-11-2025", cid, "Cơm trưa", 45000, check_budget=False)
+#         rows = await db.get_expense_page(month="11-2025", limit=50)
+
+
+class Busy(Exception):
+    """Pool đã đủ số yêu cầu đang chờ và hết thời gian chờ chỗ trống (max_wait)."""
+
+
+class _Job:
+    __slots__ = ("cancelled", "conn")
+
+    def __init__(self):
+        self.cancelled = False
+        self.conn = None   # kết nối đang chạy tác vụ (để interrupt khi bị hủy)
+
+
+class _Pool:
+    """Một ThreadPoolExecutor + giới hạn số yêu cầu đang chờ/đang chạy."""
+
+    def __init__(self, name, workers, max_pending, query_only):
+        self.name = name
+        self.workers = workers
+        self.query_only = query_only
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        self._slots = asyncio.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._threads = set()      # các luồng đã chạy tác vụ (có kết nối cần đóng)
+        self.pending = 0           # số yêu cầu đang chờ + đang chạy
+        self.completed = 0
+        self.cancelled = 0
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            raise asyncio.CancelledError()
+        conn = database.get_conn()
+        if getattr(self._local, "conn", None) is not conn:
+            # Kết nối mới của luồng này (lần đầu, hoặc sau database.set_db_path)
+            if self.query_only:
+                conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            with self._lock:
+                self._threads.add(threading.get_ident())
+        with self._lock:
+            job.conn = conn
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError:
+            if job.cancelled:  # bị interrupt() vì task asyncio đã bị hủy
+                raise asyncio.CancelledError()
+            raise
+        finally:
+            with self._lock:
+                job.conn = None
+
+    async def call(self, fn, *args, max_wait=None, **kwargs):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max_wait)
+        except asyncio.TimeoutError:
+            raise Busy(f"Pool {self.name} đang đầy ({self.pending} yêu cầu)") from None
+        self.pending += 1
+        job = _Job()
+        try:
+            future = self._executor.submit(self._run, job, fn, args, kwargs)
+            try:
+                result = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                job.cancelled = True
+                if not future.cancel():
+                    with self._lock:
+                        if job.conn is not None:
+                            job.conn.interrupt()
+                self.cancelled += 1
+                raise
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def close(self):
+        """Chờ các tác vụ còn lại, đóng kết nối của từng luồng rồi dừng pool (chạy chặn)."""
+        n = len(self._threads)
+        if n:
+            # Mỗi luồng nhận đúng một tác vụ đóng kết nối: các tác vụ chờ nhau ở barrier
+            barrier = threading.Barrier(n)
+
+            def close_conn():
+                database.close_thread_conn()
+                try:
+                    barrier.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+
+            wait([self._executor.submit(close_conn) for _ in range(n)])
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _mirror(module, name, writer=False):
+    """Tạo phương thức async gọi module.name trên pool đọc (hoặc pool ghi)."""
+
+    async def method(self, *args, max_wait=None, **kwargs):
+        fn = getattr(importlib.import_module(module), name)
+        pool = self._writer if writer else self._readers
+        return await pool.call(fn, *args, max_wait=max_wait, **kwargs)
+
+    method.__name__ = method.__qualname__ = name
+    method.__doc__ = (f"Bản async của {module}.{name} (pool {'ghi' if writer else 'đọc'}). "
+                      f"max_wait: số giây tối đa chờ chỗ trống, quá thì báo Busy.")
+    return method
+
+
+class AsyncLedger:
+    """
+    readers: số luồng (= số kết nối) đọc song song; max_pending: số yêu cầu tối đa đang chờ
+    hoặc đang chạy trên mỗi pool, yêu cầu sau phải await tới khi có chỗ (hoặc Busy nếu quá
+    max_wait giây). Các phương thức giữ nguyên tên và tham số của hàm gốc.
+    Cảnh báo ngân sách của add_expense: nên gọi check_budget=False rồi tự xử lý danh sách
+    Alert trả về (notifier mặc định của ngan_sach chạy trên luồng ghi).
+    """
+
+    def __init__(self, readers=4, max_pending=64):
+        self._readers = _Pool("qlct-doc", readers, max_pending, query_only=True)
+        self._writer = _Pool("qlct-ghi", 1, max_pending, query_only=False)
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(loop.run_in_executor(None, self._readers.close),
+                             loop.run_in_executor(None, self._writer.close))
+
+    async def run_read(self, fn, *args, max_wait=None, **kwargs):
+        """Chạy một hàm đọc tùy ý (dùng database.get_conn()) trên pool đọc."""
+        return await self._readers.call(fn, *args, max_wait=max_wait, **kwargs)
+
+    async def run_write(self, fn, *args, max_wait=None, **kwargs):
+        """Chạy một hàm ghi tùy ý trên luồng ghi (tuần tự với các lệnh ghi khác)."""
+        return await self._writer.call(fn, *args, max_wait=max_wait, **kwargs)
+
+    def stats(self) -> dict:
+        return {pool.name: {"workers": pool.workers, "pending": pool.pending,
+                            "completed": pool.completed, "cancelled": pool.cancelled}
+                for pool in (self._readers, self._writer)}
+
+    # --- Ghi ---
+    add_expense = _mirror("chi_tieu", "add_expense", writer=True)
+    add_income = _mirror("database", "add_income", writer=True)
+    add_category = _mirror("danh_muc", "add_category", writer=True)
+    delete_category_by_name = _mirror("danh_muc", "delete_category_by_name", writer=True)
+    import_expenses = _mirror("nhap_lieu", "import_expenses", writer=True)
+    set_budget = _mirror("ngan_sach", "set_budget", writer=True)
+    remove_budget = _mirror("ngan_sach", "remove_budget", writer=True)
+
+    # --- Đọc: danh sách ---
+    get_all_expenses = _mirror("chi_tieu", "get_all_expenses")
+    get_expenses_by_month = _mirror("chi_tieu", "get_expenses_by_month")
+    get_expenses_by_category = _mirror("chi_tieu", "get_expenses_by_category")
+    get_expense_page = _mirror("chi_tieu", "get_expense_page")
+    search_expenses = _mirror("chi_tieu", "search_expenses")
+    get_all_incomes = _mirror("database", "get_all_incomes")
+    get_income_page = _mirror("database", "get_income_page")
+    get_all_categories = _mirror("danh_muc", "get_all_categories")
+    get_category_id_by_name = _mirror("danh_muc", "get_category_id_by_name")
+
+    # --- Đọc: tổng hợp ---
+    get_income_for_month = _mirror("database", "get_income_for_month")
+    count_incomes = _mirror("database", "count_incomes")
+    count_expenses = _mirror("chi_tieu", "count_expenses")
+    count_search_expenses = _mirror("chi_tieu", "count_search_expenses")
+    get_expense_by_category = _mirror("chi_tieu", "get_expense_by_category")
+    get_total_expense_by_month = _mirror("chi_tieu", "get_total_expense_by_month")
+    get_expense_summary_by_category_month = _mirror("chi_tieu", "get_expense_summary_by_category_month")
+    get_monthly_series = _mirror("chi_tieu", "get_monthly_series")
+    get_category_monthly_series = _mirror("chi_tieu", "get_category_monthly_series")
+    get_budget_status = _mirror("chi_tieu", "get_budget_status")
+    get_budgets = _mirror("ngan_sach", "get_budgets")
+
+    # --- Xuất file (chỉ đọc DB; openpyxl được nạp ở lần gọi đầu) ---
+    export_to_excel = _mirror("xuat_excel", "export_to_excel")
+    export_range_to_excel = _mirror("xuat_excel", "export_range_to_excel")
@@ -0,0 +1,11 @@
+"""
+Các script đo hiệu năng cho tầng dữ liệu (database, chi_tieu, danh_muc, xuat_excel).
+
+Chạy từ thư mục chương trình, ví dụ:
+    python -m benchmark.bench_ket_noi
+
+Mọi benchmark đều chạy trên file DB tạm, không đụng tới QL_Chi_Tieu.db.
+
+- tao_du_lieu: sinh sổ chi tiêu giả lập (10 nghìn - 10 triệu khoản) ra một file DB
+- chay_tat_ca: đo toàn bộ các hàm truy cập dữ liệu, ghi JSON và so sánh giữa các commit
+"""
@@ -0,0 +1,54 @@
+"""Hàm dùng chung cho các benchmark: DB tạm và đo thời gian."""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database
+
+
+@contextmanager
+def temp_db():
+    """Trỏ database sang một file DB tạm đã init_db(), trả về đường dẫn file."""
+    old_path = database.DB_PATH
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        database.set_db_path(path)
+        database.init_db()
+        try:
+            yield path
+        finally:
+            database.set_db_path(old_path)
+
+
+def time_calls(fn, n=1000, warmup=50):
+    """
+    Gọi fn() n lần (sau warmup lần chạy nóng máy), trả về dict thống kê (µs/lần):
+    mean, p50, p95, p99, max.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    perf = time.perf_counter
+    for _ in range(n):
+        t0 = perf()
+        fn()
+        samples.append((perf() - t0) * 1e6)
+    samples.sort()
+    return {
+        "n": n,
+        "mean_us": statistics.fmean(samples),
+        "p50_us": samples[n // 2],
+        "p95_us": samples[min(n - 1, int(n * 0.95))],
+        "p99_us": samples[min(n - 1, int(n * 0.99))],
+        "max_us": samples[-1],
+    }
+
+
+def print_table(title, results):
+    """In bảng kết quả {tên: dict thống kê} ra màn hình."""
+    print(f"\n== {title} ==")
+    print(f"{'thao tác':<42}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (µs)")
+    for name, r in results.items():
+        print(f"{name:<42}{r['mean_us']:>10.1f}{r['p50_us']:>10.1f}{r['p95_us']:>10.1f}{r['p99_us']:>10.1f}")
@@ -0,0 +1,120 @@
+"""
+Tải đồng thời qua bat_dong_bo.AsyncLedger: nhiều client asyncio cùng gửi truy vấn đọc
+(trang chi tiêu, đếm, tổng hợp tháng, chuỗi 12 tháng) trong lúc một client ghi thêm chi tiêu
+đều đặn, với số luồng đọc khác nhau. In thông lượng (truy vấn/giây) và độ trễ p50 / p95 / p99
+phía client (gồm cả thời gian chờ trong hàng đợi). Mặc định có thêm một dòng 'gọi thẳng,
+1 luồng' làm mốc so sánh.
+
+    python -m benchmark.bench_bat_dong_bo [--rows 200000] [--clients 32] [--readers 1,2,4,8] [--seconds 3]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import bat_dong_bo
+import chi_tieu
+import danh_muc
+import database
+from benchmark import tao_du_lieu
+from benchmark._chung import temp_db
+
+
+def _workload(month, category):
+    """Các truy vấn đọc mà một dịch vụ hay gọi: (tên hàm của AsyncLedger, args, kwargs)."""
+    year_ago = database.shift_month(month, -11)
+    return [
+        ("get_expense_page", (), {"month": month, "limit": 50}),
+        ("get_expense_page", (), {"category": category, "limit": 50, "offset": 500}),
+        ("count_expenses", (), {"month": month}),
+        ("get_expense_summary_by_category_month", (month,), {}),
+        ("get_monthly_series", (year_ago, month), {}),
+        ("get_income_for_month", (month,), {}),
+    ]
+
+
+def _summary(latencies, seconds):
+    latencies.sort()
+    n = len(latencies)
+    pick = lambda q: latencies[min(n - 1, int(n * q))] * 1000 if n else 0.0
+    return {"ops": n, "ops_s": n / seconds, "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+async def _run(readers, clients, seconds, work, write_every, cid, day):
+    latencies, writes = [], 0
+    async with bat_dong_bo.AsyncLedger(readers=readers, max_pending=clients * 2) as db:
+        stop = time.perf_counter() + seconds
+
+        async def reader(seed):
+            rnd = random.Random(seed)
+            while time.perf_counter() < stop:
+                name, args, kwargs = rnd.choice(work)
+                t0 = time.perf_counter()
+                await getattr(db, name)(*args, **kwargs)
+                latencies.append(time.perf_counter() - t0)
+
+        async def writer():
+            nonlocal writes
+            while time.perf_counter() < stop:
+                await db.add_expense(day, cid, "bench async", 10_000, check_budget=False)
+                writes += 1
+                await asyncio.sleep(write_every)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(writer(), *(reader(i) for i in range(clients)))
+        elapsed = time.perf_counter() - t0
+    result = _summary(latencies, elapsed)
+    result["writes"] = writes
+    return result
+
+
+def _direct(seconds, work):
+    """Mốc: gọi thẳng hàm đồng bộ trên một luồng, không qua asyncio."""
+    rnd = random.Random(0)
+    fns = {name: getattr(chi_tieu, name, None) or getattr(database, name) for name, _, _ in work}
+    latencies = []
+    stop = time.perf_counter() + seconds
+    t0 = time.perf_counter()
+    while time.perf_counter() < stop:
+        name, args, kwargs = rnd.choice(work)
+        t1 = time.perf_counter()
+        fns[name](*args, **kwargs)
+        latencies.append(time.perf_counter() - t1)
+    return _summary(latencies, time.perf_counter() - t0)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=200_000, help="số khoản chi trong DB giả lập")
+    ap.add_argument("--clients", type=int, default=32, help="số client đọc đồng thời")
+    ap.add_argument("--readers", default="1,2,4,8", help="các số luồng đọc cần đo")
+    ap.add_argument("--seconds", type=float, default=3.0, help="thời gian đo mỗi cấu hình")
+    ap.add_argument("--write-every", type=float, default=0.02, help="giây nghỉ giữa hai lần ghi")
+    args = ap.parse_args(argv)
+
+    with temp_db():
+        tao_du_lieu.generate(expenses=args.rows, years=3)
+        conn = database.get_conn()
+        mk = conn.execute("SELECT month_key FROM expense_month_totals GROUP BY month_key "
+                          "ORDER BY SUM(cnt) DESC LIMIT 1").fetchone()[0]
+        month = f"{mk % 100:02d}-{mk // 100}"
+        category = danh_muc.get_all_categories()[0]["name"]
+        cid = danh_muc.get_category_id_by_name(category)
+        work = _workload(month, category)
+
+        print(f"DB {args.rows:,} khoản, tháng {month}, {args.clients} client đọc + 1 client ghi, "
+              f"{os.cpu_count()} CPU")
+        print(f"{'cấu hình':<22}{'truy vấn/s':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'lần ghi':>9}")
+        r = _direct(args.seconds, work)
+        print(f"{'gọi thẳng, 1 luồng':<22}{r['ops_s']:>12,.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+              f"{r['p99_ms']:>9.2f}{'-':>9}")
+        for readers in (int(x) for x in args.readers.split(",")):
+            r = asyncio.run(_run(readers, args.clients, args.seconds, work, args.write_every,
+                                 cid, "15-" + month))
+            print(f"{f'async, {readers} luồng đọc':<22}{r['ops_s']:>12,.0f}{r['p50_ms']:>9.2f}"
+                  f"{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['writes']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Bộ nhớ khi duyệt toàn bộ sổ chi tiêu: bộ nhớ đỉnh của Python (tracemalloc) và thời gian
+khi đọc hết mọi khoản chi bằng
+- chi_tieu.get_all_expenses()        : fetchall, cả danh sách nằm trong RAM
+- chi_tieu.get_expense_page(...)     : lặp từng trang 500 dòng theo khóa (date_key, id)
+- chi_tieu.iter_expenses(batch_size) : một truy vấn, fetchmany từng đợt
+và danh_muc.get_all_categories() (list dict) so với danh_muc.iter_categories().
+Với iter_expenses, bộ nhớ đỉnh phải gần như không đổi khi số dòng tăng.
+
+    python -m benchmark.bench_duyet [--sizes 100000,1000000] [--batches 100,1000,10000]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+
+import chi_tieu
+import danh_muc
+from benchmark import tao_du_lieu
+from benchmark._chung import temp_db
+
+
+def all_rows():
+    return sum(r[3] for r in chi_tieu.get_all_expenses())
+
+
+def pages():
+    total, after = 0.0, None
+    while True:
+        rows = chi_tieu.get_expense_page(after=after, limit=500)
+        total += sum(r[4] for r in rows)
+        if len(rows) < 500:
+            return total
+        after = (rows[-1][1], rows[-1][0])
+
+
+def streamed(batch_size):
+    return lambda: sum(e.amount for e in chi_tieu.iter_expenses(batch_size=batch_size))
+
+
+def _measure(fn):
+    """(giây, MB đỉnh): lần chạy đo thời gian không bật tracemalloc (tracemalloc làm chậm nhiều lần)."""
+    t0 = time.perf_counter()
+    expected = fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    assert abs(fn() - expected) < 0.5
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 1e6
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100000,1000000", help="các cỡ sổ chi tiêu cần đo")
+    ap.add_argument("--batches", default="100,1000,10000", help="các batch_size của iter_expenses")
+    ap.add_argument("--categories", type=int, default=200, help="số danh mục (đo get_all_categories)")
+    args = ap.parse_args(argv)
+
+    print(f"{'số dòng':>10}  {'cách đọc':<34}{'giây':>8}{'dòng/s':>12}{'MB đỉnh':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        with temp_db():
+            tao_du_lieu.generate(expenses=size, years=5, categories=args.categories)
+            cases = {"get_all_expenses()": all_rows, "get_expense_page (500/trang)": pages}
+            for b in (int(b) for b in args.batches.split(",")):
+                cases[f"iter_expenses(batch_size={b})"] = streamed(b)
+            for label, fn in cases.items():
+                seconds, peak = _measure(fn)
+                print(f"{size:>10,}  {label:<34}{seconds:>8.2f}{size / seconds:>12,.0f}{peak:>10.2f}")
+            for label, fn in (("get_all_categories()", lambda: len(danh_muc.get_all_categories())),
+                              ("iter_categories()", lambda: sum(1 for _ in danh_muc.iter_categories()))):
+                seconds, peak = _measure(fn)
+                print(f"{size:>10,}  {label + f' x{args.categories}':<34}{seconds * 1e6:>6.0f}µs{'':>12}{peak * 1000:>8.1f}KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Thông lượng ghi: thêm N khoản chi bằng chi_tieu.add_expense theo các cách
+- tuần tự, mỗi khoản một commit (như giao diện hiện tại)
+- tuần tự trong MỘT database.transaction() (unit of work)
+- W luồng cùng ghi thẳng, mỗi khoản một commit (tranh nhau khóa ghi)
+- W luồng gửi qua hang_doi_ghi.WriteQueue (group commit), mỗi luồng chờ khoản của mình
+  được commit rồi mới gửi khoản tiếp theo
+với PRAGMA synchronous=NORMAL (mặc định của chương trình, WAL chỉ fsync lúc checkpoint) và
+FULL (fsync mỗi lần commit) để thấy phần chi phí commit.
+
+    python -m benchmark.bench_ghi [--rows 5000] [--writers 8] [--window-ms 0] [--synchronous NORMAL,FULL]
+"""
+import argparse
+import os
+import threading
+import time
+
+import chi_tieu
+import danh_muc
+import database
+import hang_doi_ghi
+from benchmark._chung import temp_db
+
+
+def _rows(n, cid):
+    return [(f"{1 + i % 28:02d}-{1 + i % 12:02d}-2025", cid, f"bench ghi {i}", 1000 + i) for i in range(n)]
+
+
+def sequential(rows):
+    for day, cid, desc, amount in rows:
+        chi_tieu.add_expense(day, cid, desc, amount, check_budget=False)
+    return len(rows)
+
+
+def one_transaction(rows):
+    with database.transaction():
+        for day, cid, desc, amount in rows:
+            chi_tieu.add_expense(day, cid, desc, amount, check_budget=False)
+    return 1
+
+
+def _threads(rows, writers, work):
+    parts = [rows[i::writers] for i in range(writers)]
+    threads = [threading.Thread(target=work, args=(part,)) for part in parts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def threads_direct(rows, writers):
+    def work(part):
+        sequential(part)
+        database.close_thread_conn()
+
+    _threads(rows, writers, work)
+    return len(rows)
+
+
+def threads_queue(rows, writers, window_ms):
+    writes = hang_doi_ghi.WriteQueue(window_ms=window_ms)
+
+    def work(part):
+        for day, cid, desc, amount in part:
+            writes.submit(chi_tieu.add_expense, day, cid, desc, amount, check_budget=False).result()
+
+    _threads(rows, writers, work)
+    writes.close()
+    return writes.stats()["batches"]
+
+
+def _run(label, fn, rows, sync):
+    count_before = database.get_conn().execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+    t0 = time.perf_counter()
+    commits = fn()
+    elapsed = time.perf_counter() - t0
+    added = database.get_conn().execute("SELECT COUNT(*) FROM expenses").fetchone()[0] - count_before
+    assert added == len(rows), (label, added)
+    print(f"{sync:<8}{label:<34}{len(rows) / elapsed:>12,.0f}{elapsed * 1e6 / len(rows):>12,.0f}{commits:>10,}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=5000, help="số khoản chi mỗi cách ghi")
+    ap.add_argument("--writers", type=int, default=8, help="số luồng cùng ghi")
+    ap.add_argument("--window-ms", type=float, default=0.0, help="cửa sổ gom nhóm của WriteQueue")
+    ap.add_argument("--synchronous", default="NORMAL,FULL", help="các chế độ PRAGMA synchronous cần đo")
+    args = ap.parse_args(argv)
+
+    default_pragmas = database.PRAGMAS
+    print(f"{args.rows:,} khoản mỗi cách, {args.writers} luồng ghi, {os.cpu_count()} CPU")
+    print(f"{'sync':<8}{'cách ghi':<34}{'khoản/s':>12}{'µs/khoản':>12}{'commit':>10}")
+    try:
+        for sync in args.synchronous.split(","):
+            database.PRAGMAS = tuple(p for p in default_pragmas if "synchronous" not in p) + (
+                f"PRAGMA synchronous={sync}",)
+            with temp_db():
+                danh_muc.add_category("Ăn uống")
+                cid = danh_muc.get_category_id_by_name("Ăn uống")
+                rows = _rows(args.rows, cid)
+                _run("tuần tự, mỗi khoản 1 commit", lambda: sequential(rows), rows, sync)
+                _run("tuần tự, 1 transaction()", lambda: one_transaction(rows), rows, sync)
+                _run(f"{args.writers} luồng ghi thẳng", lambda: threads_direct(rows, args.writers), rows, sync)
+                _run(f"{args.writers} luồng qua WriteQueue",
+                     lambda: threads_queue(rows, args.writers, args.window_ms), rows, sync)
+    finally:
+        database.PRAGMAS = default_pragmas
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+So sánh độ trễ mỗi thao tác giữa:
+- cách cũ: mở sqlite3.connect mới cho mỗi lần gọi (không PRAGMA, không cache câu lệnh)
+- cách mới: database.get_conn() dùng lại kết nối theo luồng
+
+    python -m benchmark.bench_ket_noi [-n 2000]
+"""
+import argparse
+import sqlite3
+
+import chi_tieu
+import danh_muc
+import database
+from benchmark._chung import print_table, temp_db, time_calls
+
+
+def _per_call_conn():
+    # Mô phỏng get_conn() cũ: mỗi lần gọi một kết nối mới
+    return sqlite3.connect(str(database.DB_PATH))
+
+
+def _seed(rows=2000):
+    conn = database.get_conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO expenses (date, category_id, description, amount, date_key) VALUES (?, ?, ?, ?, ?)",
+            [(f"{d:02d}-11-2025", d % 6 + 1, "seed", 1000.0, 20251100 + d)
+             for d in (i % 28 + 1 for i in range(rows))])
+    database.add_income("11-2025", 1e12)
+
+
+def _workload():
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    return {
+        "get_income_for_month": lambda: database.get_income_for_month("11-2025"),
+        "get_total_expense_by_month": lambda: chi_tieu.get_total_expense_by_month("11-2025"),
+        "get_expense_summary_by_category_month":
+            lambda: chi_tieu.get_expense_summary_by_category_month("11-2025"),
+        "get_category_id_by_name": lambda: danh_muc.get_category_id_by_name("Ăn uống"),
+        "add_expense": lambda: chi_tieu.add_expense("15-11-2025", cid, "bench", 1000),
+    }
+
+
+def _run(n, per_call):
+    # Mỗi chế độ chạy trên một DB tạm riêng có cùng dữ liệu mẫu.
+    with temp_db():
+        _seed()
+        patched = (database, chi_tieu, danh_muc)
+        originals = [m.get_conn for m in patched]
+        if per_call:
+            # Cách cũ: thay get_conn trong các module bằng hàm mở kết nối mới mỗi lần.
+            # Kết nối không đóng tường minh nhưng CPython giải phóng ngay khi hàm trả về.
+            for m in patched:
+                m.get_conn = _per_call_conn
+        try:
+            return {name: time_calls(fn, n) for name, fn in _workload().items()}
+        finally:
+            for m, orig in zip(patched, originals):
+                m.get_conn = orig
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("-n", type=int, default=2000, help="số lần gọi mỗi thao tác")
+    args = ap.parse_args(argv)
+    print_table("Mỗi lần gọi mở 1 kết nối (cách cũ)", _run(args.n, per_call=True))
+    print_table("Dùng lại kết nối theo luồng (database.get_conn)", _run(args.n, per_call=False))
+
+
+if __name__ == "__main__":
+    main()
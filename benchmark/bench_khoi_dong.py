@@ -0,0 +1,62 @@
+"""
+Đo thời gian khởi động (cold start) của lệnh dòng lệnh `python main.py summary`, so với
+`python -c pass`, và kiểm tra lệnh không nạp các module nặng (tkinter, openpyxl).
+Mục tiêu: summary dưới 100 ms.
+Trước khi đo, các file .py của chương trình được biên dịch sẵn (compileall): với
+PYTHONDONTWRITEBYTECODE=1 và file .pyc cũ, mỗi lần chạy phải biên dịch lại dong_lenh.py
+(~13 ms), số đo khi đó không phản ánh lần chạy thật.
+
+    python -m benchmark.bench_khoi_dong [--runs 20]
+"""
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark._chung import temp_db
+
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("tkinter", "openpyxl", "numpy")
+
+
+def wall_times(cmd, runs):
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=PROGRAM_DIR, stdout=subprocess.DEVNULL, check=True)
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def imported_modules(cmd):
+    """Tên các module được import khi chạy lệnh (qua -X importtime)."""
+    res = subprocess.run([cmd[0], "-X", "importtime"] + cmd[1:], cwd=PROGRAM_DIR,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    return {line.rsplit("|", 1)[-1].strip() for line in res.stderr.splitlines() if "|" in line}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args(argv)
+    compileall.compile_dir(PROGRAM_DIR, maxlevels=0, quiet=1)
+    with temp_db() as db_path:
+        cases = {
+            "python -c pass": [sys.executable, "-c", "pass"],
+            "main.py summary": [sys.executable, "main.py", "--db", db_path, "summary"],
+            "main.py list": [sys.executable, "main.py", "--db", db_path, "list"],
+        }
+        print(f"{'lệnh':<20}{'p50':>10}{'min':>10}{'max':>10}  (ms)")
+        for name, cmd in cases.items():
+            t = wall_times(cmd, args.runs)
+            print(f"{name:<20}{statistics.median(t):>10.1f}{min(t):>10.1f}{max(t):>10.1f}")
+        heavy = [m for m in imported_modules(cases["main.py summary"]) if m.split(".")[0] in HEAVY]
+        print("Module nặng được nạp khi chạy summary:", ", ".join(sorted(heavy)) or "không có")
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
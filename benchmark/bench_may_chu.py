@@ -0,0 +1,191 @@
+"""
+Tải HTTP cho máy chủ JSON (may_chu): nhiều client (mỗi client một luồng, một kết nối
+keep-alive) gửi liên tục các yêu cầu đọc hay gặp trong lúc một luồng ghi thêm chi tiêu đều
+đặn (làm bộ đệm bị xóa). In số yêu cầu/giây, độ trễ p50 / p99 và tỉ lệ 304 cho 3 cấu hình:
+không bộ đệm, có bộ đệm, có bộ đệm + client gửi If-None-Match. Cuối cùng đo một lần tải
+file Excel: lần đầu (dựng file) và lần sau (từ bộ đệm / 304).
+
+    python -m benchmark.bench_may_chu [--rows 100000] [--clients 16] [--workers 4] [--seconds 3]
+    python -m benchmark.bench_may_chu --url http://127.0.0.1:8765 --etag   # máy chủ đang chạy
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+import chi_tieu
+import danh_muc
+import database
+import may_chu
+from benchmark import tao_du_lieu
+from benchmark._chung import temp_db
+
+
+def _paths(month, category):
+    cat = quote(category)
+    return [
+        f"/api/summary?month={month}",
+        f"/api/categories?month={month}",
+        "/api/categories",
+        "/api/incomes",
+        f"/api/expenses?month={month}&limit=50",
+        f"/api/expenses?category={cat}&limit=50",
+        f"/api/expenses?month={month}&category={cat}&limit=100",
+    ]
+
+
+def _get(conn, path, etag=None):
+    conn.request("GET", path, headers={"If-None-Match": etag} if etag else {})
+    resp = conn.getresponse()
+    body = resp.read()
+    return resp.status, resp.getheader("ETag"), body
+
+
+def _load(host, port, paths, clients, seconds, use_etag):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def client(seed):
+        rnd = random.Random(seed)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        etags, mine, seen = {}, [], {}
+        while time.perf_counter() < stop:
+            path = rnd.choice(paths)
+            t0 = time.perf_counter()
+            status, etag, _ = _get(conn, path, etags.get(path) if use_etag else None)
+            mine.append(time.perf_counter() - t0)
+            seen[status] = seen.get(status, 0) + 1
+            if etag:
+                etags[path] = etag
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            for k, v in seen.items():
+                statuses[k] = statuses.get(k, 0) + v
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    n = len(latencies)
+    pick = lambda q: latencies[min(n - 1, int(n * q))] * 1000 if n else 0.0
+    return {"n": n, "req_s": n / elapsed, "p50_ms": pick(0.5), "p99_ms": pick(0.99),
+            "not_modified": statuses.get(304, 0) / n if n else 0.0,
+            "errors": n - statuses.get(200, 0) - statuses.get(304, 0)}
+
+
+def _writer(stop, every, cid, day):
+    """Ghi thêm chi tiêu đều đặn (kết nối riêng của luồng này) -> data_version đổi."""
+    writes = 0
+    while not stop.wait(every):
+        chi_tieu.add_expense(day, cid, "bench http", 10_000, check_budget=False)
+        writes += 1
+    database.close_thread_conn()
+    return writes
+
+
+def _print_row(label, r, extra=""):
+    print(f"{label:<24}{r['req_s']:>10,.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+          f"{r['not_modified']:>8.0%}{r['errors']:>7}{extra}")
+
+
+def _header():
+    print(f"{'cấu hình':<24}{'yêu cầu/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'304':>8}{'lỗi':>7}  bộ đệm")
+
+
+def _export_timing(host, port, month):
+    conn = http.client.HTTPConnection(host, port, timeout=300)
+    path = f"/api/export?month={month}"
+    out = []
+    etag = None
+    for label, tag in (("lần đầu (dựng file)", None), ("lần sau (bộ đệm)", None), ("If-None-Match", True)):
+        t0 = time.perf_counter()
+        status, etag2, body = _get(conn, path, etag if tag else None)
+        out.append((label, status, len(body), (time.perf_counter() - t0) * 1000))
+        etag = etag2 or etag
+    conn.close()
+    print(f"Tải Excel tháng {month}:")
+    for label, status, size, ms in out:
+        print(f"  {label:<22}{status:>5}{size:>12,} byte{ms:>10.1f} ms")
+
+
+def _remote(args):
+    url = urlsplit(args.url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    incomes = json.loads(_get(conn, "/api/incomes")[2])
+    cats = json.loads(_get(conn, "/api/categories")[2])
+    conn.close()
+    if not incomes or not cats:
+        print("Máy chủ chưa có dữ liệu thu nhập / chi tiêu.")
+        return 1
+    month, category = incomes[0]["month"], cats[0]["category"]
+    print(f"{args.url}, tháng {month}, {args.clients} client")
+    _header()
+    r = _load(url.hostname, url.port or 80, _paths(month, category), args.clients, args.seconds, args.etag)
+    _print_row("If-None-Match" if args.etag else "không gửi ETag", r)
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100_000, help="số khoản chi trong DB giả lập")
+    ap.add_argument("--clients", type=int, default=16, help="số client HTTP đồng thời")
+    ap.add_argument("--workers", type=int, default=4, help="số luồng đọc của máy chủ")
+    ap.add_argument("--seconds", type=float, default=3.0, help="thời gian đo mỗi cấu hình")
+    ap.add_argument("--write-every", type=float, default=0.5, help="giây giữa hai lần ghi (0 = không ghi)")
+    ap.add_argument("--url", help="đo máy chủ đang chạy ở địa chỉ này thay vì tự dựng DB tạm")
+    ap.add_argument("--etag", action="store_true", help="(với --url) gửi If-None-Match")
+    args = ap.parse_args(argv)
+    if args.url:
+        return _remote(args)
+
+    with temp_db():
+        tao_du_lieu.generate(expenses=args.rows, years=3)
+        conn = database.get_conn()
+        mk = conn.execute("SELECT month_key FROM expense_month_totals GROUP BY month_key "
+                          "ORDER BY SUM(cnt) DESC LIMIT 1").fetchone()[0]
+        month = f"{mk % 100:02d}-{mk // 100}"
+        category = danh_muc.get_all_categories()[0]["name"]
+        cid = danh_muc.get_category_id_by_name(category)
+        paths = _paths(month, category)
+
+        print(f"DB {args.rows:,} khoản, tháng {month}, {args.clients} client, {args.workers} luồng đọc, "
+              f"ghi mỗi {args.write_every}s, {os.cpu_count()} CPU")
+        _header()
+        for label, cache_bytes, use_etag in (("không bộ đệm", 0, False),
+                                             ("bộ đệm", 32 << 20, False),
+                                             ("bộ đệm + If-None-Match", 32 << 20, True)):
+            server = may_chu.LedgerServer("127.0.0.1", 0, workers=args.workers, cache_bytes=cache_bytes).start()
+            host, port = server.address
+            stop, result = threading.Event(), {}
+            writer = None
+            if args.write_every > 0:
+                writer = threading.Thread(target=lambda: result.setdefault(
+                    "writes", _writer(stop, args.write_every, cid, "15-" + month)))
+                writer.start()
+            r = _load(host, port, paths, args.clients, args.seconds, use_etag)
+            stop.set()
+            if writer:
+                writer.join()
+            c = server.cache.stats()
+            hit = c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0.0
+            _print_row(label, r, f"  trúng {hit:.0%}, xóa {c['invalidations']} lần, "
+                                 f"{result.get('writes', 0)} lần ghi")
+            if use_etag:
+                _export_timing(host, port, month)
+            server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
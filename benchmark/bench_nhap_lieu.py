@@ -0,0 +1,47 @@
+"""
+Đo tốc độ nhập hàng loạt (nhap_lieu.import_file) từ file CSV sinh ngẫu nhiên,
+và tốc độ nhập lại cùng file (toàn bộ dòng là trùng, bị bỏ qua).
+
+    python -m benchmark.bench_nhap_lieu [--rows 200000]
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+
+import nhap_lieu
+from benchmark._chung import temp_db
+
+CATEGORIES = ["Ăn uống", "Đi lại", "Giải trí", "Mua sắm", "Học tập", "Khác", "Nhà cửa", "Sức khỏe"]
+
+
+def write_csv(path, rows, seed=1):
+    rnd = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["Ngày", "Danh mục", "Mô tả", "Số tiền"])
+        for i in range(rows):
+            y = rnd.randint(2020, 2025)
+            m = rnd.randint(1, 12)
+            d = rnd.randint(1, 28)
+            w.writerow([f"{d:02d}-{m:02d}-{y}", rnd.choice(CATEGORIES),
+                        f"giao dịch {i}", rnd.randint(1, 500) * 1000])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, default=200000)
+    args = ap.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp, temp_db():
+        path = os.path.join(tmp, "sao_ke.csv")
+        write_csv(path, args.rows)
+        for label in ("Lần đầu", "Nhập lại (trùng)"):
+            s = nhap_lieu.import_file(path, check_budget=False)
+            print(f"{label:<18} {s['read']:>10,} dòng  {s['seconds']:>6.2f}s  "
+                  f"{s['read'] / s['seconds']:>10,.0f} dòng/s  "
+                  f"thêm {s['inserted']:,}, trùng {s['duplicates']:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Kiểm tra nhiều TIẾN TRÌNH cùng ghi một file DB (như giao diện + lệnh cron, hai cửa sổ
+chương trình): P tiến trình liên tục cộng thu nhập vào vài tháng chung (database.add_income)
+và thêm chi tiêu (chi_tieu.add_expense) trong --seconds giây. Mỗi tiến trình tự ghi lại
+những gì nó đã ghi thành công; cuối cùng so với DB:
+- thu nhập từng tháng phải bằng đúng tổng các lần cộng của mọi tiến trình (không mất
+  lần cộng nào), số khoản chi và tổng chi phải khớp, bảng tổng hợp tháng phải khớp
+- in thông lượng ghi duy trì (lần ghi/giây), độ trễ p50 / p99, số lần phải thử lại vì DB
+  đang bị khóa và số lần ghi thất bại
+Chế độ "cu" chạy lại cách cộng thu nhập trước đây (SELECT số cũ, cộng trên Python, rồi
+UPDATE) để so sánh: các lần cộng đồng thời ghi đè lên nhau, hai tiến trình cùng thêm một
+tháng mới thì một bên lỗi UNIQUE.
+
+    python -m benchmark.bench_nhieu_tien_trinh [--procs 4] [--seconds 5] [--months 3] [--modes upsert,cu]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chi_tieu
+import danh_muc
+import database
+import ngan_sach
+from benchmark._chung import temp_db
+
+
+def _old_add_income(month, amount):
+    """add_income trước khi dùng UPSERT: đọc - cộng trên Python - ghi (có thể mất lần cộng)."""
+    conn = database.get_conn()
+    row = conn.execute("SELECT amount FROM incomes WHERE month = ?", (month,)).fetchone()
+    with conn:
+        if row:
+            conn.execute("UPDATE incomes SET amount = ? WHERE month = ?", (float(row[0]) + amount, month))
+        else:
+            conn.execute("INSERT INTO incomes (month, amount, month_key) VALUES (?, ?, ?)",
+                         (month, float(amount), database.month_key(month)))
+
+
+def _worker(path, start_at, seconds, months, cid, mode, seed):
+    database.set_db_path(path)
+    ngan_sach.set_notifier(ngan_sach.NullNotifier())
+    add_income = _old_add_income if mode == "cu" else database.add_income
+    rnd = random.Random(seed)
+    added = dict.fromkeys(months, 0.0)
+    expenses, spent, errors, latencies = 0, 0.0, 0, []
+    time.sleep(max(0.0, start_at - time.time()))  # mọi tiến trình bắt đầu cùng lúc
+    stop = time.perf_counter() + seconds
+    while time.perf_counter() < stop:
+        month, amount = rnd.choice(months), rnd.randint(1, 1000) * 1000
+        t0 = time.perf_counter()
+        try:
+            if rnd.random() < 0.5:
+                add_income(month, amount)
+                added[month] += amount
+            else:
+                chi_tieu.add_expense(f"15-{month}", cid, "stress", amount, check_budget=False)
+                expenses += 1
+                spent += amount
+        except sqlite3.Error:  # DB bị khóa quá lâu; cách cũ: hai tiến trình cùng INSERT tháng mới
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+    database.close_all()
+    return {"added": added, "expenses": expenses, "spent": spent, "errors": errors,
+            "latencies": latencies, "retries": database.busy_retries}
+
+
+def run(mode, procs, seconds, months):
+    with temp_db() as path:
+        danh_muc.add_category("Ăn uống")
+        cid = danh_muc.get_category_id_by_name("Ăn uống")
+        database.close_all()
+        start_at = time.time() + 1.0 + 0.3 * procs  # chờ các tiến trình con khởi động xong
+        with ProcessPoolExecutor(procs, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_worker, path, start_at, seconds, months, cid, mode, i) for i in range(procs)]
+            results = [f.result() for f in futures]
+
+        expected = {m: sum(r["added"][m] for r in results) for m in months}
+        actual = dict(database.get_conn().execute("SELECT month, amount FROM incomes").fetchall())
+        lost = sum(expected[m] - actual.get(m, 0.0) for m in months)
+        count, total = database.get_conn().execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM expenses").fetchone()
+        exp_count = sum(r["expenses"] for r in results)
+        exp_total = sum(r["spent"] for r in results)
+        totals_ok = not chi_tieu.check_month_totals()
+
+    latencies = sorted(x for r in results for x in r["latencies"])
+    n = len(latencies)
+    pick = lambda q: latencies[min(n - 1, int(n * q))] * 1000 if n else 0.0
+    ok = abs(lost) < 0.5 and count == exp_count and abs(total - exp_total) < 0.5 and totals_ok
+    print(f"{mode:<8}{procs:>11}{n / seconds:>12,.0f}{pick(0.5):>9.2f}{pick(0.99):>9.2f}"
+          f"{sum(r['retries'] for r in results):>9}{sum(r['errors'] for r in results):>7}"
+          f"{lost:>16,.0f}  {'KHỚP' if ok else 'SAI LỆCH'}")
+    if count != exp_count or abs(total - exp_total) >= 0.5:
+        print(f"        chi tiêu: DB {count:,} khoản / {total:,.0f} - tiến trình báo {exp_count:,} / {exp_total:,.0f}")
+    if not totals_ok:
+        print("        bảng tổng hợp tháng không khớp dữ liệu chi tiêu")
+    return ok
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--procs", default="2,4", help="các số tiến trình cùng ghi cần đo")
+    ap.add_argument("--seconds", type=float, default=5.0, help="thời gian ghi của mỗi lần đo")
+    ap.add_argument("--months", type=int, default=3, help="số tháng chung mà các tiến trình cùng cộng thu nhập")
+    ap.add_argument("--modes", default="upsert,cu", help="upsert: add_income hiện tại; cu: cách đọc-cộng-ghi trước đây")
+    args = ap.parse_args(argv)
+
+    months = [f"{m:02d}-2025" for m in range(1, args.months + 1)]
+    print(f"{args.seconds:g}s mỗi lần đo, {len(months)} tháng chung, busy_timeout {database.BUSY_TIMEOUT_MS} ms, "
+          f"{os.cpu_count()} CPU")
+    print(f"{'chế độ':<8}{'tiến trình':>11}{'lần ghi/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'thử lại':>9}{'lỗi':>7}"
+          f"{'thu nhập mất':>16}  kiểm tra")
+    failed = 0
+    for mode in args.modes.split(","):
+        for procs in (int(p) for p in args.procs.split(",")):
+            ok = run(mode, procs, args.seconds, months)
+            failed += not ok and mode != "cu"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
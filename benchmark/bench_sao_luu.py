@@ -0,0 +1,103 @@
+"""
+Sao lưu khi chương trình đang chạy (sao_luu): trong lúc sao lưu, một luồng ghi thêm chi tiêu
+đều đặn (như người dùng nhập liệu) và một luồng "giao diện" thức dậy mỗi 10 ms. Đo cho mỗi
+cách sao lưu:
+- thời gian, tốc độ (MB/s), số lần SQLite chép lại từ đầu vì có ghi đồng thời
+- độ trễ lớn nhất / p99 của các lần ghi (ghi có bị chặn không)
+- độ trễ lớn nhất của luồng giao diện (có bị giữ GIL lâu không)
+- integrity_check của bản sao lưu và số khoản chi trong đó
+Các cách: chép một bước (pages=-1), chép theo đợt có nghỉ (mặc định), VACUUM INTO.
+
+    python -m benchmark.bench_sao_luu [--rows 300000] [--write-every 20] [--pages 256] [--pause-ms 5]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import chi_tieu
+import danh_muc
+import database
+import sao_luu
+from benchmark import tao_du_lieu
+from benchmark._chung import temp_db
+
+
+def _writer(stop, every, cid, latencies):
+    while not stop.wait(every):
+        t0 = time.perf_counter()
+        chi_tieu.add_expense("15-06-2025", cid, "bench sao lưu", 10_000, check_budget=False)
+        latencies.append(time.perf_counter() - t0)
+    database.close_thread_conn()
+
+
+def _ticker(stop, lateness, tick=0.010):
+    """Luồng 'giao diện': ngủ tick giây, ghi lại mỗi lần thức dậy trễ bao lâu."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        time.sleep(tick)
+        lateness.append(time.perf_counter() - t0 - tick)
+
+
+def _run(label, dest, cid, write_every, **options):
+    stop = threading.Event()
+    writes, lateness = [], []
+    threads = [threading.Thread(target=_writer, args=(stop, write_every, cid, writes)),
+               threading.Thread(target=_ticker, args=(stop, lateness))]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    try:
+        res = sao_luu.snapshot(dest, **options)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    conn = sqlite3.connect(res["files"][0])
+    rows = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+    conn.close()
+    writes.sort()
+    p99 = writes[min(len(writes) - 1, int(len(writes) * 0.99))] * 1000 if writes else 0.0
+    print(f"{label:<26}{res['seconds']:>8.2f}{res['mb_s']:>9.1f}{res['bytes'] / 1e6:>9.1f}{res['restarts']:>9}"
+          f"{len(writes):>7}{p99:>9.1f}{max(writes, default=0) * 1000:>9.1f}"
+          f"{max(lateness, default=0) * 1000:>10.1f}  {res['integrity']}, {rows:,} khoản")
+    return res
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=300_000, help="số khoản chi trong DB giả lập")
+    ap.add_argument("--write-every", type=float, default=20, help="ms giữa hai lần ghi trong lúc sao lưu")
+    ap.add_argument("--pages", type=int, default=sao_luu.PAGES_PER_STEP, help="số trang mỗi đợt")
+    ap.add_argument("--pause-ms", type=float, default=sao_luu.PAUSE_MS, help="nghỉ giữa hai đợt")
+    args = ap.parse_args(argv)
+
+    with temp_db() as path, tempfile.TemporaryDirectory() as dest:
+        tao_du_lieu.generate(expenses=args.rows, years=3)
+        cid = danh_muc.get_category_id_by_name("Ăn uống")
+        database.close_all()
+        print(f"DB {os.path.getsize(path) / 1e6:,.1f} MB ({args.rows:,} khoản), ghi mỗi {args.write_every:g} ms "
+              f"trong lúc sao lưu, {os.cpu_count()} CPU")
+        print(f"{'cách sao lưu':<26}{'giây':>8}{'MB/s':>9}{'MB':>9}{'chép lại':>9}{'ghi':>7}"
+              f"{'p99 ms':>9}{'max ms':>9}{'UI max ms':>10}  kiểm tra")
+        every = args.write_every / 1000
+        _run("một bước (pages=-1)", dest, cid, every, pages=-1, pause_ms=0)
+        _run(f"{args.pages} trang/đợt, nghỉ {args.pause_ms:g} ms", dest, cid, every,
+             pages=args.pages, pause_ms=args.pause_ms)
+        _run("VACUUM INTO", dest, cid, every, compact=True)
+
+        cancel = threading.Event()
+        threading.Timer(0.05, cancel.set).start()
+        try:
+            sao_luu.snapshot(dest, pages=args.pages, pause_ms=args.pause_ms, cancel=cancel)
+            print("Dừng giữa chừng: bản sao lưu đã xong trước khi kịp dừng")
+        except sao_luu.BackupCancelled:
+            print(f"Dừng giữa chừng: {len(os.listdir(dest))} thư mục còn lại (3 bản đã xong, không còn .tmp)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
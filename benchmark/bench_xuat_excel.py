@@ -0,0 +1,63 @@
+"""
+So sánh xuất Excel một tháng lớn giữa:
+- xuat_excel.export_to_excel (workbook thường, fetchall, duyệt lại từng ô để gán style)
+- xuat_excel.export_range_to_excel (write_only, fetchmany theo đợt, NamedStyle)
+Đo thời gian và bộ nhớ đỉnh (tracemalloc, chạy riêng vì tracemalloc làm chậm).
+
+    python -m benchmark.bench_xuat_excel [--rows 100000] [--skip-old]
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+import chi_tieu
+import database
+import xuat_excel
+from benchmark._chung import temp_db
+
+
+def seed_month(rows, month_key=202511):
+    conn = database.get_conn()
+    with conn:
+        conn.executemany(
+            "INSERT INTO expenses (date, category_id, description, amount, date_key) VALUES (?, ?, ?, ?, ?)",
+            ((f"{i % 28 + 1:02d}-{month_key % 100:02d}-{month_key // 100}", i % 6 + 1,
+              f"khoản chi số {i}", float(i % 500 * 1000), month_key * 100 + i % 28 + 1)
+             for i in range(rows)))
+    chi_tieu.rebuild_month_totals()
+    database.add_income(f"{month_key % 100:02d}-{month_key // 100}", 50_000_000)
+
+
+def measure(fn):
+    t0 = time.perf_counter()
+    path = fn()
+    seconds = time.perf_counter() - t0
+    os.remove(path)
+    tracemalloc.start()
+    path = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    os.remove(path)
+    return seconds, peak
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--rows", type=int, default=100000)
+    ap.add_argument("--skip-old", action="store_true", help="bỏ qua cách cũ (chậm, tốn RAM)")
+    args = ap.parse_args(argv)
+    with temp_db() as db_path:
+        seed_month(args.rows)
+        out = os.path.join(os.path.dirname(db_path), "out.xlsx")
+        cases = {"streaming (write_only)": lambda: xuat_excel.export_range_to_excel("11-2025", save_path=out)}
+        if not args.skip_old:
+            cases = {"cũ (export_to_excel)": lambda: xuat_excel.export_to_excel("11-2025"), **cases}
+        print(f"{'cách xuất':<26}{'dòng':>10}{'thời gian':>12}{'RAM đỉnh':>14}")
+        for name, fn in cases.items():
+            seconds, peak = measure(fn)
+            print(f"{name:<26}{args.rows:>10,}{seconds:>11.2f}s{peak / 2**20:>11.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
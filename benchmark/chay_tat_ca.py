@@ -0,0 +1,179 @@
+"""
+Đo mọi hàm truy cập dữ liệu chính (database, chi_tieu, danh_muc, phan_tich, xuat_excel) trên dữ liệu
+giả lập nhiều cỡ (benchmark.tao_du_lieu), ghi kết quả ra JSON để so sánh giữa các commit.
+- Mỗi hàm được chạy nóng máy, số lần lặp tự chọn theo thời gian một lần gọi (--budget giây)
+- Thống kê mean / p50 / p95 / p99 / max (µs) và bộ nhớ đỉnh của một lần gọi (tracemalloc)
+- --compare cu.json: in tỉ lệ p50 mới / cũ, trả mã lỗi 1 nếu có hàm chậm hơn --threshold
+
+    python -m benchmark.chay_tat_ca --sizes 10000,100000 --out ket_qua.json
+    python -m benchmark.chay_tat_ca --sizes 10000,100000 --compare ket_qua.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import chi_tieu
+import danh_muc
+import database
+import ngan_sach
+import phan_tich
+import xuat_excel
+from benchmark import tao_du_lieu
+from benchmark._chung import temp_db, time_calls
+
+
+def _busiest(conn):
+    """Tháng và danh mục nhiều khoản chi nhất (đại diện cho trường hợp nặng)."""
+    mk = conn.execute("SELECT month_key FROM expense_month_totals GROUP BY month_key "
+                      "ORDER BY SUM(cnt) DESC LIMIT 1").fetchone()[0]
+    cid = conn.execute("SELECT category_id FROM expense_month_totals GROUP BY category_id "
+                       "ORDER BY SUM(cnt) DESC LIMIT 1").fetchone()[0]
+    return f"{mk % 100:02d}-{mk // 100}", danh_muc.get_category_name_by_id(cid)
+
+
+def cases(month, category, out_dir):
+    """{tên: hàm không tham số} cho các thao tác cần đo."""
+    day = "15-" + month
+    year_ago = database.shift_month(month, -11)
+    cid = danh_muc.get_category_id_by_name(category)
+    xlsx = os.path.join(out_dir, "bench.xlsx")
+    phan_tich.reload()  # nạp sẵn dữ liệu dạng cột: chỉ đo phép tính, không đo lần đọc đầu
+    return {
+        "chi_tieu.add_expense": lambda: chi_tieu.add_expense(day, cid, "benchmark", 10_000),
+        "chi_tieu.get_all_expenses": chi_tieu.get_all_expenses,
+        "chi_tieu.iter_expenses": lambda: sum(e.amount for e in chi_tieu.iter_expenses()),
+        "chi_tieu.get_expense_by_category": chi_tieu.get_expense_by_category,
+        "chi_tieu.get_total_expense_by_month": lambda: chi_tieu.get_total_expense_by_month(month),
+        "chi_tieu.get_expense_summary_by_category_month":
+            lambda: chi_tieu.get_expense_summary_by_category_month(month),
+        "chi_tieu.get_expenses_by_month": lambda: chi_tieu.get_expenses_by_month(month),
+        "chi_tieu.get_expenses_by_category": lambda: chi_tieu.get_expenses_by_category(category),
+        "chi_tieu.get_expense_page": lambda: chi_tieu.get_expense_page(category=category, limit=50),
+        "chi_tieu.count_expenses": lambda: chi_tieu.count_expenses(month=month),
+        "chi_tieu.get_monthly_series": lambda: chi_tieu.get_monthly_series(year_ago, month),
+        "chi_tieu.get_category_monthly_series": lambda: chi_tieu.get_category_monthly_series(year_ago, month),
+        "chi_tieu.check_budget_alert_for_month": lambda: chi_tieu.check_budget_alert_for_month(month),
+        "phan_tich.totals_by": lambda: phan_tich.totals_by("month"),
+        "phan_tich.rolling_averages": phan_tich.rolling_averages,
+        "phan_tich.category_percentiles": phan_tich.category_percentiles,
+        "phan_tich.top_days": phan_tich.top_days,
+        "database.get_all_incomes": database.get_all_incomes,
+        "database.get_income_for_month": lambda: database.get_income_for_month(month),
+        "danh_muc.get_all_categories": danh_muc.get_all_categories,
+        "danh_muc.iter_categories": lambda: list(danh_muc.iter_categories()),
+        "danh_muc.get_category_id_by_name": lambda: danh_muc.get_category_id_by_name(category),
+        "xuat_excel.export_to_excel": lambda: os.remove(xuat_excel.export_to_excel(month)),
+        "xuat_excel.export_range_to_excel":
+            lambda: xuat_excel.export_range_to_excel(month, save_path=xlsx),
+    }
+
+
+def run_case(fn, budget, max_n, memory):
+    """Tự chọn số lần lặp để tổng thời gian đo xấp xỉ `budget` giây."""
+    t0 = time.perf_counter()
+    fn()
+    once = time.perf_counter() - t0
+    n = max(3, min(max_n, int(budget / max(once, 1e-6))))
+    stats = time_calls(fn, n=n, warmup=max(1, min(20, n // 10)))
+    if memory:
+        tracemalloc.start()
+        fn()
+        stats["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return stats
+
+
+def run_size(size, args):
+    results = {}
+    with temp_db() as path:
+        tao_du_lieu.generate(size, years=args.years, categories=args.categories, seed=args.seed)
+        month, category = _busiest(database.get_conn())
+        print(f"\n== {size:,} khoản chi (tháng {month}, danh mục '{category}') ==")
+        print(f"{'thao tác':<46}{'n':>6}{'p50':>12}{'p95':>12}{'p99':>12}{'RAM đỉnh':>12}")
+        todo = cases(month, category, os.path.dirname(path))
+        for name, fn in todo.items():
+            if args.only and not any(k in name for k in args.only):
+                continue
+            r = results[name] = run_case(fn, args.budget, args.max_n, not args.no_memory)
+            mem = f"{r['peak_kb']:>9.0f} KB" if "peak_kb" in r else ""
+            print(f"{name:<46}{r['n']:>6}{r['p50_us']:>10.0f}µs{r['p95_us']:>10.0f}µs"
+                  f"{r['p99_us']:>10.0f}µs{mem:>12}")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(database.__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(new, old, threshold):
+    """In tỉ lệ p50 mới/cũ; trả về số hàm chậm hơn ngưỡng."""
+    slower = 0
+    print(f"\n== So sánh với {old['meta'].get('commit')} (p50 mới / cũ) ==")
+    for size, funcs in new["results"].items():
+        for name, r in funcs.items():
+            ref = old["results"].get(size, {}).get(name)
+            if not ref:
+                continue
+            ratio = r["p50_us"] / ref["p50_us"] if ref["p50_us"] else float("inf")
+            flag = ""
+            if ratio > threshold:
+                flag, slower = "  <-- CHẬM HƠN", slower + 1
+            elif ratio < 1 / threshold:
+                flag = "  (nhanh hơn)"
+            print(f"{int(size):>10,} {name:<46}{ratio:>7.2f}x{flag}")
+    return slower
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000,100000", help="các cỡ dữ liệu, phân cách bằng dấu phẩy")
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--categories", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--budget", type=float, default=1.0, help="số giây đo cho mỗi hàm")
+    ap.add_argument("--max-n", type=int, default=1000, help="số lần lặp tối đa")
+    ap.add_argument("--only", action="append", help="chỉ đo hàm có tên chứa chuỗi này (lặp lại được)")
+    ap.add_argument("--no-memory", action="store_true", help="bỏ qua đo bộ nhớ (tracemalloc)")
+    ap.add_argument("--out", help="ghi kết quả ra file JSON")
+    ap.add_argument("--compare", help="file JSON của lần chạy trước để so sánh")
+    ap.add_argument("--threshold", type=float, default=1.25, help="tỉ lệ p50 bị coi là chậm hơn")
+    args = ap.parse_args(argv)
+
+    ngan_sach.set_notifier(ngan_sach.NullNotifier())  # không in cảnh báo trong lúc đo
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        report["results"][str(size)] = run_size(size, args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nĐã ghi {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            old = json.load(f)
+        return 1 if compare(report, old, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Sinh dữ liệu giả lập giống thật để đo hiệu năng: sổ chi tiêu từ 10 nghìn tới 10 triệu
+khoản, trải trên nhiều năm và nhiều danh mục, kèm thu nhập từng tháng.
+- Danh mục phổ biến xuất hiện nhiều hơn (phân bố kiểu Zipf), mỗi danh mục có mức tiền
+  điển hình riêng (phân phối log-normal, làm tròn nghìn đồng)
+- Cuối tuần và tháng Tết chi nhiều hơn; các khoản được ghi theo thứ tự ngày như sổ thật
+- Thu nhập mỗi tháng dao động quanh tổng chi, nên có tháng vượt ngưỡng cảnh báo
+
+    python -m benchmark.tao_du_lieu du_lieu_1tr.db --expenses 1000000 --years 5 --categories 20
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+import database
+
+# (tên, số tiền điển hình VND, các mô tả hay gặp)
+CATEGORY_PROFILES = [
+    ("Ăn uống", 45_000, ["Cơm trưa", "Cà phê sáng", "Bún bò", "Phở", "Trà sữa", "Đi chợ", "Ăn tối cùng bạn"]),
+    ("Đi lại", 30_000, ["Đổ xăng", "Grab", "Gửi xe", "Vé xe buýt", "Taxi sân bay", "Sửa xe"]),
+    ("Mua sắm", 250_000, ["Quần áo", "Giày dép", "Đồ gia dụng", "Mua online Shopee", "Siêu thị"]),
+    ("Giải trí", 150_000, ["Xem phim", "Karaoke", "Netflix", "Du lịch cuối tuần", "Mua sách"]),
+    ("Học tập", 300_000, ["Học phí", "Khóa học online", "Giáo trình", "Photo tài liệu"]),
+    ("Khác", 80_000, ["Quà tặng", "Từ thiện", "Phí ngân hàng", "Linh tinh"]),
+    ("Nhà cửa", 1_500_000, ["Tiền điện", "Tiền nước", "Internet", "Tiền nhà", "Sửa chữa"]),
+    ("Sức khỏe", 200_000, ["Khám bệnh", "Thuốc", "Phòng gym", "Bảo hiểm y tế"]),
+    ("Con cái", 350_000, ["Sữa", "Đồ chơi", "Học thêm", "Tã bỉm"]),
+    ("Hiếu hỉ", 500_000, ["Đám cưới", "Thăm người ốm", "Đám giỗ"]),
+]
+PLACES = ["", "", "", " - Quận 1", " - Cầu Giấy", " - Đà Nẵng", " - gần nhà", " - công ty"]
+BATCH_SIZE = 100_000
+
+
+def category_profiles(n):
+    """n danh mục: các danh mục có sẵn trước, sau đó 'Danh mục 11', 'Danh mục 12'..."""
+    profiles = list(CATEGORY_PROFILES[:n])
+    for i in range(len(profiles), n):
+        profiles.append((f"Danh mục {i + 1}", 100_000 * (1 + i % 7), [f"Khoản chi loại {i + 1}", "Chi khác"]))
+    return profiles
+
+
+def _day_weights(days):
+    """Trọng số mỗi ngày: cuối tuần x1.6, tháng 1-2 (Tết) x1.3."""
+    out = []
+    for d in days:
+        w = 1.6 if d.weekday() >= 5 else 1.0
+        if d.month in (1, 2):
+            w *= 1.3
+        out.append(w)
+    return out
+
+
+def generate(expenses=100_000, years=3, categories=10, end_year=None, seed=1,
+             batch_size=BATCH_SIZE, progress=None):
+    """
+    Ghi `expenses` khoản chi ngẫu nhiên (có seed nên lặp lại được) vào DB hiện tại
+    (database.DB_PATH), kèm thu nhập cho mọi tháng. Trả về dict thống kê.
+    progress(số dòng đã ghi, tổng) được gọi sau mỗi lô.
+    """
+    t0 = time.perf_counter()
+    rnd = random.Random(seed)
+    end_year = end_year or date.today().year
+    start = date(end_year - years + 1, 1, 1)
+    days = [start + timedelta(i) for i in range((date(end_year, 12, 31) - start).days + 1)]
+    day_cum = list(_accumulate(_day_weights(days)))
+    day_info = [(d.strftime("%d-%m-%Y"), d.year * 10000 + d.month * 100 + d.day) for d in days]
+
+    profiles = category_profiles(categories)
+    conn = database.get_conn()
+    cur = conn.cursor()
+    cur.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)", [(p[0],) for p in profiles])
+    cat_ids = dict(cur.execute("SELECT name, id FROM categories").fetchall())
+    cats = [(cat_ids[name], typical, descs) for name, typical, descs in profiles]
+    cat_cum = list(_accumulate(1 / (i + 1) for i in range(len(cats))))  # Zipf
+
+    sql = "INSERT INTO expenses (date, category_id, description, amount, date_key) VALUES (?, ?, ?, ?, ?)"
+    trigger, fts_trigger = "trg_expenses_totals_ins", "trg_expenses_fts_ins"
+    lognorm = rnd.lognormvariate
+    done = 0
+    with conn:
+        # Như nhap_lieu: bỏ trigger từng dòng, tính lại bảng tổng hợp và nạp index FTS một lần ở cuối
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute(f"DROP TRIGGER IF EXISTS {fts_trigger}")
+        max_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+        while done < expenses:
+            n = min(batch_size, expenses - done)
+            day_idx = sorted(rnd.choices(range(len(days)), cum_weights=day_cum, k=n))
+            picks = rnd.choices(cats, cum_weights=cat_cum, k=n)
+            rows = []
+            for di, (cid, typical, descs) in zip(day_idx, picks):
+                date_str, key = day_info[di]
+                amount = max(1000, round(typical * lognorm(0, 0.6), -3))
+                rows.append((date_str, cid, rnd.choice(descs) + rnd.choice(PLACES), float(amount), key))
+            cur.executemany(sql, rows)
+            done += n
+            if progress:
+                progress(done, expenses)
+        cur.execute("DELETE FROM expense_month_totals")
+        cur.execute(database.FILL_MONTH_TOTALS_SQL)
+        cur.execute(database.FILL_FTS_SQL + " WHERE id > ?", (max_id,))
+        cur.execute(database.MONTH_TOTALS_TRIGGERS[trigger])
+        cur.execute(database.FTS_TRIGGERS[fts_trigger])
+
+        # Thu nhập: quanh tổng chi của tháng (từ 0.95 tới 1.6 lần)
+        cur.execute("SELECT month_key, SUM(total) FROM expense_month_totals GROUP BY month_key")
+        incomes = [(f"{mk % 100:02d}-{mk // 100}", round(total * rnd.uniform(0.95, 1.6), -3), mk)
+                   for mk, total in cur.fetchall()]
+        cur.executemany("INSERT OR REPLACE INTO incomes (month, amount, month_key) VALUES (?, ?, ?)", incomes)
+
+    import danh_muc
+    danh_muc.invalidate_cache()
+    return {"expenses": expenses, "months": len(incomes), "categories": len(cats),
+            "first_day": days[0].isoformat(), "last_day": days[-1].isoformat(),
+            "seconds": time.perf_counter() - t0}
+
+
+def _accumulate(weights):
+    total = 0.0
+    for w in weights:
+        total += w
+        yield total
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("db", help="file DB sẽ tạo (không được trùng file đã có, trừ khi dùng --append)")
+    ap.add_argument("--expenses", type=int, default=100_000, help="số khoản chi (10 nghìn - 10 triệu)")
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--categories", type=int, default=10)
+    ap.add_argument("--end-year", type=int, help="năm cuối (mặc định: năm nay)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--append", action="store_true", help="ghi thêm vào file DB đã có")
+    args = ap.parse_args(argv)
+
+    if os.path.exists(args.db) and not args.append:
+        print(f"{args.db} đã tồn tại (dùng --append để ghi thêm).", file=sys.stderr)
+        return 1
+    database.set_db_path(args.db)
+    database.init_db()
+
+    def show(done, total):
+        print(f"\r  {done:,}/{total:,} khoản chi", end="", flush=True)
+
+    s = generate(args.expenses, years=args.years, categories=args.categories,
+                 end_year=args.end_year, seed=args.seed, progress=show)
+    print(f"\nĐã sinh {s['expenses']:,} khoản chi, {s['months']} tháng thu nhập, {s['categories']} danh mục "
+          f"({s['first_day']} -> {s['last_day']}) trong {s['seconds']:.1f}s")
+    database.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
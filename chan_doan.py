@@ -0,0 +1,368 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import database
+
+# Chẩn đoán truy cập SQLite (tùy chọn, mặc định TẮT):
+# - Khi bật, database.get_conn() trả về kết nối được bọc: mỗi câu lệnh đi qua execute /
+#   executemany được đếm số lần gọi, thời gian (histogram), số dòng trả về; thời gian đọc
+#   dòng (fetch) được cộng vào lần chạy đó. sqlite3 set_trace_callback đếm số câu SQLite
+#   thực sự chạy cho mỗi lần gọi (lớn hơn 1 = có trigger chạy kèm) và các câu BEGIN / COMMIT
+#   mà module sqlite3 tự phát ra (không đi qua execute nên lớp bọc không thấy).
+# - Lần chạy chậm hơn SLOW_MS được ghi vào nhật ký câu chậm kèm tham số; EXPLAIN QUERY PLAN
+#   được lấy khi xem báo cáo (không chạy thêm SQL trên đường nóng), đánh dấu quét toàn bảng.
+# - action(tên): đếm số câu lệnh và số kết nối mở trong một thao tác (vd: một lần bấm nút).
+# Bật bằng biến môi trường QLCT_PROFILE=1, cờ --profile của dòng lệnh hoặc bảng chẩn đoán
+# ẩn trong giao diện (Ctrl+Shift+D). Khi tắt, get_conn() trả về kết nối gốc như cũ.
+
+ENV_VAR = "QLCT_PROFILE"
+ENV_SLOW_MS = "QLCT_SLOW_MS"
+SLOW_MS = 50.0
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)   # cận trên các ô histogram (ms)
+SLOW_LOG_SIZE = 100
+ACTION_LOG_SIZE = 200
+
+_lock = threading.Lock()
+_local = threading.local()
+_enabled = False
+_stats = {}                              # câu lệnh -> _StatementStats
+_implicit = {}                           # BEGIN / COMMIT / ROLLBACK (kể cả do sqlite3 tự phát) -> số lần
+_slow = deque(maxlen=SLOW_LOG_SIZE)      # dict: sql, params, ms, rows, thread, at
+_actions = deque(maxlen=ACTION_LOG_SIZE) # dict: name, ms, statements, connections
+_plans = {}                              # sql -> list dòng EXPLAIN QUERY PLAN
+
+
+def _normalize(sql):
+    return " ".join(sql.split())
+
+
+class _StatementStats:
+    __slots__ = ("calls", "total_ms", "max_ms", "rows", "traced", "hist")
+
+    def __init__(self):
+        self.calls = 0
+        self.traced = 0       # số câu SQLite đã chạy (gồm câu trong trigger)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.hist = [0] * (len(BUCKETS_MS) + 1)
+
+    def percentile_ms(self, q):
+        """Phân vị ước lượng từ histogram (cận trên của ô chứa phân vị)."""
+        target = q / 100 * self.calls
+        seen = 0
+        for i, n in enumerate(self.hist):
+            seen += n
+            if n and seen >= target:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+
+def _record(sql, params, ms, rows, traced):
+    key = _normalize(sql)
+    bucket = len(BUCKETS_MS)
+    for i, limit in enumerate(BUCKETS_MS):
+        if ms <= limit:
+            bucket = i
+            break
+    with _lock:
+        st = _stats.get(key)
+        if st is None:
+            st = _stats[key] = _StatementStats()
+        st.calls += 1
+        st.total_ms += ms
+        st.max_ms = max(st.max_ms, ms)
+        st.rows += rows
+        st.traced += traced
+        st.hist[bucket] += 1
+        if ms >= SLOW_MS:
+            _slow.append({"sql": key, "params": params, "ms": ms, "rows": rows,
+                          "thread": threading.current_thread().name, "at": time.time()})
+    _local.statements = getattr(_local, "statements", 0) + 1
+
+
+class _Run:
+    """Một lần execute: thời gian = execute + các lần fetch cho tới khi đọc hết / chạy câu khác."""
+    __slots__ = ("sql", "params", "ms", "rows", "traced")
+
+    def __init__(self, sql, params):
+        self.sql, self.params, self.ms, self.rows = sql, params, 0.0, 0
+        self.traced = getattr(_local, "traced", 0)   # mốc bộ đếm của _trace, sau execute = số câu đã chạy
+
+
+class ProfiledCursor:
+    """Bọc sqlite3.Cursor: đo execute / fetch, thuộc tính khác chuyển thẳng cho cursor gốc."""
+
+    def __init__(self, cursor):
+        self._cur = cursor
+        self._run = None
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def _finish(self):
+        run, self._run = self._run, None
+        if run is not None:
+            _record(run.sql, run.params, run.ms, run.rows, run.traced)
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            if self._run is not None:
+                self._run.ms += (time.perf_counter() - t0) * 1000
+
+    def execute(self, sql, params=()):
+        self._finish()
+        self._run = _Run(sql, params)
+        self._timed(self._cur.execute, sql, params)
+        self._run.traced = getattr(_local, "traced", 0) - self._run.traced
+        if self._cur.description is None:  # INSERT / UPDATE / DDL: không có dòng để đọc
+            self._run.rows = max(self._cur.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq):
+        self._finish()
+        self._run = _Run(sql, "(executemany)")
+        self._timed(self._cur.executemany, sql, seq)
+        self._run.traced = getattr(_local, "traced", 0) - self._run.traced
+        self._run.rows = max(self._cur.rowcount, 0)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._cur.fetchone)
+        if self._run is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._run.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(self._cur.fetchmany, self._cur.arraysize if size is None else size)
+        if self._run is not None:
+            self._run.rows += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(self._cur.fetchall)
+        if self._run is not None:
+            self._run.rows += len(rows)
+            self._finish()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            row = self._timed(self._cur.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._run is not None:
+            self._run.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        self._cur.close()
+
+    def __del__(self):
+        # Cursor bị bỏ khi chưa đọc hết (vd: chỉ fetchone một dòng) -> ghi nhận lần chạy đó
+        self._finish()
+
+
+class ProfiledConnection:
+    """Bọc sqlite3.Connection (không đổi hành vi): execute / cursor trả về ProfiledCursor."""
+
+    def __init__(self, conn):
+        self.raw = conn
+        conn.set_trace_callback(_trace)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self):
+        return ProfiledCursor(self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def __enter__(self):
+        self.raw.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self.raw.__exit__(*exc)
+
+
+_TRANSACTION_RE = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK)\b", re.IGNORECASE)
+
+
+def _trace(sql):
+    # Được gọi cho MỌI câu SQLite chạy trên kết nối (cả câu trong trigger, BEGIN/COMMIT ngầm)
+    _local.traced = getattr(_local, "traced", 0) + 1
+    m = _TRANSACTION_RE.match(sql)
+    if m:
+        with _lock:
+            word = m.group(1).upper()
+            _implicit[word] = _implicit.get(word, 0) + 1
+
+
+# --- Bật / tắt ---
+def enable(slow_ms=None):
+    """Bật đo: các lần get_conn() sau đó trả về kết nối được bọc."""
+    global _enabled, SLOW_MS
+    if slow_ms is not None:
+        SLOW_MS = float(slow_ms)
+    _enabled = True
+    database.set_connection_wrapper(ProfiledConnection)
+
+
+def disable():
+    """Tắt đo (số liệu đã thu vẫn giữ, xem reset())."""
+    global _enabled
+    _enabled = False
+    database.set_connection_wrapper(None)
+    for conn in database.open_connections():
+        try:
+            conn.set_trace_callback(None)
+        except Exception:
+            pass
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable_from_env():
+    """Bật nếu biến môi trường QLCT_PROFILE khác rỗng / khác 0; QLCT_SLOW_MS đổi ngưỡng câu chậm."""
+    value = os.environ.get(ENV_VAR, "")
+    if value and value != "0":
+        enable(os.environ.get(ENV_SLOW_MS) or None)
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _implicit.clear()
+        _slow.clear()
+        _actions.clear()
+        _plans.clear()
+
+
+@contextmanager
+def action(name):
+    """
+    Đo một thao tác (trên luồng hiện tại): thời gian, số câu lệnh, số kết nối SQLite mở mới.
+    Không làm gì khi đang tắt đo.
+    """
+    if not _enabled:
+        yield
+        return
+    t0 = time.perf_counter()
+    statements = getattr(_local, "statements", 0)
+    opened = database.thread_connections_opened()
+    try:
+        yield
+    finally:
+        entry = {"name": name, "ms": (time.perf_counter() - t0) * 1000,
+                 "statements": getattr(_local, "statements", 0) - statements,
+                 "connections": database.thread_connections_opened() - opened}
+        with _lock:
+            _actions.append(entry)
+
+
+# --- Báo cáo ---
+def query_plan(sql, params=()):
+    """Các dòng EXPLAIN QUERY PLAN (chỉ lập kế hoạch, không chạy câu lệnh)."""
+    cached = _plans.get(sql)
+    if cached is not None:
+        return cached
+    if not isinstance(params, (tuple, list, dict)):
+        params = ()
+    try:
+        conn = database.get_conn()
+        raw = getattr(conn, "raw", conn)  # không tự đo chính câu EXPLAIN
+        plan = [row[3] for row in raw.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+    except Exception as e:
+        plan = [f"(không lấy được kế hoạch: {e})"]
+    _plans[sql] = plan
+    return plan
+
+
+def is_full_scan(plan) -> bool:
+    """Có bước quét toàn bảng ("SCAN bảng" không dùng index) trong kế hoạch không."""
+    return any(line.startswith("SCAN ") and " USING " not in line and "VIRTUAL TABLE" not in line
+               for line in plan)
+
+
+def snapshot(top=20):
+    """Số liệu dạng dict (cho JSON / giao diện): statements, slow, transactions, actions."""
+    with _lock:
+        stats = sorted(_stats.items(), key=lambda kv: -kv[1].total_ms)[:top]
+        slow = list(_slow)
+        implicit = dict(_implicit)
+        actions = list(_actions)
+    statements = [{"sql": sql, "calls": st.calls, "total_ms": st.total_ms,
+                   "mean_ms": st.total_ms / st.calls, "p95_ms": st.percentile_ms(95),
+                   "max_ms": st.max_ms, "rows": st.rows, "sqlite_per_call": st.traced / st.calls,
+                   "histogram": dict(zip([f"<={b}ms" for b in BUCKETS_MS] + ["lâu hơn"], st.hist))}
+                  for sql, st in stats]
+    seen = {}
+    for entry in slow:
+        if entry["sql"] not in seen:
+            plan = query_plan(entry["sql"], entry["params"])
+            seen[entry["sql"]] = {"plan": plan, "full_scan": is_full_scan(plan)}
+    slow = [dict(e, **seen[e["sql"]]) for e in slow]
+    return {"enabled": _enabled, "slow_ms": SLOW_MS, "statements": statements, "slow": slow,
+            "transactions": implicit, "actions": actions,
+            "connections_opened": database.connections_opened}
+
+
+def _short(sql, width=90):
+    return sql if len(sql) <= width else sql[:width - 3] + "..."
+
+
+def report(top=15) -> str:
+    """Báo cáo dạng chữ: câu lệnh tốn thời gian nhất, câu chậm (kèm kế hoạch), giao dịch, thao tác."""
+    snap = snapshot(top)
+    lines = [f"Chẩn đoán SQLite: {'ĐANG BẬT' if snap['enabled'] else 'đang tắt'} | "
+             f"ngưỡng câu chậm {snap['slow_ms']:.0f} ms | kết nối đã mở: {snap['connections_opened']}", ""]
+    # SQLite/lần > 1: mỗi lần gọi kéo theo câu lệnh trong trigger
+    lines.append(f"{'lần gọi':>8}{'tổng ms':>10}{'TB ms':>9}{'p95 ms':>9}{'max ms':>9}{'số dòng':>10}"
+                 f"{'SQLite/lần':>11}  câu lệnh")
+    for st in snap["statements"]:
+        lines.append(f"{st['calls']:>8,}{st['total_ms']:>10.1f}{st['mean_ms']:>9.2f}{st['p95_ms']:>9.1f}"
+                     f"{st['max_ms']:>9.1f}{st['rows']:>10,}{st['sqlite_per_call']:>11.1f}  {_short(st['sql'])}")
+    if snap["slow"]:
+        lines += ["", f"Câu chậm (>= {snap['slow_ms']:.0f} ms), mới nhất cuối:"]
+        shown = set()
+        for e in snap["slow"]:
+            flag = "  ⚠ QUÉT TOÀN BẢNG" if e["full_scan"] else ""
+            lines.append(f"  {e['ms']:>8.1f} ms {e['rows']:>8,} dòng [{e['thread']}] {_short(e['sql'])}{flag}")
+            if e["sql"] not in shown:
+                shown.add(e["sql"])
+                lines += [f"      {step}" for step in e["plan"]]
+    if snap["transactions"]:
+        lines += ["", "Giao dịch (kể cả BEGIN / COMMIT ngầm của sqlite3): " +
+                  ", ".join(f"{k} x{v:,}" for k, v in sorted(snap["transactions"].items()))]
+    if snap["actions"]:
+        lines += ["", f"{'thao tác':<24}{'ms':>10}{'câu lệnh':>10}{'kết nối mở':>12}"]
+        for a in snap["actions"][-20:]:
+            lines.append(f"{_short(a['name'], 24):<24}{a['ms']:>10.1f}{a['statements']:>10,}{a['connections']:>12,}")
+    return "\n".join(lines)
@@ -1,108 +1,516 @@
-from database import get_conn, get_income_for_month
+from database import get_conn, get_income_for_month, month_range, month_key, fold_text, FILL_MONTH_TOTALS_SQL, transaction, content_hash, nth_hash
+from collections import namedtuple
 from datetime import datetime
-from tkinter import messagebox
+import re
+import danh_muc
+import luu_tru
 
 # Các hàm quản lý chi tiêu (expenses): thêm, xóa, sửa, thống kê, cảnh báo.
 
-def add_expense(date_str: str, category_id: int, description: str, amount: float):
+# Một dòng chi tiêu khi duyệt bằng iter_expenses: namedtuple (không có __dict__ riêng, nặng
+# như một tuple), cùng thứ tự cột với các dòng của get_expense_page.
+Expense = namedtuple("Expense", "id date_key category description amount date")
+
+# Câu SELECT một nhánh (một bảng expenses + một điều kiện) cho danh sách chi tiêu
+_EXPENSE_ROWS_SQL = """
+                SELECT e.id AS id, e.date_key AS date_key, COALESCE(c.name,'Khác'), e.description, e.amount, e.date
+                FROM {table} e LEFT JOIN categories c ON e.category_id = c.id
+                WHERE {cond}"""
+
+def add_expense(date_str: str, category_id: int, description: str, amount: float,
+                check_budget: bool = True):
     """
     Thêm một khoản chi tiêu mới.
     - Kiểm tra định dạng ngày DD-MM-YYYY
     - Lưu dữ liệu vào DB
-    - Sau khi thêm, tự động kiểm tra cảnh báo vượt 90% thu nhập tháng đó.
+    - Sau khi thêm, cộng khoản chi vào tổng đang chạy của ngan_sach và so với hạn mức
+      (O(1), không chạy lại truy vấn tổng). check_budget=False: không gửi cảnh báo cho
+      notifier, vd khi gọi từ luồng nền — giao diện tự hiển thị danh sách trả về.
+    Trả về danh sách ngan_sach.Alert (rỗng nếu không vượt hạn mức).
     """
     try:
         dt = datetime.strptime(date_str, "%d-%m-%Y")
     except Exception:
         raise ValueError("Định dạng ngày phải là DD-MM-YYYY")
 
-    conn = get_conn()
-    try:
+    # Ngày đã chuẩn hóa DD-MM-YYYY và khóa số YYYYMMDD để lọc theo index
+    row = {"date": dt.strftime("%d-%m-%Y"), "date_key": dt.year * 10000 + dt.month * 100 + dt.day,
+           "category_id": category_id, "description": description or "", "amount": float(amount)}
+    before = get_conn().total_changes  # mốc để ngan_sach biết không có thay đổi nào khác xen vào
+    # transaction(): commit khi thành công, rollback khi lỗi; bên trong một
+    # database.transaction() khác thì chỉ là SAVEPOINT, commit chung với cả nhóm
+    with transaction() as conn:
         cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO expenses (date, category_id, description, amount) VALUES (?, ?, ?, ?)",
-            (date_str, category_id, description or "", float(amount))
-        )
-        conn.commit()
-    finally:
-        conn.close()
+        # import_hash như khi nhập từ file: nhập lại file xuat_excel có khoản này sẽ bỏ qua nó.
+        # Ghi thẳng với mã của lần xuất hiện đầu tiên, index UNIQUE tự kiểm tra trùng (không
+        # SELECT trước); chỉ khi đã có khoản cùng nội dung mới thử mã của lần thứ 2, 3...
+        base = h = content_hash(row["date_key"], category_id, row["description"], row["amount"])
+        n = 1
+        while True:
+            cur.execute(
+                "INSERT INTO expenses (date, category_id, description, amount, date_key, import_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (import_hash) WHERE import_hash IS NOT NULL DO NOTHING",
+                (row["date"], category_id, row["description"], row["amount"], row["date_key"], h)
+            )
+            if cur.rowcount:
+                break
+            n += 1
+            h = nth_hash(base, n)
+        row["id"] = cur.lastrowid
 
-    month = dt.strftime("%m-%Y")
-    check_budget_alert_for_month(month)
+    # Đã commit (hoặc giữ tới khi giao dịch ngoài commit): báo đúng dòng vừa thêm (xem su_kien).
+    # su_kien / ngan_sach chỉ nạp khi ghi: các lệnh chỉ đọc (summary, list) khởi động nhanh hơn
+    import ngan_sach
+    import su_kien
+    row["category"] = danh_muc.get_category_name_by_id(category_id) or "Khác"
+    su_kien.publish(su_kien.EXPENSES, su_kien.INSERT, [row])
+
+    return ngan_sach.record_expense(dt.year * 100 + dt.month, category_id, row["amount"],
+                                    since=before, notify=check_budget)
 
 def get_all_expenses():
     """Trả về danh sách tất cả chi tiêu (id, danh mục, mô tả, số tiền, ngày)."""
-    conn = get_conn()
+    cur = get_conn().cursor()
+    # date_key = YYYYMMDD nên sắp xếp theo index: năm -> tháng -> ngày -> id
+    cur.execute(f"""
+        SELECT e.id, COALESCE(c.name, 'Khác') as category, e.description, e.amount, e.date
+        FROM {luu_tru.expenses_from()} e LEFT JOIN categories c ON e.category_id = c.id
+        ORDER BY e.date_key DESC, e.id DESC
+    """)
+    return cur.fetchall()
+
+def _month_key_or_none(month: str):
+    # Tháng sai định dạng -> None (so sánh với NULL không ra dòng nào, như hành vi cũ)
     try:
-        cur = conn.cursor()
-        # Sử dụng substr để sắp xếp theo năm -> tháng -> ngày -> id
-        cur.execute("""
-            SELECT e.id, COALESCE(c.name, 'Khác') as category, e.description, e.amount, e.date
-            FROM expenses e LEFT JOIN categories c ON e.category_id = c.id
-            ORDER BY substr(e.date,7,4) DESC, substr(e.date,4,2) DESC, substr(e.date,1,2) DESC, e.id DESC
-        """)
-        rows = cur.fetchall()
-        return [(r[0], r[1], r[2], r[3], r[4]) for r in rows]
-    finally:
-        conn.close()
+        return month_key(month)
+    except (ValueError, AttributeError):
+        return None
 
 def get_expense_by_category():
-    """Tổng hợp chi tiêu theo từng danh mục."""
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT COALESCE(c.name,'Khác') AS category, SUM(e.amount) AS total
-            FROM expenses e
-            LEFT JOIN categories c ON e.category_id = c.id
-            GROUP BY category
-            ORDER BY total DESC
-        """)
-        return cur.fetchall()
-    finally:
-        conn.close()
+    """Tổng hợp chi tiêu theo từng danh mục (đọc từ bảng tổng hợp tháng x danh mục)."""
+    cur = get_conn().cursor()
+    cur.execute("""
+        SELECT COALESCE(c.name,'Khác') AS category, SUM(s.total) AS total
+        FROM expense_month_totals s
+        LEFT JOIN categories c ON s.category_id = c.id
+        GROUP BY category
+        ORDER BY total DESC
+    """)
+    return cur.fetchall()
 
 def get_total_expense_by_month(month: str) -> float:
     """Tính tổng chi của một tháng (MM-YYYY)."""
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(amount) FROM expenses WHERE substr(date,4,7) = ?", (month,))
-        row = cur.fetchone()
-        return float(row[0]) if row and row[0] is not None else 0.0
-    finally:
-        conn.close()
+    cur = get_conn().cursor()
+    cur.execute("SELECT SUM(total) FROM expense_month_totals WHERE month_key = ?", (_month_key_or_none(month),))
+    row = cur.fetchone()
+    return float(row[0]) if row and row[0] is not None else 0.0
 
 def get_expense_summary_by_category_month(month: str):
     """Tổng hợp chi theo danh mục trong một tháng."""
-    conn = get_conn()
+    cur = get_conn().cursor()
+    cur.execute("""
+        SELECT COALESCE(c.name,'Khác') AS category, SUM(s.total) AS total
+        FROM expense_month_totals s
+        LEFT JOIN categories c ON s.category_id = c.id
+        WHERE s.month_key = ?
+        GROUP BY category
+        ORDER BY total DESC
+    """, (_month_key_or_none(month),))
+    return cur.fetchall()
+
+def get_expenses_by_month(month: str):
+    """Danh sách chi tiêu trong một tháng (danh mục, mô tả, số tiền, ngày), mới nhất trước."""
+    lo, hi = month_range(month)
+    cur = get_conn().cursor()
+    cur.execute(f"""
+        SELECT COALESCE(c.name,'Khác') AS category, e.description, e.amount, e.date
+        FROM {luu_tru.expenses_from(lo, hi)} e LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.date_key BETWEEN ? AND ?
+        ORDER BY e.date_key DESC, e.id DESC
+    """, (lo, hi))
+    return cur.fetchall()
+
+def get_expenses_by_category(name: str):
+    """
+    Danh sách chi tiêu của một danh mục (danh mục, mô tả, số tiền, ngày), mới nhất trước.
+    Lọc theo category_id để dùng index (category_id, date_key);
+    'Khác' gồm cả các khoản không gắn danh mục.
+    """
+    cid = danh_muc.get_category_id_by_name(name)
+    if cid is None and name != "Khác":
+        return []
+    where = "e.category_id = ?"
+    if name == "Khác":
+        where = "(e.category_id = ? OR e.category_id IS NULL)"
+    cur = get_conn().cursor()
+    cur.execute(f"""
+        SELECT COALESCE(c.name,'Khác'), e.description, e.amount, e.date
+        FROM {luu_tru.expenses_from()} e LEFT JOIN categories c ON e.category_id = c.id
+        WHERE {where}
+        ORDER BY e.date_key DESC, e.id DESC
+    """, (cid,))
+    return cur.fetchall()
+
+def _expense_filters(month=None, category=None):
+    """
+    Điều kiện lọc cho danh sách chi tiêu, dạng list các nhánh (điều kiện, tham số).
+    'Khác' gồm 2 nhánh (category_id của 'Khác' và category_id IS NULL) được ghép bằng
+    UNION ALL để mỗi nhánh vẫn đọc theo đúng thứ tự của index (category_id, date_key).
+    List rỗng = không có dòng nào khớp.
+    """
+    arms = []
+    if category:
+        cid = danh_muc.get_category_id_by_name(category)
+        if cid is not None:
+            arms.append(("e.category_id = ?", [cid]))
+        if category == "Khác":
+            arms.append(("e.category_id IS NULL", []))
+    else:
+        arms.append(("1", []))
+    if month:
+        arms = [(f"{cond} AND e.date_key BETWEEN ? AND ?", params + list(month_range(month)))
+                for cond, params in arms]
+    return arms
+
+def get_expense_page(month=None, category=None, after=None, before=None, offset=0, limit=50):
+    """
+    Lấy một trang chi tiêu (mới nhất trước), lọc theo tháng và/hoặc tên danh mục.
+    Phân trang theo khóa (date_key, id) — keyset pagination:
+    - after=(date_key, id): các dòng ngay SAU dòng đó (cuộn xuống)
+    - before=(date_key, id): các dòng ngay TRƯỚC dòng đó (cuộn lên)
+    - không có khóa: bỏ qua offset dòng đầu (dùng khi nhảy thẳng tới vị trí bất kỳ)
+    Mỗi dòng: (id, date_key, danh mục, mô tả, số tiền, ngày).
+    Năm đã lưu trữ (luu_tru) là thêm các nhánh UNION ALL trên file của năm đó; chỉ các năm
+    nằm trong khoảng tháng / trước-sau khóa mốc mới được mở.
+    """
+    arms = _expense_filters(month, category)
+    if not arms:
+        return []
+    lo, hi = month_range(month) if month else (None, None)
+    if after is not None:
+        hi = after[0] if hi is None else min(hi, after[0])
+    elif before is not None:
+        lo = before[0] if lo is None else max(lo, before[0])
+    tables = luu_tru.expense_tables(lo, hi)
+    desc = before is None
+    selects, params = [], []
+    for table in tables:
+        for cond, arm_params in arms:
+            if after is not None:
+                cond += " AND (e.date_key, e.id) < (?, ?)"
+                arm_params = arm_params + list(after)
+            elif before is not None:
+                cond += " AND (e.date_key, e.id) > (?, ?)"
+                arm_params = arm_params + list(before)
+            selects.append(_EXPENSE_ROWS_SQL.format(table=table, cond=cond))
+            params += arm_params
+    order = "DESC" if desc else "ASC"
+    sql = " UNION ALL ".join(selects) + f" ORDER BY date_key {order}, id {order} LIMIT ? OFFSET ?"
+    cur = get_conn().cursor()
+    cur.execute(sql, params + [limit, offset if after is None and before is None else 0])
+    rows = cur.fetchall()
+    if not desc:
+        rows.reverse()
+    return rows
+
+def iter_expenses(month=None, category=None, batch_size=1000):
+    """
+    Duyệt chi tiêu (mới nhất trước) theo cùng bộ lọc với get_expense_page, mỗi dòng là một
+    Expense. Chỉ MỘT câu truy vấn, đọc dần từ cursor mỗi lần batch_size dòng (fetchmany) nên
+    bộ nhớ không tăng theo số dòng trong bảng — dùng cho liệt kê / xuất toàn bộ sổ thay cho
+    get_all_expenses (dựng cả danh sách) hay gọi get_expense_page nhiều lần.
+    - Kết nối của luồng giữ một transaction đọc tới khi duyệt hết (hoặc generator bị đóng):
+      các dòng là một snapshot nhất quán, ghi của kết nối khác không bị chặn (WAL).
+    - Chỉ duyệt trên luồng đã gọi hàm (cursor thuộc kết nối của luồng đó).
+    """
+    arms = _expense_filters(month, category)
+    if not arms:
+        return
+    lo, hi = month_range(month) if month else (None, None)
+    selects, params = [], []
+    for table in luu_tru.expense_tables(lo, hi):
+        for cond, arm_params in arms:
+            selects.append(_EXPENSE_ROWS_SQL.format(table=table, cond=cond))
+            params += arm_params
+    cur = get_conn().cursor()
+    cur.execute(" UNION ALL ".join(selects) + " ORDER BY date_key DESC, id DESC", params)
+    make = Expense._make
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT COALESCE(c.name,'Khác') AS category, SUM(e.amount) AS total
-            FROM expenses e
-            LEFT JOIN categories c ON e.category_id = c.id
-            WHERE substr(e.date,4,7) = ?
-            GROUP BY category
-            ORDER BY total DESC
-        """, (month,))
-        return cur.fetchall()
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from map(make, rows)
     finally:
-        conn.close()
+        cur.close()
 
-def check_budget_alert_for_month(month: str):
+def count_expenses(month=None, category=None):
+    """
+    Số khoản chi và tổng tiền theo bộ lọc (tháng / tên danh mục), đọc từ bảng
+    tổng hợp expense_month_totals nên không phải đếm từng dòng chi tiêu.
+    """
+    where, params = [], []
+    if category:
+        ids = []
+        cid = danh_muc.get_category_id_by_name(category)
+        if cid is not None:
+            ids.append(cid)
+        if category == "Khác":
+            ids.append(0)
+        if not ids:
+            return 0, 0.0
+        where.append(f"category_id IN ({','.join('?' * len(ids))})")
+        params += ids
+    if month:
+        where.append("month_key = ?")
+        params.append(_month_key_or_none(month))
+    sql = "SELECT SUM(cnt), SUM(total) FROM expense_month_totals"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    cur = get_conn().cursor()
+    cur.execute(sql, params)
+    cnt, total = cur.fetchone()
+    return int(cnt or 0), float(total or 0)
+
+def _fts_query(query: str):
+    """
+    Đổi chuỗi người dùng gõ thành biểu thức MATCH của FTS5: mỗi từ đặt trong ngoặc kép
+    (không bị hiểu nhầm thành toán tử AND/OR/NEAR), mọi từ đều phải có mặt, từ cuối so
+    khớp tiền tố để gõ tới đâu tìm tới đó. Không có từ nào -> None.
+    """
+    words = re.findall(r"\w+", fold_text(query or ""))
+    if not words:
+        return None
+    return " ".join(f'"{w}"' for w in words) + "*"
+
+def _search_where(query, months=None, category=None):
+    """
+    Điều kiện WHERE + tham số cho tìm kiếm; None nếu chắc chắn không có kết quả.
+    Tháng sai định dạng -> ValueError.
+    """
+    match = _fts_query(query)
+    if match is None:
+        return None
+    where, params = ["expenses_fts MATCH ?"], [match]
+    if months:
+        start, end = (months, months) if isinstance(months, str) else months
+        lo, hi = _month_bounds(start, end)  # tháng sai -> ValueError, không tìm trên khoảng mở
+        where.append("e.date_key BETWEEN ? AND ?")
+        params += [lo * 100 + 1, hi * 100 + 31]
+    if category:
+        cid = danh_muc.get_category_id_by_name(category)
+        if category == "Khác":
+            where.append("(e.category_id = ? OR e.category_id IS NULL)")
+        elif cid is None:
+            return None
+        else:
+            where.append("e.category_id = ?")
+        params.append(cid)
+    return " AND ".join(where), params
+
+# bm25 chỉ tính cho chừng này kết quả mới nhất: với từ khóa rất phổ biến (hàng trăm nghìn
+# dòng) xếp hạng toàn bộ tốn hàng trăm ms, trong khi người dùng chỉ xem vài trang đầu
+SEARCH_RANK_WINDOW = 2000
+
+def search_expenses(query: str, month_range=None, category=None, offset=0, limit=50, months=None):
+    """
+    Tìm chi tiêu theo mô tả (FTS5, không phân biệt hoa thường và dấu: "ca phe" khớp "Cà phê",
+    "do xang" khớp "Đổ xăng"). Lọc thêm theo tháng MM-YYYY hoặc khoảng (tháng đầu, tháng cuối)
+    (month_range, hoặc months= — cùng một tham số) và theo tên danh mục; tháng sai định dạng
+    -> ValueError. SEARCH_RANK_WINDOW kết quả mới nhất được xếp theo độ liên quan
+    (bm25; cùng điểm thì mới nhất trước), các kết quả cũ hơn nối tiếp theo thứ tự mới nhập trước.
+    Mỗi dòng: (id, date_key, danh mục, mô tả, số tiền, ngày) — giống get_expense_page.
+    Chỉ tìm trong DB chính: index expenses_fts không có dòng của các năm đã lưu trữ (luu_tru),
+    nên khoản chi thuộc năm đã lưu trữ không bao giờ nằm trong kết quả.
+    """
+    found = _search_where(query, month_range or months, category)
+    if found is None:
+        return []
+    where, params = found
+    window = SEARCH_RANK_WINDOW
+    cur = get_conn().cursor()
+    rows = []
+    # CROSS JOIN: bắt SQLite duyệt FTS trước rồi mới tra expenses theo id (nếu không, với
+    # bộ lọc danh mục nó có thể duyệt expenses theo index và chạy MATCH cho từng dòng)
+    if offset < window:
+        cur.execute(f"""
+            WITH hits AS (
+                SELECT f.rowid AS id, f.rank AS score
+                FROM expenses_fts f CROSS JOIN expenses e ON e.id = f.rowid
+                WHERE {where}
+                ORDER BY f.rowid DESC
+                LIMIT ?
+            )
+            SELECT e.id, e.date_key, COALESCE(c.name,'Khác'), e.description, e.amount, e.date
+            FROM hits h
+            JOIN expenses e ON e.id = h.id
+            LEFT JOIN categories c ON e.category_id = c.id
+            ORDER BY h.score, e.date_key DESC, e.id DESC
+            LIMIT ? OFFSET ?
+        """, params + [window, min(limit, window - offset), offset])
+        rows = cur.fetchall()
+    if len(rows) < limit and offset + len(rows) >= window:
+        # Hết cửa sổ xếp hạng: lấy tiếp các kết quả cũ hơn dòng cuối cùng của cửa sổ
+        cur.execute(f"""
+            SELECT f.rowid FROM expenses_fts f CROSS JOIN expenses e ON e.id = f.rowid
+            WHERE {where} ORDER BY f.rowid DESC LIMIT 1 OFFSET ?
+        """, params + [window - 1])
+        edge = cur.fetchone()
+        if edge:
+            cur.execute(f"""
+                SELECT e.id, e.date_key, COALESCE(c.name,'Khác'), e.description, e.amount, e.date
+                FROM expenses_fts f
+                CROSS JOIN expenses e ON e.id = f.rowid
+                LEFT JOIN categories c ON e.category_id = c.id
+                WHERE {where} AND f.rowid < ?
+                ORDER BY f.rowid DESC
+                LIMIT ? OFFSET ?
+            """, params + [edge[0], limit - len(rows), max(0, offset - window)])
+            rows += cur.fetchall()
+    return rows
+
+def count_search_expenses(query: str, month_range=None, category=None, months=None):
+    """Số kết quả và tổng tiền của search_expenses với cùng bộ lọc (cũng chỉ trong DB chính)."""
+    found = _search_where(query, month_range or months, category)
+    if found is None:
+        return 0, 0.0
+    where, params = found
+    cur = get_conn().cursor()
+    cur.execute(f"""
+        SELECT COUNT(*), SUM(e.amount)
+        FROM expenses_fts f CROSS JOIN expenses e ON e.id = f.rowid
+        WHERE {where}
+    """, params)
+    cnt, total = cur.fetchone()
+    return int(cnt or 0), float(total or 0)
+
+# --- Chuỗi thời gian: mỗi hàm tính cả khoảng tháng trong MỘT truy vấn gộp nhóm, thay vì
+# gọi get_income_for_month / get_total_expense_by_month cho từng tháng (2N truy vấn) ---
+
+# Sinh mọi tháng YYYYMM trong [?, ?] để tháng không có thu/chi vẫn có dòng (giá trị 0)
+_MONTHS_CTE = """
+WITH RECURSIVE months(mk) AS (
+    SELECT ?
+    UNION ALL
+    SELECT CASE WHEN mk % 100 = 12 THEN (mk / 100 + 1) * 100 + 1 ELSE mk + 1 END
+    FROM months WHERE mk < ?
+)"""
+
+def _month_bounds(start_month: str, end_month: str = None):
+    """(month_key đầu, month_key cuối) của khoảng tháng; đảo lại nếu nhập ngược. Sai định dạng -> ValueError."""
+    try:
+        lo = month_key(start_month)
+        hi = month_key(end_month or start_month)
+    except (ValueError, AttributeError):
+        raise ValueError("Định dạng tháng phải là MM-YYYY")
+    return (lo, hi) if lo <= hi else (hi, lo)
+
+def get_monthly_series(start_month: str, end_month: str = None, carry_over: bool = False):
+    """
+    Thu nhập, chi tiêu, số dư từng tháng trong khoảng [start_month, end_month] (MM-YYYY).
+    Mỗi dòng: (tháng MM-YYYY, thu nhập, chi tiêu, số khoản chi, số dư, số dư lũy kế),
+    cũ nhất trước, đủ mọi tháng. Số dư lũy kế dùng window function SUM() OVER;
+    carry_over=True: cộng thêm số dư của mọi tháng trước start_month.
+    """
+    lo, hi = _month_bounds(start_month, end_month)
+    cur = get_conn().cursor()
+    cur.execute(_MONTHS_CTE + """,
+    inc AS (SELECT month_key, SUM(amount) AS amount FROM incomes
+            WHERE month_key BETWEEN ? AND ? GROUP BY month_key),
+    spent AS (SELECT month_key, SUM(total) AS total, SUM(cnt) AS cnt FROM expense_month_totals
+              WHERE month_key BETWEEN ? AND ? GROUP BY month_key),
+    opening AS (SELECT CASE WHEN ? THEN
+                    (SELECT COALESCE(SUM(amount), 0) FROM incomes WHERE month_key < ?)
+                  - (SELECT COALESCE(SUM(total), 0) FROM expense_month_totals WHERE month_key < ?)
+                ELSE 0 END AS amount)
+    SELECT printf('%02d-%d', m.mk % 100, m.mk / 100),
+           COALESCE(i.amount, 0), COALESCE(s.total, 0), COALESCE(s.cnt, 0),
+           COALESCE(i.amount, 0) - COALESCE(s.total, 0),
+           o.amount + SUM(COALESCE(i.amount, 0) - COALESCE(s.total, 0))
+                      OVER (ORDER BY m.mk ROWS UNBOUNDED PRECEDING)
+    FROM months m CROSS JOIN opening o
+    LEFT JOIN inc i ON i.month_key = m.mk
+    LEFT JOIN spent s ON s.month_key = m.mk
+    ORDER BY m.mk
+    """, (lo, hi, lo, hi, lo, hi, bool(carry_over), lo, lo))
+    return [(r[0], float(r[1]), float(r[2]), int(r[3]), float(r[4]), float(r[5])) for r in cur.fetchall()]
+
+def get_category_monthly_series(start_month: str, end_month: str = None, category: str = None):
+    """
+    Chi tiêu theo (danh mục, tháng) trong khoảng, đọc từ bảng tổng hợp bằng một truy vấn.
+    Mỗi dòng: (danh mục, tháng MM-YYYY, tổng chi, số khoản, chênh lệch so với tháng trước
+    của cùng danh mục — None ở tháng đầu, tính bằng LAG() OVER).
+    Mọi danh mục có chi trong khoảng (hoặc chỉ `category`) đều có đủ các tháng, sắp theo
+    danh mục rồi tháng.
+    """
+    lo, hi = _month_bounds(start_month, end_month)
+    where, params = "", []
+    if category:
+        where, params = "WHERE category = ?", [category]
+    cur = get_conn().cursor()
+    cur.execute(_MONTHS_CTE + f""",
+    cells AS (SELECT COALESCE(c.name, 'Khác') AS category, s.month_key,
+                     SUM(s.total) AS total, SUM(s.cnt) AS cnt
+              FROM expense_month_totals s LEFT JOIN categories c ON c.id = s.category_id
+              WHERE s.month_key BETWEEN ? AND ?
+              GROUP BY 1, 2),
+    cats AS (SELECT DISTINCT category FROM cells {where})
+    SELECT k.category, printf('%02d-%d', m.mk % 100, m.mk / 100),
+           COALESCE(x.total, 0), COALESCE(x.cnt, 0),
+           COALESCE(x.total, 0) - LAG(COALESCE(x.total, 0)) OVER (PARTITION BY k.category ORDER BY m.mk)
+    FROM cats k CROSS JOIN months m
+    LEFT JOIN cells x ON x.category = k.category AND x.month_key = m.mk
+    ORDER BY k.category, m.mk
+    """, [lo, hi, lo, hi] + params)
+    return [(r[0], r[1], float(r[2]), int(r[3]), None if r[4] is None else float(r[4]))
+            for r in cur.fetchall()]
+
+def check_month_totals(tolerance: float = 0.005):
     """
-    Sau khi thêm chi tiêu, kiểm tra xem tổng chi tháng đó
-    có vượt 90% thu nhập hay không. Nếu có -> cảnh báo.
+    So sánh bảng tổng hợp expense_month_totals với SUM/COUNT tính lại từ expenses.
+    Trả về list các ô lệch: (month_key, category_id, (tổng, số khoản) đúng, (tổng, số khoản) trong bảng).
     """
+    cur = get_conn().cursor()
+    cur.execute(f"""
+        SELECT date_key / 100, COALESCE(category_id, 0), SUM(amount), COUNT(*)
+        FROM {luu_tru.expenses_from()} WHERE date_key IS NOT NULL
+        GROUP BY date_key / 100, COALESCE(category_id, 0)
+    """)
+    expected = {(r[0], r[1]): (r[2], r[3]) for r in cur.fetchall()}
+    cur.execute("SELECT month_key, category_id, total, cnt FROM expense_month_totals")
+    actual = {(r[0], r[1]): (r[2], r[3]) for r in cur.fetchall()}
+
+    diffs = []
+    for key in sorted(expected.keys() | actual.keys()):
+        exp = expected.get(key, (0.0, 0))
+        act = actual.get(key, (0.0, 0))
+        if exp[1] != act[1] or abs(exp[0] - act[0]) > tolerance:
+            diffs.append((key[0], key[1], exp, act))
+    return diffs
+
+def rebuild_month_totals() -> int:
+    """Tính lại toàn bộ bảng tổng hợp từ expenses (kể cả các năm lưu trữ). Trả về số ô (tháng, danh mục)."""
+    conn = get_conn()
+    source = luu_tru.expenses_from()  # ATTACH trước khi mở transaction
+    with transaction():
+        conn.execute("DELETE FROM expense_month_totals")
+        conn.execute(FILL_MONTH_TOTALS_SQL.replace("FROM expenses", f"FROM {source}"))
+    cur = conn.execute("SELECT COUNT(*) FROM expense_month_totals")
+    return cur.fetchone()[0]
+
+def get_budget_status(month: str):
+    """Trả về (tổng chi, thu nhập, tỉ lệ chi/thu) của tháng; tỉ lệ là None nếu chưa có thu nhập."""
     total = get_total_expense_by_month(month)
     income = get_income_for_month(month)
     if income <= 0:
-        return
-    ratio = total / income
-    if ratio > 0.9:
-        messagebox.showwarning(
-            "⚠️ Cảnh báo vượt 90% thu nhập",
-            f"Tổng chi tiêu tháng {month}: {total:,.0f} VND\n"
-            f"Thu nhập: {income:,.0f} VND\nTỉ lệ: {ratio:.0%}"
-        )
+        return total, income, None
+    return total, income, total / income
+
+def check_budget_alert_for_month(month: str):
+    """
+    Kiểm tra mọi hạn mức của tháng (tổng chi, các danh mục có hạn mức) và gửi
+    cảnh báo qua notifier hiện tại của ngan_sach. Trả về danh sách Alert.
+    """
+    import ngan_sach
+    return ngan_sach.check_month(month)
@@ -1,6 +1,77 @@
-from database import get_conn
+import threading
+import time
+from collections import namedtuple
+
+import luu_tru
+import su_kien
+from database import get_conn, on_rollback, transaction
 # Mục đích: Quản lý các danh mục chi tiêu (category)
 # Bao gồm thêm, xóa, truy vấn danh mục.
+
+Category = namedtuple("Category", "id name")
+
+
+class _CategoryRegistry:
+    """
+    Bộ nhớ đệm danh mục trong tiến trình: nạp bảng categories một lần rồi tra cứu
+    tên <-> id trên RAM, không hỏi DB ở mỗi lần tra.
+    - Chính chương trình thêm/xóa danh mục (add_category, delete_category_by_name, nhap_lieu,
+      rollback) -> invalidate(), lần tra sau nạp lại.
+    - Thay đổi từ tiến trình khác: so "chữ ký" của riêng bảng categories (COUNT, MAX(id)) khi
+      tra không thấy tên / id, và nhiều nhất mỗi CHECK_SECONDS giây. Không dùng PRAGMA
+      data_version: giá trị đó đổi với MỌI commit của kết nối khác (mỗi khoản chi lưu từ luồng
+      nền), nên bộ nhớ đệm bị nạp lại dù danh mục không đổi.
+    hits: tra trên RAM; misses: phải hỏi DB (so chữ ký hoặc nạp lại); reloads: số lần nạp lại.
+    """
+
+    CHECK_SECONDS = 2.0
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None              # (rows, by_name, by_id)
+        self._signature = None         # (COUNT(*), MAX(id)) của bảng categories lúc nạp
+        self._checked = 0.0            # time.monotonic() lần so chữ ký gần nhất
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def invalidate(self):
+        self._data = None
+
+    def get(self, recheck=False):
+        """recheck=True: so chữ ký ngay (tra không thấy tên / id trong bộ nhớ đệm)."""
+        data = self._data
+        if data is not None and not recheck and time.monotonic() - self._checked < self.CHECK_SECONDS:
+            self.hits += 1
+            return data
+        conn = get_conn()
+        with self._lock:
+            self.misses += 1
+            signature = conn.execute("SELECT COUNT(*), MAX(id) FROM categories").fetchone()
+            self._checked = time.monotonic()
+            data = self._data
+            if data is None or signature != self._signature:
+                cur = conn.execute("SELECT id, name FROM categories ORDER BY id ASC")
+                rows = list(map(Category._make, cur.fetchall()))
+                data = self._data = (rows, {name: cid for cid, name in rows}, dict(rows))
+                self._signature = signature
+                self.reloads += 1
+        return data
+
+
+_registry = _CategoryRegistry()
+on_rollback(_registry.invalidate)  # danh mục thêm trong giao dịch bị rollback không còn nữa
+
+
+def invalidate_cache():
+    """Xóa bộ nhớ đệm danh mục (gọi sau khi sửa bảng categories bằng SQL trực tiếp)."""
+    _registry.invalidate()
+
+
+def cache_stats() -> dict:
+    """Số lần tra cứu trúng bộ nhớ đệm (hits), phải đọc DB (misses) và số lần nạp lại."""
+    return {"hits": _registry.hits, "misses": _registry.misses, "reloads": _registry.reloads}
+
 def add_category(name: str) -> bool:
     """
     Thêm một danh mục mới.
@@ -12,30 +83,36 @@ def add_category(name: str) -> bool:
         # Không cho phép tên rỗng
         return False
 
-    conn = get_conn()
     try:
-        cur = conn.cursor()
+        # transaction(): rollback khi có lỗi truy vấn (an toàn dữ liệu)
+        with transaction() as conn:
+            cur = conn.cursor()
 
-        # INSERT OR IGNORE giúp tránh lỗi nếu tên danh mục đã tồn tại (UNIQUE constraint)
-        cur.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
-        conn.commit()
+            # INSERT OR IGNORE giúp tránh lỗi nếu tên danh mục đã tồn tại (UNIQUE constraint)
+            cur.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+            inserted = cur.rowcount > 0
+        _registry.invalidate()
 
         # Kiểm tra xem tên đó hiện có trong DB chưa (đảm bảo insert thành công hoặc đã tồn tại)
         cur.execute("SELECT id FROM categories WHERE name = ?", (name,))
-        return bool(cur.fetchone())
+        row = cur.fetchone()
+        if row and inserted:
+            su_kien.publish(su_kien.CATEGORIES, su_kien.INSERT, [{"id": row[0], "name": name}])
+        return bool(row)
     except Exception:
-        # rollback trong trường hợp có lỗi truy vấn (an toàn dữ liệu)
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 
 def delete_category_by_name(name: str) -> bool:
     """
     Xóa danh mục theo tên.
     Nếu danh mục đang được dùng trong bảng expenses, chuyển các khoản chi đó sang 'Khác' thay vì xóa cứng.
+    Không xóa được chính 'Khác' (nơi nhận các khoản chi của danh mục bị xóa) -> False.
     """
+    if name == "Khác":
+        # Chặn trước khi ghi: chuyển 'Khác' sang chính nó rồi xóa sẽ vướng khóa ngoại của các
+        # khoản chi, còn luu_tru.reassign_category(old == new) sẽ nhân đôi rồi xóa ô tổng hợp
+        return False
     conn = get_conn()
     try:
         cur = conn.cursor()
@@ -48,69 +125,81 @@ def delete_category_by_name(name: str) -> bool:
             return False
         del_id = row[0]
 
-        # Đảm bảo danh mục 'Khác' luôn tồn tại để chuyển dữ liệu sang
-        cur.execute("INSERT OR IGNORE INTO categories (name) VALUES ('Khác')")
-        cur.execute("SELECT id FROM categories WHERE name = 'Khác'")
-        other_id = cur.fetchone()[0]
-
-        # Chuyển tất cả chi tiêu thuộc danh mục bị xóa sang danh mục 'Khác'
-        cur.execute("UPDATE expenses SET category_id = ? WHERE category_id = ?", (other_id, del_id))
-
-        # Xóa danh mục khỏi bảng categories
-        cur.execute("DELETE FROM categories WHERE id = ?", (del_id,))
-        conn.commit()
+        # File các năm lưu trữ cũng phải đổi danh mục; ATTACH phải làm trước khi transaction
+        # bắt đầu (gọi bên trong một giao dịch khác khi có năm lưu trữ chưa ATTACH sẽ báo lỗi)
+        luu_tru.attach(luu_tru.archived_years(), conn)
+
+        with transaction():
+            # Đảm bảo danh mục 'Khác' luôn tồn tại để chuyển dữ liệu sang
+            cur.execute("INSERT OR IGNORE INTO categories (name) VALUES ('Khác')")
+            other_created = cur.rowcount > 0
+            cur.execute("SELECT id FROM categories WHERE name = 'Khác'")
+            other_id = cur.fetchone()[0]
+
+            # Chuyển tất cả chi tiêu thuộc danh mục bị xóa sang danh mục 'Khác'
+            # (trigger trg_expenses_totals_upd chuyển luôn số liệu trong bảng expense_month_totals)
+            cur.execute("UPDATE expenses SET category_id = ? WHERE category_id = ?", (other_id, del_id))
+            moved = cur.rowcount
+            moved += luu_tru.reassign_category(conn, del_id, other_id)
+
+            # Hạn mức riêng của danh mục này (ngan_sach) không còn ý nghĩa
+            cur.execute("DELETE FROM budgets WHERE category_id = ?", (del_id,))
+
+            # Xóa danh mục khỏi bảng categories
+            cur.execute("DELETE FROM categories WHERE id = ?", (del_id,))
+        _registry.invalidate()
+
+        # moved > 0: các khoản chi đã đổi sang 'Khác' -> bên nghe nạp lại số liệu chi tiêu
+        if other_created:
+            su_kien.publish(su_kien.CATEGORIES, su_kien.INSERT, [{"id": other_id, "name": "Khác"}])
+        su_kien.publish(su_kien.CATEGORIES, su_kien.DELETE, [{"id": del_id, "name": name}],
+                        moved_to=other_id, moved=moved)
         return True
 
     except Exception:
-        conn.rollback()
+        # transaction() đã rollback phần đã ghi
         return False
-    finally:
-        conn.close()
 
 
 def get_all_categories() -> list:
     """
     Trả về danh sách tất cả danh mục dưới dạng list[dict]:
     [{"id": 1, "name": "Ăn uống"}, ...]
-    Sắp xếp theo ID tăng dần (danh mục mới nhất ở cuối).
+    Sắp xếp theo ID tăng dần (danh mục mới nhất ở cuối). Đọc từ bộ nhớ đệm.
     """
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM categories ORDER BY id ASC")
-        rows = cur.fetchall()
+    rows, _, _ = _registry.get()
+
+    # Dùng list comprehension để trả về dữ liệu dễ sử dụng ở giao diện (Tkinter)
+    return [{"id": r[0], "name": r[1]} for r in rows]
+
 
-        # Dùng list comprehension để trả về dữ liệu dễ sử dụng ở giao diện (Tkinter)
-        return [{"id": r[0], "name": r[1]} for r in rows]
-    finally:
-        conn.close()
+def iter_categories():
+    """
+    Duyệt danh mục theo ID tăng dần, mỗi dòng là một Category(id, name) lấy thẳng từ bộ nhớ
+    đệm — không dựng dict / list mới như get_all_categories.
+    """
+    rows, _, _ = _registry.get()
+    return iter(rows)
 
 
 def get_category_id_by_name(name: str):
     """
-    Trả về ID của danh mục theo tên.
+    Trả về ID của danh mục theo tên (tra trên bộ nhớ đệm; chỉ hỏi DB khi không thấy tên, để
+    nhận danh mục vừa được tiến trình khác thêm vào).
     Dùng khi cần chèn chi tiêu mới vào bảng expenses (vì bảng đó lưu ID, không lưu tên).
     """
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM categories WHERE name = ?", (name,))
-        row = cur.fetchone()
-        return row[0] if row else None
-    finally:
-        conn.close()
+    cid = _registry.get()[1].get(name)
+    if cid is None:
+        cid = _registry.get(recheck=True)[1].get(name)
+    return cid
 
 
 def get_category_name_by_id(cat_id: int):
     """
-    Trả về tên danh mục theo ID.
+    Trả về tên danh mục theo ID (tra trên bộ nhớ đệm; không thấy id thì hỏi lại DB một lần).
     Dùng để hiển thị lại tên danh mục khi truy xuất dữ liệu từ bảng expenses.
     """
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT name FROM categories WHERE id = ?", (cat_id,))
-        row = cur.fetchone()
-        return row[0] if row else None
-    finally:
-        conn.close()
+    name = _registry.get()[2].get(cat_id)
+    if name is None:
+        name = _registry.get(recheck=True)[2].get(cat_id)
+    return name
@@ -1,22 +1,559 @@
 import sqlite3
-from pathlib import Path
+import threading
+import atexit
+import os
+import time
+from contextlib import contextmanager
 
-# Đường dẫn tới file cơ sở dữ liệu SQLite (lưu cùng thư mục với chương trình)
-DB_PATH = Path(__file__).parent / "QL_Chi_Tieu.db"
+# Đường dẫn tới file cơ sở dữ liệu SQLite (lưu cùng thư mục với chương trình).
+# Dùng os.path thay cho pathlib: bớt vài ms khởi động cho các lệnh dòng lệnh.
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "QL_Chi_Tieu.db")
 
-# Hàm trả về một kết nối (connection) đến database.
-# Hàm này được dùng ở các module khác để thực hiện truy vấn SQL.
+# Các PRAGMA áp dụng một lần khi mở kết nối:
+# - WAL: đọc không bị chặn khi đang ghi, ghi nhanh hơn
+# - synchronous=NORMAL: an toàn với WAL, ít fsync hơn FULL
+# - cache_size âm = KB (16 MB), mmap_size = 256 MB, bảng tạm trong RAM
+# - foreign_keys: bật kiểm tra khóa ngoại (mặc định SQLite tắt)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+# Kết nối chỉ đọc (vd: tiến trình con xuất Excel): mở bằng URI mode=ro, bỏ các PRAGMA ghi
+READ_ONLY = False
+READ_ONLY_PRAGMAS = (
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA query_only=ON",
+)
+
+# Số câu lệnh đã biên dịch được giữ lại trên mỗi kết nối (prepared statement cache)
+CACHED_STATEMENTS = 256
+
+# Nhiều tiến trình cùng ghi một file (giao diện + lệnh cron, hai cửa sổ...): khi kết nối khác
+# đang giữ khóa ghi, SQLite tự chờ tối đa BUSY_TIMEOUT_MS (busy_timeout); transaction() thử
+# lại BEGIN IMMEDIATE thêm WRITE_RETRIES lần, nghỉ tăng dần (RETRY_BACKOFF giây, nhân đôi,
+# có ngẫu nhiên để các tiến trình không cùng thử lại một lúc) rồi mới báo "database is locked".
+BUSY_TIMEOUT_MS = 5000
+WRITE_RETRIES = 4
+RETRY_BACKOFF = 0.05
+busy_retries = 0       # số lần đã phải thử lại (phục vụ đo đạc)
+
+# Mỗi luồng giữ một kết nối riêng (sqlite3 không nên dùng chung giữa các luồng).
+_local = threading.local()
+_lock = threading.Lock()
+_open_conns = []       # tất cả kết nối đang mở, để đóng khi thoát chương trình
+_generation = 0        # tăng lên khi đổi DB_PATH / close_all -> các luồng mở lại kết nối
+connections_opened = 0 # tổng số lần mở kết nối (phục vụ đo đạc)
+_wrapper = None        # chan_doan: hàm bọc kết nối để đo từng câu lệnh (None = tắt)
+
+
+def _connect():
+    global connections_opened
+    # check_same_thread=False chỉ để close_all() đóng được kết nối của luồng khác;
+    # mỗi kết nối vẫn chỉ được dùng bởi luồng đã tạo ra nó.
+    if READ_ONLY:
+        from urllib.parse import quote
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(DB_PATH))}?mode=ro", uri=True,
+                               timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS,
+                               check_same_thread=False)
+    else:
+        conn = sqlite3.connect(str(DB_PATH), timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+    for pragma in READ_ONLY_PRAGMAS if READ_ONLY else PRAGMAS:
+        conn.execute(pragma)
+    with _lock:
+        _open_conns.append(conn)
+        connections_opened += 1
+    _local.opened = getattr(_local, "opened", 0) + 1
+    return conn
+
+
+def thread_connections_opened() -> int:
+    """Số kết nối luồng hiện tại đã mở (chan_doan dùng để đếm theo từng thao tác)."""
+    return getattr(_local, "opened", 0)
+
+
+def open_connections():
+    """Các kết nối SQLite đang mở của mọi luồng."""
+    with _lock:
+        return list(_open_conns)
+
+
+def set_connection_wrapper(wrapper):
+    """
+    wrapper(conn) -> đối tượng thay thế conn mà get_conn() trả về (vd: chan_doan bọc để đo
+    thời gian từng câu lệnh); None = trả về kết nối gốc. Không tốn gì khi không dùng.
+    """
+    global _wrapper
+    _wrapper = wrapper
+
+
+# Hàm trả về kết nối (connection) đến database của luồng hiện tại.
+# Kết nối được mở một lần rồi dùng lại; các module khác KHÔNG đóng nó sau khi dùng.
 def get_conn():
-    return sqlite3.connect(str(DB_PATH))
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+    if _wrapper is not None:
+        wrapped = getattr(_local, "wrapped", None)
+        if wrapped is None or wrapped[0] is not conn or wrapped[1] is not _wrapper:
+            wrapped = _local.wrapped = (conn, _wrapper, _wrapper(conn))
+        return wrapped[2]
+    return conn
 
 
-# Hàm khởi tạo cơ sở dữ liệu: tạo bảng nếu chưa có.
-# Dùng khi chương trình khởi động lần đầu (xem file main.py).
-def init_db():
+# Đóng kết nối của tất cả các luồng (gọi khi thoát chương trình).
+def close_all():
+    global _generation
+    with _lock:
+        conns = list(_open_conns)
+        _open_conns.clear()
+        _generation += 1
+    for conn in conns:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+# Đóng kết nối của luồng hiện tại (vd: luồng trong pool sắp dừng); lần get_conn() sau mở lại.
+def close_thread_conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = _local.wrapped = None
+    with _lock:
+        if conn in _open_conns:
+            _open_conns.remove(conn)
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+# Đổi file DB đang dùng (vd: DB tạm cho benchmark). Các kết nối cũ bị đóng.
+# read_only=True: mọi kết nối mở sau đó chỉ đọc được (ghi -> sqlite3.OperationalError).
+def set_db_path(path, read_only=False):
+    global DB_PATH, READ_ONLY
+    close_all()
+    DB_PATH = os.fspath(path)
+    READ_ONLY = read_only
+
+
+atexit.register(close_all)
+
+
+# GIAO DỊCH (unit of work): gom nhiều lệnh ghi thành MỘT lần commit
+# Các hàm ghi (chi_tieu.add_expense, add_income, danh_muc.add_category, ngan_sach.set_budget...)
+# đều ghi trong một khối transaction(). Gọi chúng bên trong một khối ngoài cùng thì cả nhóm
+# chỉ commit một lần (một lần ghi WAL / fsync thay vì mỗi khoản một lần):
+#     with database.transaction():
+#         for day, cid, desc, amount in rows:
+#             chi_tieu.add_expense(day, cid, desc, amount, check_budget=False)
+# Khối lồng bên trong là SAVEPOINT: lỗi trong khối trong chỉ hủy phần việc của nó, khối
+# ngoài vẫn commit được. Sự kiện su_kien được giữ lại tới khi khối ngoài cùng commit.
+_rollback_hooks = []
+
+
+def on_rollback(fn):
+    """
+    Đăng ký fn() chạy (trên luồng vừa rollback) sau khi một transaction() / SAVEPOINT bị
+    rollback: các bộ nhớ đệm trong RAM (danh_muc, ngan_sach, phan_tich) bỏ những gì đã
+    ghi nhận từ phần việc bị hủy. Trả về fn để dùng được như decorator.
+    """
+    _rollback_hooks.append(fn)
+    return fn
+
+
+def _rolled_back():
+    for fn in _rollback_hooks:
+        try:
+            fn()
+        except Exception as e:
+            print("Lỗi khi xử lý rollback:", e)
+
+
+def is_busy_error(e) -> bool:
+    """Lỗi do file DB đang bị kết nối / tiến trình khác khóa (SQLITE_BUSY / SQLITE_LOCKED)."""
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    code = getattr(e, "sqlite_errorcode", None)  # Python 3.11+
+    if code is not None:
+        return code & 0xFF in (5, 6)
+    return "locked" in str(e) or "busy" in str(e)
+
+
+def _begin_immediate(conn):
+    global busy_retries
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == WRITE_RETRIES or not is_busy_error(e):
+                raise
+        import random
+        with _lock:
+            busy_retries += 1
+        time.sleep(min(1.0, RETRY_BACKOFF * 2 ** attempt) * (0.5 + random.random()))
+
+
+def in_transaction() -> bool:
+    """Luồng hiện tại có đang ở trong một khối transaction() không."""
+    return getattr(_local, "tx_depth", 0) > 0
+
+
+@contextmanager
+def transaction():
+    """with transaction() as conn: commit khi ra khỏi khối, rollback nếu có ngoại lệ."""
+    import su_kien  # chỉ nạp khi ghi: các lệnh chỉ đọc (summary, list) không cần kênh sự kiện
     conn = get_conn()
-    cur = conn.cursor()
+    depth = getattr(_local, "tx_depth", 0)
+    if depth:
+        name = f"sp_{depth}"
+        mark = su_kien.bus.held_count()
+        conn.execute(f"SAVEPOINT {name}")
+        _local.tx_depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            su_kien.bus.rewind(mark)
+            _rolled_back()
+            raise
+        else:
+            conn.execute(f"RELEASE {name}")
+        finally:
+            _local.tx_depth = depth
+        return
+
+    # IMMEDIATE: giành khóa ghi ngay từ đầu (chờ / thử lại nếu đang có người ghi). BEGIN
+    # thường đọc trước rồi mới xin khóa ghi, nếu lúc đó kết nối khác đã commit thì SQLite
+    # báo "database is locked" ngay, không chờ.
+    _begin_immediate(conn)
+    _local.tx_depth = 1
+    su_kien.bus.hold()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        su_kien.bus.release(deliver=False)
+        _rolled_back()
+        raise
+    finally:
+        _local.tx_depth = 0
+    # Đã commit: phát các sự kiện đã giữ
+    su_kien.bus.release()
+
+
+# Khóa ngày/tháng dạng số nguyên để so sánh và đánh index được.
+# Ngày "DD-MM-YYYY" -> YYYYMMDD, tháng "MM-YYYY" -> YYYYMM.
+# Cột date / month dạng chuỗi vẫn được giữ nguyên cho giao diện và API cũ.
+def date_key(date_str: str) -> int:
+    """
+    Đổi ngày DD-MM-YYYY sang số nguyên YYYYMMDD (vd: "05-11-2025" -> 20251105).
+    Chấp nhận cả ngày/tháng không có số 0 đứng đầu ("5-11-2025").
+    """
+    d, m, y = (int(p) for p in date_str.strip().split("-"))
+    return y * 10000 + m * 100 + d
+
+
+def month_key(month: str) -> int:
+    """Đổi tháng MM-YYYY sang số nguyên YYYYMM (vd: "11-2025" -> 202511)."""
+    m, y = (int(p) for p in month.strip().split("-"))
+    if not 1 <= m <= 12:
+        raise ValueError(f"Tháng không hợp lệ: {month}")
+    return y * 100 + m
+
+
+def month_range(month: str):
+    """
+    Trả về (date_key đầu, date_key cuối) của một tháng MM-YYYY,
+    dùng cho truy vấn dạng "date_key BETWEEN ? AND ?" (quét theo index).
+    Tháng sai định dạng trả về khoảng rỗng -> truy vấn không ra dòng nào,
+    giống hành vi cũ khi so sánh substr.
+    """
+    try:
+        mk = month_key(month)
+    except (ValueError, AttributeError):
+        return (1, 0)
+    return (mk * 100 + 1, mk * 100 + 31)
+
+
+def shift_month(month: str, n: int) -> str:
+    """Tháng MM-YYYY dịch đi n tháng (n < 0: lùi lại), vd: ("03-2025", -11) -> "04-2024"."""
+    mk = month_key(month)
+    total = (mk // 100) * 12 + (mk % 100 - 1) + n
+    return f"{total % 12 + 1:02d}-{total // 12}"
+
+
+# Mã băm nội dung của một khoản chi (cột import_hash, index UNIQUE idx_expenses_import_hash):
+# nhập lại cùng một dòng ra cùng một mã nên bị bỏ qua. Mọi đường ghi đều điền cột này
+# (nhap_lieu, chi_tieu.add_expense, bước nâng cấp v8 cho dữ liệu cũ), nên nhập lại file
+# xuat_excel của các khoản nhập tay cũng không bị trùng. Khoản thứ n có cùng nội dung
+# dùng nth_hash(mã, n) — cách đánh số giống nhap_lieu với các dòng lặp lại trong một file.
+def content_hash(key, cid, desc, amount) -> int:
+    """Mã băm 64-bit (có dấu, vừa kiểu INTEGER của SQLite) của (date_key, danh mục, mô tả, số tiền)."""
+    from hashlib import blake2b  # nạp khi cần: các lệnh chỉ đọc không tốn thời gian import
+    raw = f"{key}|{cid}|{desc}|{amount!r}".encode()
+    return int.from_bytes(blake2b(raw, digest_size=8).digest(), "big", signed=True)
+
+
+def nth_hash(base, occurrence) -> int:
+    """Mã băm cho lần xuất hiện thứ n (n >= 2) của cùng một nội dung."""
+    from hashlib import blake2b
+    raw = base.to_bytes(8, "big", signed=True) + occurrence.to_bytes(4, "big")
+    return int.from_bytes(blake2b(raw, digest_size=8).digest(), "big", signed=True)
+
+
+def _taken_hashes(cur, hashes) -> set:
+    """Các mã trong hashes đã có trong bảng expenses: một truy vấn IN cho mỗi 500 mã."""
+    hashes = list(hashes)
+    taken = set()
+    for i in range(0, len(hashes), 500):
+        chunk = hashes[i:i + 500]
+        cur.execute(f"SELECT import_hash FROM expenses WHERE import_hash IN ({','.join('?' * len(chunk))})",
+                    chunk)
+        taken.update(h for (h,) in cur.fetchall())
+    return taken
+
+
+def free_import_hashes(cur, rows) -> list:
+    """
+    import_hash cho cả một lô khoản mới (rows: (date_key, danh mục, mô tả, số tiền)): với mỗi
+    khoản, lần xuất hiện đầu tiên chưa có trong bảng expenses và chưa cấp cho khoản đứng trước
+    nó trong lô. Kiểm tra trùng theo vòng, mỗi vòng một truy vấn IN cho mọi khoản còn lại
+    (không SELECT từng dòng); số vòng = số lần lặp lớn nhất của cùng một nội dung.
+    """
+    bases = [content_hash(key, cid, desc or "", float(amount)) for key, cid, desc, amount in rows]
+    result = [None] * len(rows)
+    given = set()
+    todo = range(len(rows))
+    n = 1
+    while todo:
+        candidates = [(i, bases[i] if n == 1 else nth_hash(bases[i], n)) for i in todo]
+        taken = _taken_hashes(cur, {h for _, h in candidates})
+        todo = []
+        for i, h in candidates:
+            if h in taken or h in given:
+                todo.append(i)
+            else:
+                given.add(h)
+                result[i] = h
+        n += 1
+    return result
+
+
+def fill_import_hashes(cur, progress=None) -> int:
+    """
+    Điền import_hash cho các dòng chưa có (khoản nhập tay từ trước khi mọi đường ghi đều
+    điền cột này), theo thứ tự id, mỗi đợt MIGRATION_CHUNK dòng. Trả về số dòng đã điền.
+    """
+    cur.execute("SELECT COUNT(*) FROM expenses WHERE import_hash IS NULL AND date_key IS NOT NULL")
+    total = cur.fetchone()[0]
+    done = last = 0
+    while done < total:
+        cur.execute("""
+            SELECT id, date_key, category_id, description, amount FROM expenses
+            WHERE import_hash IS NULL AND date_key IS NOT NULL AND id > ?
+            ORDER BY id LIMIT ?
+        """, (last, MIGRATION_CHUNK))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        hashes = free_import_hashes(cur, [r[1:] for r in rows])
+        cur.executemany("UPDATE expenses SET import_hash = ? WHERE id = ?",
+                        zip(hashes, (r[0] for r in rows)))
+        done += len(rows)
+        last = rows[-1][0]
+        if progress:
+            progress("điền import_hash", done, total)
+    return done
+
+
+# Bảng tổng hợp chi tiêu theo (tháng, danh mục): tổng tiền + số khoản chi.
+# Được giữ đúng bởi các trigger trên bảng expenses, nên thống kê chỉ cần đọc
+# vài dòng thay vì SUM() trên toàn bộ chi tiêu. category_id = 0 nghĩa là không có danh mục.
+MONTH_TOTALS_TABLE = """
+CREATE TABLE IF NOT EXISTS expense_month_totals (
+    month_key INTEGER NOT NULL,       -- YYYYMM
+    category_id INTEGER NOT NULL,     -- 0 = không gắn danh mục
+    total REAL NOT NULL,
+    cnt INTEGER NOT NULL,
+    PRIMARY KEY (month_key, category_id)
+) WITHOUT ROWID
+"""
+
+# Tính lại toàn bộ bảng tổng hợp từ expenses (dùng khi tạo bảng lần đầu / rebuild)
+FILL_MONTH_TOTALS_SQL = """
+INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+SELECT date_key / 100, COALESCE(category_id, 0), SUM(amount), COUNT(*)
+FROM expenses
+WHERE date_key IS NOT NULL
+GROUP BY date_key / 100, COALESCE(category_id, 0)
+"""
+
+# Tên trigger -> câu lệnh tạo. Nhập hàng loạt (nhap_lieu) xóa tạm trigger INSERT trong
+# transaction của nó, tính lại các tháng bị ảnh hưởng một lần rồi tạo lại trigger trước khi
+# commit (DDL trong SQLite cũng nằm trong transaction nên kết nối khác không thấy thay đổi).
+MONTH_TOTALS_TRIGGERS = {
+    # Thêm chi tiêu -> cộng vào ô (tháng, danh mục)
+    "trg_expenses_totals_ins": """
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_totals_ins AFTER INSERT ON expenses
+    WHEN new.date_key IS NOT NULL
+    BEGIN
+        INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+        VALUES (new.date_key / 100, COALESCE(new.category_id, 0), new.amount, 1)
+        ON CONFLICT (month_key, category_id)
+        DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+    END
+    """,
+    # Xóa chi tiêu -> trừ đi, xóa ô nếu không còn khoản nào
+    "trg_expenses_totals_del": """
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_totals_del AFTER DELETE ON expenses
+    WHEN old.date_key IS NOT NULL
+    BEGIN
+        UPDATE expense_month_totals SET total = total - old.amount, cnt = cnt - 1
+        WHERE month_key = old.date_key / 100 AND category_id = COALESCE(old.category_id, 0);
+        DELETE FROM expense_month_totals
+        WHERE month_key = old.date_key / 100 AND category_id = COALESCE(old.category_id, 0) AND cnt <= 0;
+    END
+    """,
+    # Sửa ngày / danh mục / số tiền (vd: xóa danh mục chuyển sang 'Khác') -> trừ ô cũ, cộng ô mới
+    "trg_expenses_totals_upd": """
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_totals_upd
+    AFTER UPDATE OF date_key, category_id, amount ON expenses
+    BEGIN
+        UPDATE expense_month_totals SET total = total - old.amount, cnt = cnt - 1
+        WHERE month_key = old.date_key / 100 AND category_id = COALESCE(old.category_id, 0);
+        DELETE FROM expense_month_totals
+        WHERE month_key = old.date_key / 100 AND category_id = COALESCE(old.category_id, 0) AND cnt <= 0;
+        INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+        SELECT new.date_key / 100, COALESCE(new.category_id, 0), new.amount, 1
+        WHERE new.date_key IS NOT NULL
+        ON CONFLICT (month_key, category_id)
+        DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+    END
+    """,
+}
+
+
+# Các năm chi tiêu đã chuyển sang file lưu trữ riêng (xem luu_tru.py)
+ARCHIVES_TABLE = """
+CREATE TABLE IF NOT EXISTS archives (
+    year INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,               -- tên file, nằm cùng thư mục với DB chính
+    rows INTEGER NOT NULL,
+    total REAL NOT NULL,
+    archived_at TEXT NOT NULL
+)
+"""
+
+
+# Tìm kiếm toàn văn trên mô tả chi tiêu (FTS5). Bảng contentless (content='') chỉ giữ
+# index, không chép lại mô tả; kết quả được join về expenses qua rowid = expenses.id.
+# unicode61 remove_diacritics 2 bỏ dấu tiếng Việt (ă, â, ê, ô, ơ, ư và 5 thanh) nhưng
+# không đổi được 'đ' (là chữ cái riêng), nên 'đ'/'Đ' được thay bằng 'd'/'D' trước khi
+# đưa vào index — câu tìm kiếm cũng phải được chuẩn hóa giống vậy (xem fold_text).
+# prefix='2 3': index sẵn tiền tố 2-3 ký tự cho kiểu tìm "gõ tới đâu tìm tới đó" (từ*).
+FTS_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+    description, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+)
+"""
 
-    # Tạo bảng danh mục (categories): lưu tên các loại chi tiêu.
+
+def _fold_sql(expr):
+    return f"replace(replace(COALESCE({expr}, ''), 'đ', 'd'), 'Đ', 'D')"
+
+
+FILL_FTS_SQL = f"INSERT INTO expenses_fts (rowid, description) SELECT id, {_fold_sql('description')} FROM expenses"
+
+# Bảng contentless: muốn xóa một dòng khỏi index phải gửi lệnh 'delete' kèm đúng nội dung cũ
+FTS_TRIGGERS = {
+    "trg_expenses_fts_ins": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_ins AFTER INSERT ON expenses BEGIN
+        INSERT INTO expenses_fts (rowid, description) VALUES (new.id, {_fold_sql('new.description')});
+    END
+    """,
+    "trg_expenses_fts_del": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_del AFTER DELETE ON expenses BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, description)
+        VALUES ('delete', old.id, {_fold_sql('old.description')});
+    END
+    """,
+    "trg_expenses_fts_upd": f"""
+    CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_upd AFTER UPDATE OF description ON expenses BEGIN
+        INSERT INTO expenses_fts (expenses_fts, rowid, description)
+        VALUES ('delete', old.id, {_fold_sql('old.description')});
+        INSERT INTO expenses_fts (rowid, description) VALUES (new.id, {_fold_sql('new.description')});
+    END
+    """,
+}
+
+
+def fold_text(text: str) -> str:
+    """Chuẩn hóa chuỗi tìm kiếm giống nội dung trong expenses_fts ('đ' -> 'd')."""
+    return text.replace("đ", "d").replace("Đ", "D")
+
+
+# --- Phiên bản lược đồ (schema) và nâng cấp (migration) ---
+# Phiên bản lược đồ của file DB nằm trong PRAGMA user_version (4 byte ở header file, đọc
+# không tốn truy vấn bảng nào). MIGRATIONS là danh sách bước nâng cấp theo thứ tự: bước thứ
+# i đưa DB từ phiên bản i - 1 lên i. Muốn đổi lược đồ thì THÊM một bước vào cuối danh sách,
+# không sửa các bước cũ (DB của người dùng có thể đang ở bất kỳ phiên bản nào trước đó).
+# DB tạo trước khi có cơ chế này có user_version = 0 nhưng có thể đã có một phần lược đồ,
+# nên các bước dùng IF NOT EXISTS / _ensure_column để chạy lại trên đó vẫn đúng.
+MIGRATION_CHUNK = 50_000   # số dòng mỗi đợt khi điền dữ liệu cho bảng lớn
+
+
+def _ensure_column(cur, table: str, column: str, decl: str) -> bool:
+    """Thêm cột vào bảng cũ nếu chưa có."""
+    cur.execute(f"PRAGMA table_info({table})")
+    if any(r[1] == column for r in cur.fetchall()):
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+def _table_exists(cur, name: str) -> bool:
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+    return cur.fetchone() is not None
+
+
+def _fill_in_chunks(cur, label, sql, progress):
+    """
+    Chạy sql (có "id BETWEEN ? AND ?" trên expenses) theo từng đợt MIGRATION_CHUNK id,
+    gọi progress(label, số dòng đã xử lý, tổng số dòng) sau mỗi đợt.
+    """
+    cur.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM expenses")
+    lo, hi, total = cur.fetchone()
+    if not total:
+        return
+    if progress:
+        progress(label, 0, total)
+    done = 0
+    for first in range(lo, hi + 1, MIGRATION_CHUNK):
+        last = first + MIGRATION_CHUNK - 1
+        cur.execute("SELECT COUNT(*) FROM expenses WHERE id BETWEEN ? AND ?", (first, last))
+        done += cur.fetchone()[0]
+        cur.execute(sql, (first, last))
+        if progress:
+            progress(label, done, total)
+
+
+def _migrate_base_tables(cur, progress):
+    # Bảng danh mục (categories): lưu tên các loại chi tiêu.
     cur.execute("""
     CREATE TABLE IF NOT EXISTS categories (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -24,16 +561,17 @@ def init_db():
     )
     """)
 
-    # Tạo bảng thu nhập (incomes): lưu thu nhập theo tháng.
+    # Bảng thu nhập (incomes): lưu thu nhập theo tháng.
     cur.execute("""
     CREATE TABLE IF NOT EXISTS incomes (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         month TEXT UNIQUE NOT NULL,
-        amount REAL NOT NULL
+        amount REAL NOT NULL,
+        month_key INTEGER                 -- YYYYMM, dùng để sắp xếp
     )
     """)
 
-    # Tạo bảng chi tiêu (expenses): lưu từng khoản chi, gắn với danh mục.
+    # Bảng chi tiêu (expenses): lưu từng khoản chi, gắn với danh mục.
     cur.execute("""
     CREATE TABLE IF NOT EXISTS expenses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,16 +579,198 @@ def init_db():
         category_id INTEGER,              -- liên kết với bảng categories
         description TEXT,                 -- mô tả khoản chi
         amount REAL NOT NULL,             -- số tiền chi
+        date_key INTEGER,                 -- YYYYMMDD, dùng để lọc/sắp xếp theo index
+        import_hash INTEGER,              -- mã băm nội dung khi nhập hàng loạt (chống trùng)
         FOREIGN KEY(category_id) REFERENCES categories(id)
     )
     """)
 
-    # Thêm các danh mục mặc định (nếu chưa có)
+    # Các danh mục mặc định (chỉ thêm một lần, người dùng xóa thì không tự thêm lại)
     defaults = ["Ăn uống", "Đi lại", "Giải trí", "Mua sắm", "Học tập", "Khác"]
     cur.executemany("INSERT OR IGNORE INTO categories (name) VALUES (?)", [(d,) for d in defaults])
 
-    conn.commit()
-    conn.close()
+
+def _migrate_date_keys(cur, progress):
+    # Cột khóa số YYYYMMDD / YYYYMM cho DB cũ. Điền bằng Python để xử lý được cả ngày
+    # không có số 0 đứng đầu; dòng có ngày sai định dạng giữ NULL.
+    _ensure_column(cur, "expenses", "date_key", "INTEGER")
+    _ensure_column(cur, "incomes", "month_key", "INTEGER")
+
+    def backfill(first, last):
+        cur.execute("SELECT id, date FROM expenses WHERE date_key IS NULL AND id BETWEEN ? AND ?",
+                    (first, last))
+        rows = cur.fetchall()
+        updates = []
+        for rid, d in rows:
+            try:
+                updates.append((date_key(d), rid))
+            except (ValueError, AttributeError):
+                continue
+        cur.executemany("UPDATE expenses SET date_key = ? WHERE id = ?", updates)
+        return len(rows)
+
+    cur.execute("SELECT MIN(id), MAX(id), COUNT(*) FROM expenses WHERE date_key IS NULL")
+    lo, hi, total = cur.fetchone()
+    if total:
+        done = 0
+        for first in range(lo, hi + 1, MIGRATION_CHUNK):
+            done += backfill(first, first + MIGRATION_CHUNK - 1)
+            if progress:
+                progress("điền date_key", done, total)
+
+    cur.execute("SELECT id, month FROM incomes WHERE month_key IS NULL")
+    updates = []
+    for rid, m in cur.fetchall():
+        try:
+            updates.append((month_key(m), rid))
+        except (ValueError, AttributeError):
+            continue
+    cur.executemany("UPDATE incomes SET month_key = ? WHERE id = ?", updates)
+
+    # Index cho lọc theo tháng/khoảng ngày và theo danh mục + ngày
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date_key ON expenses(date_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_expenses_cat_date ON expenses(category_id, date_key)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_incomes_month_key ON incomes(month_key)")
+
+
+def _migrate_import_hash(cur, progress):
+    _ensure_column(cur, "expenses", "import_hash", "INTEGER")
+    # Index UNIQUE một phần để bỏ qua dòng trùng (dòng cũ chưa có mã được điền ở bước v8)
+    cur.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_import_hash
+                   ON expenses(import_hash) WHERE import_hash IS NOT NULL""")
+
+
+def _migrate_month_totals(cur, progress):
+    # Bảng tổng hợp tháng x danh mục + trigger; DB cũ chưa có bảng thì tính từ dữ liệu hiện có
+    # (cộng dồn từng đợt id vào các ô, ô đã có từ đợt trước thì cộng thêm)
+    if not _table_exists(cur, "expense_month_totals"):
+        cur.execute(MONTH_TOTALS_TABLE)
+        _fill_in_chunks(cur, "tổng hợp tháng", """
+            INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+            SELECT date_key / 100, COALESCE(category_id, 0), SUM(amount), COUNT(*)
+            FROM expenses
+            WHERE date_key IS NOT NULL AND id BETWEEN ? AND ?
+            GROUP BY date_key / 100, COALESCE(category_id, 0)
+            ON CONFLICT (month_key, category_id)
+            DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt
+        """, progress)
+    for sql in MONTH_TOTALS_TRIGGERS.values():
+        cur.execute(sql)
+
+
+def _migrate_fts(cur, progress):
+    # Index tìm kiếm toàn văn; DB cũ chưa có thì đánh index toàn bộ mô tả hiện có
+    if not _table_exists(cur, "expenses_fts"):
+        cur.execute(FTS_TABLE)
+        _fill_in_chunks(cur, "index tìm kiếm", FILL_FTS_SQL + " WHERE id BETWEEN ? AND ?", progress)
+    for sql in FTS_TRIGGERS.values():
+        cur.execute(sql)
+
+
+def _migrate_budgets(cur, progress):
+    # Hạn mức chi tiêu (xem ngan_sach.py). category_id = 0: tổng chi cả tháng;
+    # month_key = 0: áp dụng cho mọi tháng. Mỗi dòng có hạn mức tuyệt đối hoặc tỉ lệ thu nhập.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS budgets (
+        category_id INTEGER NOT NULL DEFAULT 0,
+        month_key INTEGER NOT NULL DEFAULT 0,
+        limit_amount REAL,                -- hạn mức (VND)
+        limit_ratio REAL,                 -- hoặc tỉ lệ so với thu nhập tháng (vd: 0.9)
+        PRIMARY KEY (category_id, month_key)
+    ) WITHOUT ROWID
+    """)
+
+
+def _migrate_archives(cur, progress):
+    cur.execute(ARCHIVES_TABLE)
+
+
+def _migrate_fill_import_hash(cur, progress):
+    fill_import_hashes(cur, progress)
+    # File các năm đã lưu trữ (luu_tru) giữ nguyên cột import_hash của các dòng đã chuyển sang:
+    # điền cho từng file bằng kết nối riêng. Mỗi file commit riêng, nhưng chỉ điền dòng còn NULL
+    # nên chạy lại (khi DB chính rollback) không đổi gì thêm.
+    folder = os.path.dirname(os.path.abspath(DB_PATH))
+    for (name,) in cur.execute("SELECT file FROM archives ORDER BY year").fetchall():
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            continue
+        other = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            with other:
+                fill_import_hashes(other.cursor(), progress)
+        finally:
+            other.close()
+
+
+def _migrate_unique_income_month(cur, progress):
+    # Bản cũ cộng dồn theo chuỗi month nên "3-2024" và "03-2024" thành hai dòng cùng month_key:
+    # gộp về dòng có id nhỏ nhất (cộng tiền), đổi month sang dạng chuẩn MM-YYYY
+    cur.execute("""
+        SELECT month_key, MIN(id), SUM(amount) FROM incomes
+        WHERE month_key IS NOT NULL GROUP BY month_key
+    """)
+    for key, keep, total in cur.fetchall():
+        cur.execute("DELETE FROM incomes WHERE month_key = ? AND id <> ?", (key, keep))
+        cur.execute("UPDATE incomes SET month = ?, amount = ? WHERE id = ?",
+                    (f"{key % 100:02d}-{key // 100}", total, keep))
+    cur.execute("DROP INDEX IF EXISTS idx_incomes_month_key")
+    cur.execute("CREATE UNIQUE INDEX idx_incomes_month_key ON incomes(month_key)")
+
+
+# (mô tả, hàm nâng cấp(cur, progress)); phiên bản = vị trí trong danh sách, tính từ 1
+MIGRATIONS = [
+    ("bảng danh mục, thu nhập, chi tiêu", _migrate_base_tables),
+    ("cột khóa số date_key / month_key + index", _migrate_date_keys),
+    ("cột import_hash chống nhập trùng", _migrate_import_hash),
+    ("bảng tổng hợp tháng x danh mục", _migrate_month_totals),
+    ("index tìm kiếm toàn văn", _migrate_fts),
+    ("bảng hạn mức chi tiêu", _migrate_budgets),
+    ("bảng các năm đã lưu trữ", _migrate_archives),
+    ("điền import_hash cho các khoản nhập tay", _migrate_fill_import_hash),
+    ("mỗi tháng một dòng thu nhập (month_key UNIQUE)", _migrate_unique_income_month),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version() -> int:
+    return get_conn().execute("PRAGMA user_version").fetchone()[0]
+
+
+def print_progress(label, done, total):
+    """progress cho init_db: in tiến độ các bước điền dữ liệu cho bảng lớn ra stderr."""
+    if total:
+        import sys
+        print(f"Nâng cấp DB - {label}: {done:,}/{total:,}", end="\n" if done >= total else "\r",
+              file=sys.stderr, flush=True)
+
+
+# Hàm khởi tạo / nâng cấp cơ sở dữ liệu (xem file main.py, dong_lenh.py).
+# DB đã ở phiên bản mới nhất: chỉ đọc PRAGMA user_version rồi trả về, không chạy lệnh nào khác.
+# Ngược lại chạy các bước còn thiếu trong MỘT transaction (lỗi giữa chừng -> DB giữ nguyên
+# phiên bản cũ) và ghi phiên bản mới cùng lúc commit.
+def init_db(progress=None):
+    """
+    Trả về phiên bản lược đồ sau khi nâng cấp.
+    - progress(nhãn, đã xong, tổng) được gọi khi bắt đầu mỗi bước (nhãn "vN: mô tả", 0, 0) và
+      sau mỗi đợt MIGRATION_CHUNK dòng khi điền dữ liệu cho bảng lớn.
+    - DB có phiên bản cao hơn SCHEMA_VERSION (tạo bởi bản chương trình mới hơn) được để nguyên.
+    """
+    version = schema_version()
+    if version >= SCHEMA_VERSION:
+        return version
+    with transaction() as conn:
+        cur = conn.cursor()
+        # Tiến trình khác có thể vừa nâng cấp xong trong lúc ta chờ khóa ghi
+        cur.execute("PRAGMA user_version")
+        version = cur.fetchone()[0]
+        for number, (description, migrate) in enumerate(MIGRATIONS[version:], version + 1):
+            if progress:
+                progress(f"v{number}: {description}", 0, 0)
+            migrate(cur, progress)
+        if version < SCHEMA_VERSION:
+            cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return max(version, SCHEMA_VERSION)
 
 
 # Hàm thêm thu nhập: nếu tháng đó đã có, thì cộng dồn thêm.
@@ -58,60 +778,84 @@ def init_db():
 def add_income(month: str, amount: float):
     """
     Nếu cùng tháng đã có, cộng dồn; ngược lại insert.
+    Cộng dồn bằng một câu UPSERT (amount = amount + excluded.amount) ngay trong SQLite: không
+    đọc số cũ lên Python rồi ghi đè, nên hai tiến trình cùng cộng vào một tháng không làm
+    mất phần của nhau. Trả về tổng thu nhập mới của tháng.
     """
-    conn = get_conn()
-    try:
+    key = month_key(month)
+    month = f"{key % 100:02d}-{key // 100}"  # lưu dạng chuẩn: "3-2024" -> "03-2024"
+    # transaction(): BEGIN IMMEDIATE giữ khóa ghi tới khi commit (hoặc nhập vào giao dịch ngoài)
+    with transaction() as conn:
         cur = conn.cursor()
+        # Chỉ để báo đúng loại sự kiện (dòng mới / cộng dồn); khóa ghi đã giữ nên không bị xen ngang
+        cur.execute("SELECT 1 FROM incomes WHERE month_key = ?", (key,))
+        existed = cur.fetchone() is not None
+        # Khóa trùng là month_key (index UNIQUE, xem _migrate_unique_income_month): mỗi tháng một dòng
+        cur.execute("""
+            INSERT INTO incomes (month, amount, month_key) VALUES (?, ?, ?)
+            ON CONFLICT (month_key) DO UPDATE SET amount = amount + excluded.amount
+            RETURNING amount
+        """, (month, float(amount), key))
+        new_amount = float(cur.fetchone()[0])
 
-        # Kiểm tra xem tháng đó đã tồn tại chưa
-        cur.execute("SELECT amount FROM incomes WHERE month = ?", (month,))
-        row = cur.fetchone()
-
-        if row:
-            # Nếu có rồi -> cộng thêm số mới
-            new_amount = float(row[0]) + float(amount)
-            cur.execute("UPDATE incomes SET amount = ? WHERE month = ?", (new_amount, month))
-        else:
-            # Nếu chưa có -> thêm dòng mới
-            cur.execute("INSERT INTO incomes (month, amount) VALUES (?, ?)", (month, float(amount)))
-
-        conn.commit()
-    finally:
-        # finally đảm bảo kết nối luôn được đóng, kể cả khi lỗi
-        conn.close()
+    # Đã commit (hoặc được giữ tới khi giao dịch ngoài commit): báo dòng thu nhập (xem su_kien)
+    import su_kien
+    su_kien.publish(su_kien.INCOMES, su_kien.UPDATE if existed else su_kien.INSERT,
+                    [{"month": month, "month_key": key, "amount": new_amount}])
+    return new_amount
 
 
 # Lấy số thu nhập theo tháng (định dạng MM-YYYY)
 def get_income_for_month(month: str) -> float:
-    conn = get_conn()
+    # So theo month_key (YYYYMM) chứ không theo chuỗi: "3-2024" và "03-2024" là cùng một tháng
     try:
-        cur = conn.cursor()
-        cur.execute("SELECT amount FROM incomes WHERE month = ?", (month,))
-        row = cur.fetchone()
-        # Nếu có kết quả thì trả về float, nếu không có thì trả về 0.0
-        return float(row[0]) if row and row[0] is not None else 0.0
-    finally:
-        conn.close()
+        key = month_key(month)
+    except (ValueError, AttributeError):
+        return 0.0
+    cur = get_conn().cursor()
+    cur.execute("SELECT SUM(amount) FROM incomes WHERE month_key = ?", (key,))
+    row = cur.fetchone()
+    # Nếu có kết quả thì trả về float, nếu không có thì trả về 0.0
+    return float(row[0]) if row and row[0] is not None else 0.0
 
 
 # Lấy toàn bộ danh sách thu nhập, sắp xếp giảm dần theo năm và tháng.
 def get_all_incomes():
     """
     Trả về list of (month, amount) sắp xếp theo năm-desc, tháng-desc.
-    month lưu là MM-YYYY.
+    month lưu là MM-YYYY, month_key là YYYYMM.
     """
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        # substr(month,4,4) -> lấy phần năm (YYYY)
-        # substr(month,1,2) -> lấy phần tháng (MM)
-        # ORDER BY ... DESC -> sắp xếp mới nhất lên đầu
-        cur.execute("""
-            SELECT month, amount
-            FROM incomes
-            ORDER BY substr(month,4,4) DESC, substr(month,1,2) DESC
-        """)
-        rows = cur.fetchall()
-        return rows
-    finally:
-        conn.close()
+    cur = get_conn().cursor()
+    # month_key = YYYYMM -> sắp xếp giảm dần là mới nhất lên đầu
+    cur.execute("""
+        SELECT month, amount
+        FROM incomes
+        ORDER BY month_key DESC
+    """)
+    return cur.fetchall()
+
+
+# Một trang thu nhập (mới nhất trước), phân trang theo month_key giống chi_tieu.get_expense_page.
+def get_income_page(after=None, before=None, offset=0, limit=50):
+    """
+    Trả về list of (month_key, month, amount).
+    after / before là month_key của dòng mốc; không có mốc thì dùng offset.
+    """
+    cur = get_conn().cursor()
+    if after is not None:
+        cur.execute("SELECT month_key, month, amount FROM incomes WHERE month_key < ? "
+                    "ORDER BY month_key DESC LIMIT ?", (after, limit))
+        return cur.fetchall()
+    if before is not None:
+        cur.execute("SELECT month_key, month, amount FROM incomes WHERE month_key > ? "
+                    "ORDER BY month_key ASC LIMIT ?", (before, limit))
+        return cur.fetchall()[::-1]
+    cur.execute("SELECT month_key, month, amount FROM incomes ORDER BY month_key DESC LIMIT ? OFFSET ?",
+                (limit, offset))
+    return cur.fetchall()
+
+
+def count_incomes() -> int:
+    cur = get_conn().cursor()
+    cur.execute("SELECT COUNT(*) FROM incomes")
+    return cur.fetchone()[0]
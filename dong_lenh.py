@@ -0,0 +1,482 @@
+import argparse
+import sys
+
+import database
+
+# Giao diện dòng lệnh (không cần Tkinter), ví dụ:
+#     python dong_lenh.py import sao_ke_2025.csv
+#     python dong_lenh.py summary --month 11-2025
+#     python main.py add 15-11-2025 "Ăn uống" 45000 --desc "Cơm trưa"
+# Các module nặng (openpyxl, tkinter, csv, json...) chỉ được import bên trong lệnh cần
+# đến chúng, để các lệnh đọc nhanh như summary khởi động trong vài chục ms (chạy cron).
+
+
+def _print_alerts(alerts):
+    import ngan_sach
+
+    for alert in alerts:
+        print("⚠️ " + ngan_sach.format_alert(alert))
+
+
+def cmd_add(args):
+    import chi_tieu
+    import danh_muc
+
+    cid = danh_muc.get_category_id_by_name(args.category)
+    if cid is None:
+        if not args.create_category:
+            print(f"Không có danh mục '{args.category}' (thêm --create-category để tạo mới).", file=sys.stderr)
+            return 2
+        danh_muc.add_category(args.category)
+        cid = danh_muc.get_category_id_by_name(args.category)
+    try:
+        alerts = chi_tieu.add_expense(args.date, cid, args.desc, args.amount, check_budget=False)
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    print(f"Đã thêm: {args.date} | {args.category} | {args.desc} | {args.amount:,.0f} VND")
+    _print_alerts(alerts)
+    return 0
+
+
+def cmd_list(args):
+    import chi_tieu
+
+    limit = args.limit or None
+    out = None
+    if args.csv:
+        import csv
+        out = csv.writer(sys.stdout)
+        out.writerow(["Ngày", "Danh mục", "Mô tả", "Số tiền"])
+    from itertools import islice
+
+    shown = 0
+    # Duyệt thẳng từ cursor (iter_expenses) để không nạp cả bảng vào RAM khi liệt kê tất cả
+    for e in islice(chi_tieu.iter_expenses(month=args.month, category=args.category), limit):
+        if out:
+            out.writerow([e.date, e.category, e.description, e.amount])
+        else:
+            print(f"{e.date}  {e.category:<16} {e.amount:>14,.0f}  {e.description}")
+        shown += 1
+    if not out:
+        count, total = chi_tieu.count_expenses(month=args.month, category=args.category)
+        print(f"-- {shown:,} / {count:,} khoản, tổng {total:,.0f} VND")
+    return 0
+
+
+def cmd_summary(args):
+    import chi_tieu
+    import ngan_sach
+
+    month = args.month or _current_month()
+    try:
+        key = database.month_key(month)
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    month = f"{key % 100:02d}-{key // 100}"  # --month 3-2024 -> 03-2024
+    income = database.get_income_for_month(month)
+    count, spent = chi_tieu.count_expenses(month=month)
+    by_cat = chi_tieu.get_expense_summary_by_category_month(month)
+    alerts = ngan_sach.check_month(month, notify=False)
+    if args.json:
+        import json
+        print(json.dumps({"month": month, "income": income, "spent": spent, "balance": income - spent,
+                          "count": count, "by_category": dict(by_cat),
+                          "alerts": [a._asdict() for a in alerts]}, ensure_ascii=False))
+        return 0
+    print(f"Tháng {month}")
+    print(f"  Thu nhập : {income:>16,.0f} VND")
+    print(f"  Đã chi   : {spent:>16,.0f} VND" + (f" ({spent / income:.0%})" if income > 0 else ""))
+    print(f"  Số dư    : {income - spent:>16,.0f} VND")
+    print(f"  Số khoản : {count:>16,}")
+    for name, total in by_cat:
+        print(f"    {name:<18}{total:>16,.0f}" + (f"  {total / spent:>4.0%}" if spent else ""))
+    _print_alerts(alerts)
+    return 0
+
+
+def cmd_trend(args):
+    import chi_tieu
+
+    end = args.end or _current_month()
+    try:
+        start = args.start or database.shift_month(end, -(args.months - 1))
+        if args.category:
+            rows = chi_tieu.get_category_monthly_series(start, end, args.category)
+        else:
+            rows = chi_tieu.get_monthly_series(start, end, carry_over=args.carry_over)
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    if args.json:
+        import json
+        keys = (("category", "month", "spent", "count", "change") if args.category else
+                ("month", "income", "spent", "count", "balance", "cumulative"))
+        print(json.dumps([dict(zip(keys, r)) for r in rows], ensure_ascii=False))
+        return 0
+    if args.category:
+        print(f"{'tháng':<10}{'chi tiêu':>16}{'số khoản':>10}{'so với tháng trước':>20}")
+        for _cat, month, spent, count, change in rows:
+            print(f"{month:<10}{spent:>16,.0f}{count:>10,}" + (f"{change:>+20,.0f}" if change is not None else ""))
+    else:
+        print(f"{'tháng':<10}{'thu nhập':>16}{'chi tiêu':>16}{'số dư':>16}{'lũy kế':>16}")
+        for month, income, spent, _count, balance, cumulative in rows:
+            print(f"{month:<10}{income:>16,.0f}{spent:>16,.0f}{balance:>16,.0f}{cumulative:>16,.0f}")
+    return 0
+
+
+def cmd_analyze(args):
+    import phan_tich  # NumPy chỉ được nạp cho lệnh này
+
+    try:
+        phan_tich.refresh()
+        kw = {"start": args.start, "end": args.end}
+        by = phan_tich.totals_by(args.by, category=args.category, **kw)
+        top = phan_tich.top_days(args.top, category=args.category, **kw)
+        rolling = phan_tich.rolling_averages((7, 30), category=args.category, **kw)
+        pct = phan_tich.category_percentiles((50, 90, 99), **kw)
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    print(f"Tổng chi theo {args.by}:")
+    for label, total, count in by:
+        print(f"  {label!s:<14}{total:>18,.0f}{count:>10,} khoản")
+    for window, series in rolling.items():
+        if len(series.days) and series.mean[-1] == series.mean[-1]:  # NaN khi chưa đủ số ngày
+            print(f"Trung bình {window} ngày tới {phan_tich.day_to_str(series.days[-1])}: {series.mean[-1]:,.0f} VND/ngày")
+    print(f"{args.top} ngày chi nhiều nhất:")
+    for day, total, count in top:
+        print(f"  {day}{total:>18,.0f}{count:>8,} khoản")
+    print(f"{'Phân vị mỗi khoản':<20}{'số khoản':>10}{'p50':>12}{'p90':>12}{'p99':>12}")
+    for name, (count, values) in pct.items():
+        print(f"  {name:<18}{count:>10,}" + "".join(f"{v:>12,.0f}" for v in values))
+    return 0
+
+
+def cmd_export(args):
+    import xuat_excel  # nạp openpyxl chỉ khi thật sự xuất file
+
+    try:
+        if args.year:
+            path = xuat_excel.export_year_to_excel(args.year, save_path=args.out)
+        elif args.start:
+            path = xuat_excel.export_range_to_excel(args.start, args.end, save_path=args.out)
+        else:
+            print("Cần tháng bắt đầu (MM-YYYY) hoặc --year.", file=sys.stderr)
+            return 2
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 1
+    print(f"Đã xuất {path}")
+    return 0
+
+
+def cmd_export_all(args):
+    import os
+    import time
+    import xuat_excel
+
+    try:
+        if args.year:
+            months = xuat_excel.months_with_data(f"01-{args.year}", f"12-{args.year}")
+        else:
+            months = xuat_excel.months_with_data(args.start, args.end)
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    if not months:
+        print("Không có tháng nào có dữ liệu.", file=sys.stderr)
+        return 1
+
+    def show(res, done, total):
+        print(f"[{done}/{total}] {res.month}  {res.rows:>9,} dòng  {res.seconds:>7.2f}s "
+              f"(CPU {res.cpu_seconds:.2f}s)  {res.path}")
+
+    t0 = time.perf_counter()
+    results = xuat_excel.export_months(months, out_dir=args.out_dir, workers=args.workers, progress=show)
+    wall = time.perf_counter() - t0
+    busy = sum(r.seconds for r in results)
+    cpu = sum(r.cpu_seconds for r in results)
+    print(f"Đã xuất {len(results)} file, {sum(r.rows for r in results):,} dòng trong {wall:.2f}s "
+          f"(tổng thời gian từng file {busy:.2f}s, CPU {cpu:.2f}s)")
+    # Tổng thời gian từng file ~ thời gian chạy tuần tự, chỉ đúng khi mỗi tiến trình có lõi riêng
+    workers = args.workers or os.cpu_count() or 1
+    if 1 < min(workers, len(results)) <= (os.cpu_count() or 1) and wall:
+        print(f"Nhanh gấp {busy / wall:.1f} lần chạy tuần tự với {min(workers, len(results))} tiến trình")
+    return 0
+
+
+def _current_month():
+    from datetime import date
+    return date.today().strftime("%m-%Y")
+
+
+def cmd_import(args):
+    import nhap_lieu
+    import ngan_sach
+
+    stats = nhap_lieu.import_file(args.file, batch_size=args.batch_size,
+                                  create_categories=not args.no_new_categories,
+                                  check_budget=False)
+    rate = stats["read"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"Đã đọc {stats['read']:,} dòng trong {stats['seconds']:.2f}s ({rate:,.0f} dòng/s)")
+    print(f"  Thêm mới: {stats['inserted']:,} | Trùng (bỏ qua): {stats['duplicates']:,} "
+          f"| Không hợp lệ: {stats['invalid']:,}")
+    if stats["new_categories"]:
+        print("  Danh mục mới: " + ", ".join(stats["new_categories"]))
+    for err in stats["errors"]:
+        print("  " + err, file=sys.stderr)
+
+    # Cảnh báo ngân sách: một lần cho mỗi tháng bị ảnh hưởng, in ra thay vì hộp thoại
+    if stats["inserted"]:
+        _print_alerts(ngan_sach.check_months(stats["months"], notify=False))
+    return 0
+
+
+def cmd_budget(args):
+    import ngan_sach
+
+    try:
+        if args.action == "set":
+            ngan_sach.set_budget(limit_amount=args.amount, ratio=args.ratio,
+                                 category=args.category, month=args.month)
+        elif args.action == "remove":
+            if not ngan_sach.remove_budget(category=args.category, month=args.month):
+                print("Không có hạn mức này.", file=sys.stderr)
+                return 1
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    for b in ngan_sach.get_budgets():
+        limit = f"{b['limit_amount']:,.0f} VND" if b["limit_amount"] is not None else f"{b['limit_ratio']:.0%} thu nhập"
+        print(f"{b['category'] or 'Tổng chi':<20} {b['month'] or 'mọi tháng':<10} {limit}")
+    if args.month:
+        _print_alerts(ngan_sach.check_month(args.month, notify=False))
+    return 0
+
+
+def cmd_check_totals(args):
+    import chi_tieu
+
+    diffs = chi_tieu.check_month_totals()
+    if not diffs:
+        print("Bảng tổng hợp tháng x danh mục khớp với dữ liệu chi tiêu.")
+    for mk, cid, (exp_total, exp_cnt), (act_total, act_cnt) in diffs[:50]:
+        print(f"  Lệch {mk % 100:02d}-{mk // 100} / danh mục {cid}: "
+              f"đúng {exp_total:,.0f} ({exp_cnt}) - bảng {act_total:,.0f} ({act_cnt})")
+    if diffs and args.rebuild:
+        n = chi_tieu.rebuild_month_totals()
+        print(f"Đã tính lại bảng tổng hợp ({n} ô).")
+        return 0
+    return 1 if diffs else 0
+
+
+def cmd_archive(args):
+    import luu_tru
+
+    try:
+        if args.year is not None:
+            res = luu_tru.archive_year(args.year, vacuum=args.vacuum)
+            print(f"Đã lưu trữ năm {res['year']}: {res['rows']:,} khoản, {res['total']:,.0f} VND "
+                  f"-> {res['path']} ({res['seconds']:.2f}s)")
+        elif args.restore is not None:
+            res = luu_tru.restore_year(args.restore)
+            print(f"Đã đưa {res['rows']:,} khoản năm {res['year']} về DB chính ({res['seconds']:.2f}s)")
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+    archives = luu_tru.list_archives()
+    if not archives:
+        print("Chưa có năm nào được lưu trữ.")
+    for a in archives:
+        size = f"{a['size'] / 1e6:,.1f} MB" if a["size"] is not None else "MẤT FILE"
+        print(f"{a['year']}  {a['rows']:>10,} khoản  {a['total']:>18,.0f} VND  {size:>10}  {a['path']}")
+    return 0
+
+
+def cmd_backup(args):
+    import sao_luu
+
+    if args.list:
+        snaps = sao_luu.list_snapshots(args.dir)
+        if not snaps:
+            print("Chưa có bản sao lưu nào.")
+        for s in snaps:
+            print(f"{s['name']:<20}{s['bytes'] / 1e6:>10,.1f} MB  {len(s['files'])} file  {s['path']}")
+        return 0
+
+    def show(done, total):
+        print(f"\r  {done:,}/{total:,} trang", end="", file=sys.stderr, flush=True)
+
+    options = {"compact": args.compact, "verify": not args.no_verify, "pages": args.pages,
+               "pause_ms": args.pause_ms, "progress": show if sys.stderr.isatty() else None}
+    try:
+        if args.if_older is not None:
+            res = sao_luu.snapshot_if_due(args.if_older, args.keep, args.dir, **options)
+            if res is None:
+                print(f"Bản sao lưu gần nhất chưa cũ hơn {args.if_older:g} giờ, không sao lưu.")
+                return 0
+        else:
+            res = sao_luu.snapshot(args.dir, **options)
+            res["pruned"] = sao_luu.prune(args.keep, args.dir) if args.keep else []
+    except RuntimeError as e:
+        print(f"\nLỗi: {e}", file=sys.stderr)
+        return 1
+    if options["progress"]:
+        print(file=sys.stderr)
+    print(f"Đã sao lưu {len(res['files'])} file, {res['bytes'] / 1e6:,.1f} MB trong {res['seconds']:.2f}s "
+          f"({res['mb_s']:,.1f} MB/s{', VACUUM INTO' if res['compact'] else ''}) -> {res['path']}")
+    print(f"  integrity_check: {res['integrity']}"
+          + (f", chép lại {res['restarts']} lần do có ghi đồng thời" if res["restarts"] else ""))
+    for path in res["pruned"]:
+        print(f"  Đã xóa bản cũ: {path}")
+    return 0
+
+
+def cmd_serve(args):
+    import may_chu
+
+    server = may_chu.LedgerServer(args.host, args.port, workers=args.workers,
+                                  cache_bytes=int(args.cache_mb * (1 << 20)), verbose=args.verbose)
+    host, port = server.address
+    print(f"Đang phục vụ JSON tại http://{host}:{port}/api/ ({args.workers} luồng đọc) - Ctrl+C để dừng")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="main.py", description="Quản lý chi tiêu - dòng lệnh")
+    ap.add_argument("--db", help="dùng file DB khác thay cho QL_Chi_Tieu.db")
+    ap.add_argument("--profile", action="store_true",
+                    help="đo mọi câu lệnh SQL và in báo cáo ra stderr (hoặc đặt QLCT_PROFILE=1)")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("add", help="thêm một khoản chi")
+    p.add_argument("date", help="DD-MM-YYYY")
+    p.add_argument("category", help="tên danh mục")
+    p.add_argument("amount", type=float, help="số tiền (VND)")
+    p.add_argument("--desc", default="", help="mô tả")
+    p.add_argument("--create-category", action="store_true", help="tạo danh mục nếu chưa có")
+    p.set_defaults(func=cmd_add)
+
+    p = sub.add_parser("list", help="liệt kê chi tiêu (mới nhất trước)")
+    p.add_argument("--month", help="MM-YYYY")
+    p.add_argument("--category", help="tên danh mục")
+    p.add_argument("--limit", type=int, default=50, help="số dòng tối đa (0 = tất cả)")
+    p.add_argument("--csv", action="store_true", help="in dạng CSV")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("summary", help="tổng hợp thu/chi một tháng")
+    p.add_argument("--month", help="MM-YYYY (mặc định: tháng hiện tại)")
+    p.add_argument("--json", action="store_true", help="in dạng JSON")
+    p.set_defaults(func=cmd_summary)
+
+    p = sub.add_parser("trend", help="thu/chi/số dư từng tháng trong một khoảng (hoặc chi của một danh mục)")
+    p.add_argument("--start", help="tháng bắt đầu MM-YYYY (mặc định: --months tháng tính tới --end)")
+    p.add_argument("--end", help="tháng kết thúc MM-YYYY (mặc định: tháng hiện tại)")
+    p.add_argument("--months", type=int, default=12, help="số tháng khi không có --start")
+    p.add_argument("--category", help="chỉ chuỗi chi tiêu của danh mục này")
+    p.add_argument("--carry-over", action="store_true", help="số dư lũy kế tính cả các tháng trước --start")
+    p.add_argument("--json", action="store_true", help="in dạng JSON")
+    p.set_defaults(func=cmd_trend)
+
+    p = sub.add_parser("analyze", help="phân tích bằng NumPy: gộp nhóm, trung bình 7/30 ngày, top ngày, phân vị")
+    p.add_argument("--start", help="từ ngày DD-MM-YYYY")
+    p.add_argument("--end", help="tới ngày DD-MM-YYYY")
+    p.add_argument("--category", help="chỉ tính danh mục này (trừ phần phân vị)")
+    p.add_argument("--by", choices=("day", "month", "year", "weekday", "category"), default="month")
+    p.add_argument("--top", type=int, default=10, help="số ngày chi nhiều nhất cần in")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("export", help="xuất Excel một tháng / khoảng tháng / cả năm")
+    p.add_argument("start", nargs="?", help="tháng bắt đầu MM-YYYY")
+    p.add_argument("end", nargs="?", help="tháng kết thúc MM-YYYY (mặc định = tháng bắt đầu)")
+    p.add_argument("--year", type=int, help="xuất cả năm")
+    p.add_argument("--out", help="đường dẫn file (mặc định: thư mục chương trình)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("export-all", help="xuất mỗi tháng có dữ liệu ra một file, song song nhiều tiến trình")
+    p.add_argument("--start", help="tháng bắt đầu MM-YYYY (mặc định: mọi tháng)")
+    p.add_argument("--end", help="tháng kết thúc MM-YYYY (mặc định = tháng bắt đầu)")
+    p.add_argument("--year", type=int, help="chỉ xuất các tháng của năm này")
+    p.add_argument("--out-dir", help="thư mục chứa file (mặc định: thư mục chương trình)")
+    p.add_argument("--workers", type=int, help="số tiến trình (mặc định: số CPU)")
+    p.set_defaults(func=cmd_export_all)
+
+    p = sub.add_parser("import", help="nhập chi tiêu hàng loạt từ file CSV/XLSX")
+    p.add_argument("file", help="đường dẫn file .csv hoặc .xlsx")
+    p.add_argument("--batch-size", type=int, default=10000, help="số dòng mỗi lô executemany")
+    p.add_argument("--no-new-categories", action="store_true",
+                   help="không tạo danh mục mới, dồn danh mục lạ vào 'Khác'")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("budget", help="xem / đặt / xóa hạn mức chi tiêu")
+    p.add_argument("action", choices=("list", "set", "remove"))
+    p.add_argument("--category", help="tên danh mục (bỏ trống: tổng chi cả tháng)")
+    p.add_argument("--month", help="MM-YYYY (bỏ trống: áp dụng mọi tháng)")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--amount", type=float, help="hạn mức tuyệt đối (VND)")
+    g.add_argument("--ratio", type=float, help="hạn mức theo tỉ lệ thu nhập, vd 0.8")
+    p.set_defaults(func=cmd_budget)
+
+    p = sub.add_parser("archive", help="chuyển chi tiêu của năm cũ sang file lưu trữ riêng / xem các năm đã lưu trữ")
+    g = p.add_mutually_exclusive_group()
+    g.add_argument("--year", type=int, help="năm cần lưu trữ (phải là năm đã kết thúc)")
+    g.add_argument("--restore", type=int, help="đưa năm đã lưu trữ trở lại DB chính")
+    p.add_argument("--vacuum", action="store_true", help="VACUUM DB chính sau khi lưu trữ để file nhỏ lại")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("backup", help="sao lưu DB (kể cả file năm lưu trữ) khi chương trình vẫn đang chạy")
+    p.add_argument("--dir", help="thư mục chứa các bản sao lưu (mặc định <tên DB>-sao_luu)")
+    p.add_argument("--compact", action="store_true", help="dùng VACUUM INTO: bản sao lưu dồn gọn, nhỏ hơn")
+    p.add_argument("--keep", type=int, default=7, help="chỉ giữ N bản mới nhất (0 = không xóa bản cũ)")
+    p.add_argument("--if-older", type=float, metavar="GIỜ",
+                   help="chỉ sao lưu nếu bản gần nhất cũ hơn số giờ này (chạy định kỳ bằng cron)")
+    p.add_argument("--pages", type=int, default=256, help="số trang chép mỗi đợt")
+    p.add_argument("--pause-ms", type=float, default=5, help="nghỉ giữa hai đợt chép")
+    p.add_argument("--no-verify", action="store_true", help="bỏ qua PRAGMA integrity_check")
+    p.add_argument("--list", action="store_true", help="liệt kê các bản sao lưu")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("serve", help="máy chủ HTTP/JSON cục bộ cho công cụ khác đọc số liệu")
+    p.add_argument("--host", default="127.0.0.1", help="địa chỉ lắng nghe (mặc định chỉ máy này)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=4, help="số luồng / kết nối SQLite đọc")
+    p.add_argument("--cache-mb", type=float, default=32, help="dung lượng bộ đệm phản hồi (0 = tắt)")
+    p.add_argument("--verbose", action="store_true", help="in từng yêu cầu ra stderr")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("check-totals", help="kiểm tra bảng tổng hợp tháng x danh mục")
+    p.add_argument("--rebuild", action="store_true", help="tính lại bảng nếu phát hiện lệch")
+    p.set_defaults(func=cmd_check_totals)
+    return ap
+
+
+def main(argv=None):
+    import chan_doan
+
+    args = build_parser().parse_args(argv)
+    if args.profile:
+        chan_doan.enable()
+    else:
+        chan_doan.enable_from_env()
+    if args.db:
+        database.set_db_path(args.db)
+    try:
+        with chan_doan.action(args.command):
+            database.init_db(progress=database.print_progress)
+            return args.func(args)
+    finally:
+        if chan_doan.enabled():
+            print(chan_doan.report(), file=sys.stderr)
+        database.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
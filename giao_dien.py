@@ -7,7 +7,12 @@ import re
 import database
 import danh_muc
 import chi_tieu
-import xuat_excel
+import ngan_sach
+import chan_doan
+import su_kien
+import sao_luu
+from bang_ao import VirtualTreeview
+from tac_vu import BackgroundExecutor
 
 # HÀM TIỆN ÍCH KIỂM TRA VÀ XỬ LÝ CHUỖI
 def valid_month_format(s: str) -> bool:
@@ -18,11 +23,7 @@ def valid_month_format(s: str) -> bool:
 def current_month_str() -> str:
     return datetime.now().strftime("%m-%Y")
 
-def safe_export_to_excel(month: str):
-    try:
-        return xuat_excel.export_to_excel(month)
-    except TypeError:
-        return xuat_excel.export_to_excel()
+TREND_MONTHS = 12  # chế độ 'Xu hướng': số tháng tính tới tháng đang nhập
 
 # GIAO DIỆN CHÍNH CỦA ỨNG DỤNG
 def open_giao_dien():
@@ -33,6 +34,24 @@ def open_giao_dien():
     root.minsize(980, 620)         # Giới hạn thu nhỏ
     root.configure(bg="#1e1e1e")   # Màu nền tối để dễ nhìn
 
+    # Truy vấn SQLite / ghi file Excel chạy trên luồng nền, kết quả trả về qua root.after
+    executor = BackgroundExecutor(root)
+    # Cảnh báo ngân sách được tính ở luồng nền rồi hiển thị bằng hộp thoại trên luồng Tk
+    budget_notifier = ngan_sach.TkNotifier()
+    # Gộp các lần làm mới dồn dập (nhiều sự kiện liên tiếp) thành một lần
+    debouncer = su_kien.Debouncer(root)
+    # Tự sao lưu DB mỗi ngày trên luồng riêng (không chiếm luồng nền của các truy vấn)
+    backups = sao_luu.SnapshotScheduler().start()
+
+    def on_close():
+        events.close()
+        debouncer.cancel()
+        executor.shutdown()
+        backups.stop()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
     # 2. ĐỊNH NGHĨA MÀU SẮC & STYLE CHUNG
     BG = "#1e1e1e"
     FG = "#f4f4f4"
@@ -96,16 +115,18 @@ def open_giao_dien():
         except Exception:
             messagebox.showerror("Lỗi", "Số tiền không hợp lệ.")
             return
-        try:
-            database.add_income(m, v)  # gọi hàm trong database.py
-        except Exception as e:
+
+        def done(_):
+            messagebox.showinfo("Thành công", f"Đã lưu/cộng dồn thu nhập tháng {m}.")
+            income_e.delete(0, tk.END)
+            # Bảng thu nhập và nhãn tổng tháng được cập nhật qua sự kiện (xem on_data_events)
+
+        def failed(e):
             print("Lỗi khi lưu thu nhập:", e)
             messagebox.showerror("Lỗi", "Không lưu được thu nhập.")
-            return
-        messagebox.showinfo("Thành công", f"Đã lưu/cộng dồn thu nhập tháng {m}.")
-        income_e.delete(0, tk.END)
-        load_incomes()
-        refresh_if_stats_visible()
+
+        # Ghi DB trên luồng nền như save_expense: luồng Tk không phải chờ khóa ghi / commit
+        executor.submit(database.add_income, m, v, on_done=done, on_error=failed)
 
     ttk.Button(tab_income, text="💾 Lưu thu nhập", command=save_income).grid(row=2, column=1, pady=8, sticky="w")
 
@@ -115,14 +136,18 @@ def open_giao_dien():
     income_tree.heading("Số tiền", text="Số tiền (VND)")
     income_tree.column("Tháng", width=140, anchor="center")
     income_tree.column("Số tiền", width=240, anchor="e")
-    income_tree.grid(row=3, column=0, columnspan=3, padx=12, pady=10, sticky="nsew")
+    income_tree.grid(row=3, column=0, columnspan=3, padx=(12, 0), pady=10, sticky="nsew")
+    income_scroll = ttk.Scrollbar(tab_income, orient="vertical")
+    income_scroll.grid(row=3, column=3, pady=10, sticky="ns")
+    # Bảng ảo: chỉ lấy các tháng đang hiển thị, phân trang theo month_key
+    income_view = VirtualTreeview(income_tree, income_scroll)
 
     # Hàm tải dữ liệu thu nhập lên bảng
     def load_incomes():
-        income_tree.delete(*income_tree.get_children())
         try:
-            for m, a in database.get_all_incomes():
-                income_tree.insert("", "end", values=(m, f"{float(a):,.0f}"))
+            income_view.set_source(database.get_income_page, database.count_incomes,
+                                   key=lambda r: r[0],
+                                   format_row=lambda i, r: (r[1], f"{float(r[2]):,.0f}"))
         except Exception as e:
             print("Lỗi load_incomes:", e)
 
@@ -175,15 +200,23 @@ def open_giao_dien():
             messagebox.showerror("Lỗi", "Số tiền không hợp lệ!")
             return
         date = date_e.get().strip()
-        try:
-            chi_tieu.add_expense(date, cid, desc, val)
-        except ValueError as ve:
-            messagebox.showerror("Lỗi", str(ve))
-            return
-        messagebox.showinfo("Thành công", "Đã thêm chi tiêu!")
-        desc_e.delete(0, tk.END)
-        amt_e.delete(0, tk.END)
-        refresh_if_stats_visible()
+
+        def done(alerts):
+            budget_notifier.notify(alerts)
+            messagebox.showinfo("Thành công", "Đã thêm chi tiêu!")
+            desc_e.delete(0, tk.END)
+            amt_e.delete(0, tk.END)
+
+        def failed(e):
+            if isinstance(e, ValueError):
+                messagebox.showerror("Lỗi", str(e))
+            else:
+                print("Lỗi khi lưu chi tiêu:", e)
+                messagebox.showerror("Lỗi", "Không lưu được chi tiêu.")
+
+        # Chạy trên luồng nền: ghi DB, trả về các cảnh báo ngân sách (không mở hộp thoại ở đó)
+        executor.submit(chi_tieu.add_expense, date, cid, desc, val, check_budget=False,
+                        on_done=done, on_error=failed)
 
     ttk.Button(tab_exp, text="💾 Lưu", command=save_expense).grid(row=4, column=1, padx=8, pady=10, sticky="w")
 
@@ -202,14 +235,20 @@ def open_giao_dien():
         if not nm:
             messagebox.showerror("Lỗi", "Tên danh mục không được trống!")
             return
-        ok = danh_muc.add_category(nm)
-        if ok:
-            messagebox.showinfo("Thành công", f"Đã thêm danh mục '{nm}'!")
-            new_cat_entry.delete(0, tk.END)
-            load_categories()
-            refresh_cat_cb()
-        else:
-            messagebox.showwarning("Lỗi", "Không thể thêm (có thể đã tồn tại).")
+
+        def done(ok):
+            if ok:
+                messagebox.showinfo("Thành công", f"Đã thêm danh mục '{nm}'!")
+                new_cat_entry.delete(0, tk.END)
+            else:
+                messagebox.showwarning("Lỗi", "Không thể thêm (có thể đã tồn tại).")
+
+        def failed(e):
+            print("Lỗi khi thêm danh mục:", e)
+            messagebox.showerror("Lỗi", "Không thêm được danh mục.")
+
+        # Bảng danh mục và các combobox được cập nhật qua sự kiện (xem apply_category_event)
+        executor.submit(danh_muc.add_category, nm, on_done=done, on_error=failed)
 
     ttk.Button(tab_cat, text="➕ Thêm danh mục", command=add_category).pack(pady=6)
 
@@ -222,11 +261,29 @@ def open_giao_dien():
     cat_tree.pack(padx=10, pady=10, fill="both", expand=True)
 
     def load_categories():
-        """Nạp lại danh sách danh mục."""
+        """Nạp lại danh sách danh mục (iid của mỗi dòng là id danh mục)."""
         cat_tree.delete(*cat_tree.get_children())
         cats = danh_muc.get_all_categories()
         for idx, c in enumerate(cats, start=1):
-            cat_tree.insert("", "end", values=(idx, c["name"]))
+            cat_tree.insert("", "end", iid=str(c["id"]), values=(idx, c["name"]))
+
+    def apply_category_event(ev):
+        """Thêm / bỏ đúng dòng bị ảnh hưởng; khi xóa chỉ đánh lại STT các dòng phía sau."""
+        if ev.action == su_kien.INSERT:
+            for c in ev.rows:
+                if not cat_tree.exists(str(c["id"])):
+                    n = len(cat_tree.get_children())
+                    cat_tree.insert("", "end", iid=str(c["id"]), values=(n + 1, c["name"]))
+        elif ev.action == su_kien.DELETE:
+            for c in ev.rows:
+                iid = str(c["id"])
+                if cat_tree.exists(iid):
+                    idx = cat_tree.index(iid)
+                    cat_tree.delete(iid)
+                    for pos, child in enumerate(cat_tree.get_children()[idx:], start=idx + 1):
+                        cat_tree.item(child, values=(pos, cat_tree.item(child, "values")[1]))
+        else:
+            load_categories()
 
     # Xóa danh mục
     def delete_selected_category():
@@ -235,28 +292,45 @@ def open_giao_dien():
             messagebox.showerror("Lỗi", "Vui lòng chọn danh mục để xóa!")
             return
         cat_name = cat_tree.item(sel[0], "values")[1]
-        if messagebox.askyesno("Xác nhận", f"Bạn có chắc muốn xóa danh mục '{cat_name}'?"):
-            if danh_muc.delete_category_by_name(cat_name):
+        if cat_name == "Khác":
+            messagebox.showwarning("Chú ý", "Không thể xóa 'Khác': khoản chi của danh mục bị xóa được chuyển vào đây.")
+            return
+        if not messagebox.askyesno("Xác nhận", f"Bạn có chắc muốn xóa danh mục '{cat_name}'?"):
+            return
+
+        def done(ok):
+            if ok:
                 messagebox.showinfo("Thành công", f"Đã xóa '{cat_name}'.")
-                load_categories()
-                refresh_cat_cb()
             else:
                 messagebox.showerror("Lỗi", "Không thể xóa danh mục (đang được sử dụng).")
 
+        def failed(e):
+            print("Lỗi khi xóa danh mục:", e)
+            messagebox.showerror("Lỗi", "Không xóa được danh mục.")
+
+        # Xóa danh mục chuyển mọi khoản chi của nó sang 'Khác' (cả trong file năm lưu trữ):
+        # có thể lâu với dữ liệu lớn -> chạy trên luồng nền
+        executor.submit(danh_muc.delete_category_by_name, cat_name, on_done=done, on_error=failed)
+
     ttk.Button(tab_cat, text="🗑️ Xóa danh mục đã chọn", command=delete_selected_category).pack(pady=6)
 
     # TAB 4: THỐNG KÊ
     tab_stats = ttk.Frame(notebook)
     notebook.add(tab_stats, text="Thống kê")
-    stats_index = notebook.index("end") - 1
 
     # --- Khu điều khiển ---
     ctrl_top = ttk.Frame(tab_stats)
     ctrl_top.pack(fill="x", padx=10, pady=(8,4))
     ttk.Label(ctrl_top, text="Chế độ:").grid(row=0, column=0, padx=6, sticky="e")
     mode_var = tk.StringVar(value="Theo tháng")
-    mode_cb = ttk.Combobox(ctrl_top, textvariable=mode_var, values=["Theo tháng", "Theo danh mục"], width=20, state="readonly")
+    mode_cb = ttk.Combobox(ctrl_top, textvariable=mode_var, values=["Theo tháng", "Theo danh mục", "Xu hướng"], width=20, state="readonly")
     mode_cb.grid(row=0, column=1, padx=6, sticky="w")
+    # Tìm theo mô tả (FTS5, không phân biệt dấu): lọc thêm theo tháng hoặc danh mục của chế độ đang chọn
+    ttk.Label(ctrl_top, text="Tìm mô tả:").grid(row=0, column=2, padx=6, sticky="e")
+    search_e = ttk.Entry(ctrl_top, width=30)
+    search_e.grid(row=0, column=3, sticky="w")
+    search_e.bind("<Return>", lambda e: search_descriptions())
+    ttk.Button(ctrl_top, text="🔍 Tìm", command=lambda: search_descriptions()).grid(row=0, column=4, padx=6)
 
     # --- Các ô nhập cho thống kê ---
     ctrl_bot = ttk.Frame(tab_stats)
@@ -271,100 +345,196 @@ def open_giao_dien():
 
     # Các nút chức năng
     ttk.Button(ctrl_bot, text="📊 Thống kê", command=lambda: update_stats_display(True)).grid(row=0, column=5, padx=6)
-    ttk.Button(ctrl_bot, text="📈 Xuất Excel", command=lambda: export_excel()).grid(row=0, column=6, padx=6)
+    export_btn = ttk.Button(ctrl_bot, text="📈 Xuất Excel", command=lambda: export_excel())
+    export_btn.grid(row=0, column=6, padx=6)
+    # Thanh báo đang xuất Excel (chỉ hiện khi đang xuất)
+    export_bar = ttk.Progressbar(ctrl_bot, orient="horizontal", length=160, mode="indeterminate")
 
     summary_label = ttk.Label(tab_stats, text="", font=("Segoe UI Semibold", 11))
     summary_label.pack(pady=6)
 
     # Treeview hiển thị kết quả thống kê
     detail_cols = ("STT", "Danh mục", "Mô tả", "Số tiền", "Ngày")
-    detail_tree = ttk.Treeview(tab_stats, columns=detail_cols, show="headings", height=14)
+    detail_frame = ttk.Frame(tab_stats)
+    detail_frame.pack(fill="both", expand=True, padx=8, pady=6)
+    detail_tree = ttk.Treeview(detail_frame, columns=detail_cols, show="headings", height=14)
     for c in detail_cols:
         detail_tree.heading(c, text=c, anchor="center")
         detail_tree.column(c, width=160, anchor="center")
     detail_tree.column("STT", width=60, anchor="center")
     detail_tree.column("Số tiền", anchor="e")
-    detail_tree.pack(fill="both", expand=True, padx=8, pady=6)
+    detail_scroll = ttk.Scrollbar(detail_frame, orient="vertical")
+    detail_scroll.pack(side="right", fill="y")
+    detail_tree.pack(side="left", fill="both", expand=True)
+    # Bảng ảo: chỉ lấy/vẽ các dòng đang nhìn thấy, dù danh mục có hàng chục nghìn khoản chi
+    detail_view = VirtualTreeview(detail_tree, detail_scroll)
+
+    # Bảng thống kê đang hiển thị gì: giúp áp dụng sự kiện thay đổi mà không tính lại tất cả.
+    # kind: 'month' | 'category' | 'all' | 'trend' | 'search' | None
+    shown = {"kind": None}
 
     # HÀM BÊN TRONG TAB THỐNG KÊ
+    def set_detail_headings(texts=detail_cols):
+        """Đổi tiêu đề 5 cột của bảng kết quả (chế độ 'Xu hướng' dùng tiêu đề riêng)."""
+        for col, text in zip(detail_cols, texts):
+            detail_tree.heading(col, text=text)
+
     def clear_detail():
-        detail_tree.delete(*detail_tree.get_children())
+        shown.clear()
+        shown["kind"] = None
+        detail_view.set_rows([], format_row=None)
         summary_label.config(text="")
 
+    def render_summary():
+        """Viết lại nhãn tổng từ các số đang giữ trong shown (tháng hoặc một danh mục)."""
+        if shown["kind"] == "month":
+            inc, spent = shown["inc"], shown["spent"]
+            summary_label.config(text=f"Tháng {shown['month']} | Thu nhập: {inc:,.0f} | Đã chi: {spent:,.0f} "
+                                      f"| Số dư: {inc - spent:,.0f} | Số khoản: {shown['count']:,}")
+        elif shown["kind"] == "category":
+            summary_label.config(text=f"Danh mục '{shown['category']}' - Tổng chi: {shown['spent']:,.0f} VND "
+                                      f"| Số khoản: {shown['count']:,}")
+
+    def show_expenses(month=None, category=None):
+        """Hiển thị danh sách chi tiêu theo bộ lọc qua bảng ảo (phân trang theo date_key, id)."""
+        detail_view.set_source(
+            lambda **kw: chi_tieu.get_expense_page(month=month, category=category, **kw),
+            lambda: chi_tieu.count_expenses(month=month, category=category)[0],
+            key=lambda r: (r[1], r[0]),
+            format_row=lambda i, r: (i + 1, r[2], r[3], f"{r[4]:,.0f}", r[5]))
+
     def update_stats_display(user_pressed=False):
         """
         Cập nhật dữ liệu thống kê:
         - Nếu chế độ 'Theo tháng': hiển thị thu nhập, chi tiêu, số dư
         - Nếu 'Theo danh mục': hiển thị tổng chi từng loại
+        - Nếu 'Xu hướng': thu/chi/số dư từng tháng (hoặc chi của danh mục đang chọn) trong
+          TREND_MONTHS tháng tính tới tháng đang nhập
+        Số liệu được tính trên luồng nền; lần bấm sau hủy lần tính trước còn dang dở.
         """
         mode = mode_var.get()
         month = stats_month_e.get().strip()
         cat = stats_cat_cb.get().strip()
 
+        if mode == "Xu hướng":
+            show_trend(month, cat, user_pressed)
+            return
+        set_detail_headings()
+
         if mode == "Theo tháng":
-            # Gọi database + chi_tieu để lấy dữ liệu tháng đó
-            try:
-                inc = database.get_income_for_month(month)
-                spent = chi_tieu.get_total_expense_by_month(month)
-            except Exception:
-                inc = spent = 0
-            bal = inc - spent
-            summary_label.config(text=f"Tháng {month} | Thu nhập: {inc:,.0f} | Đã chi: {spent:,.0f} | Số dư: {bal:,.0f}")
-
-            detail_tree.delete(*detail_tree.get_children())
-            conn = database.get_conn()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT COALESCE(c.name,'Khác') AS category, e.description, e.amount, e.date
-                FROM expenses e LEFT JOIN categories c ON e.category_id = c.id
-                WHERE substr(e.date,4,7) = ?
-                ORDER BY substr(e.date,7,4) DESC, substr(e.date,4,2) DESC, substr(e.date,1,2) DESC, e.id DESC
-            """, (month,))
-            rows = cur.fetchall()
-            conn.close()
-
-            for i, (category, desc, amt, date) in enumerate(rows, start=1):
-                detail_tree.insert("", "end", values=(i, category, desc, f"{amt:,.0f}", date))
-
-            # Cảnh báo nếu vượt 90%
-            if inc > 0 and spent/inc > 0.9 and user_pressed:
-                messagebox.showwarning("⚠️ Cảnh báo", f"Chi tiêu tháng {month} đã vượt {(spent/inc):.0%} thu nhập!")
+            def load_month():
+                # Gọi database + chi_tieu để lấy dữ liệu tháng đó
+                try:
+                    inc = database.get_income_for_month(month)
+                    spent = chi_tieu.get_total_expense_by_month(month)
+                except Exception:
+                    inc = spent = 0
+                count, _ = chi_tieu.count_expenses(month=month)
+                alerts = (ngan_sach.check_month(month, notify=False)
+                          if user_pressed and valid_month_format(month) else [])
+                return inc, spent, count, alerts
+
+            def show_month(result):
+                inc, spent, count, alerts = result
+                shown.clear()
+                shown.update(kind="month", month=month, inc=inc, spent=spent, count=count,
+                             month_key=database.month_key(month) if valid_month_format(month) else None)
+                render_summary()
+                show_expenses(month=month)
+
+                # Cảnh báo nếu vượt hạn mức (mặc định 90% thu nhập, xem ngan_sach)
+                budget_notifier.notify(alerts)
+
+            executor.submit(load_month, key="stats", on_done=show_month)
 
         else:
             # Theo danh mục
             if not cat:
                 # Không chọn danh mục => tổng hợp tất cả
-                conn = database.get_conn()
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT COALESCE(c.name,'Khác') AS category, SUM(e.amount)
-                    FROM expenses e LEFT JOIN categories c ON e.category_id = c.id
-                    GROUP BY category
-                    ORDER BY SUM(e.amount) DESC
-                """)
-                rows = cur.fetchall()
-                conn.close()
-                summary_label.config(text="Tổng hợp chi tiêu theo danh mục")
-                detail_tree.delete(*detail_tree.get_children())
-                for i, (category, total) in enumerate(rows, start=1):
-                    detail_tree.insert("", "end", values=(i, category, "", f"{total:,.0f}", ""))
+                def show_all(rows):
+                    shown.clear()
+                    shown["kind"] = "all"
+                    summary_label.config(text="Tổng hợp chi tiêu theo danh mục")
+                    detail_view.set_rows(rows, format_row=lambda i, r: (i + 1, r[0], "", f"{r[1]:,.0f}", ""))
+
+                executor.submit(chi_tieu.get_expense_by_category, key="stats", on_done=show_all)
             else:
-                # Nếu chọn danh mục cụ thể
-                conn = database.get_conn()
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT COALESCE(c.name,'Khác'), e.description, e.amount, e.date
-                    FROM expenses e LEFT JOIN categories c ON e.category_id = c.id
-                    WHERE COALESCE(c.name,'Khác') = ?
-                    ORDER BY substr(e.date,7,4) DESC
-                """, (cat,))
-                rows = cur.fetchall()
-                conn.close()
-                total = sum(r[2] for r in rows)
-                summary_label.config(text=f"Danh mục '{cat}' - Tổng chi: {total:,.0f} VND")
-                detail_tree.delete(*detail_tree.get_children())
-                for i, (category, desc, amt, date) in enumerate(rows, start=1):
-                    detail_tree.insert("", "end", values=(i, category, desc, f"{amt:,.0f}", date))
+                # Nếu chọn danh mục cụ thể: tổng + số khoản lấy từ bảng tổng hợp
+                def show_category(result):
+                    count, total = result
+                    shown.clear()
+                    shown.update(kind="category", category=cat, spent=total, count=count)
+                    render_summary()
+                    show_expenses(category=cat)
+
+                executor.submit(chi_tieu.count_expenses, key="stats", on_done=show_category, category=cat)
+
+    def show_trend(month, cat, user_pressed):
+        """Chuỗi theo tháng: cả khoảng được tính bằng một truy vấn (window function) trên luồng nền."""
+        if not valid_month_format(month):
+            clear_detail()
+            if user_pressed:
+                messagebox.showerror("Lỗi", "Định dạng tháng không hợp lệ (MM-YYYY).")
+            return
+        start = database.shift_month(month, -(TREND_MONTHS - 1))
+        span = f"{start} → {month}"
+
+        if not cat:
+            def show_series(rows):
+                shown.clear()
+                shown["kind"] = "trend"
+                inc = sum(r[1] for r in rows)
+                spent = sum(r[2] for r in rows)
+                summary_label.config(text=f"Xu hướng {span} | Thu nhập: {inc:,.0f} | Đã chi: {spent:,.0f} "
+                                          f"| Số dư: {inc - spent:,.0f} | Chi TB/tháng: {spent / len(rows):,.0f}")
+                set_detail_headings(("Tháng", "Thu nhập", "Chi tiêu", "Số dư", "Số dư lũy kế"))
+                # Mới nhất lên đầu như các chế độ khác
+                detail_view.set_rows(rows[::-1], format_row=lambda i, r: (
+                    r[0], f"{r[1]:,.0f}", f"{r[2]:,.0f}", f"{r[4]:,.0f}", f"{r[5]:,.0f}"))
+
+            executor.submit(chi_tieu.get_monthly_series, start, month, key="stats", on_done=show_series)
+        else:
+            def show_category_series(rows):
+                shown.clear()
+                shown["kind"] = "trend"
+                spent = sum(r[2] for r in rows)
+                avg = spent / len(rows) if rows else 0
+                summary_label.config(text=f"Xu hướng '{cat}' {span} | Tổng chi: {spent:,.0f} VND "
+                                          f"| TB/tháng: {avg:,.0f}")
+                set_detail_headings(("Tháng", "Danh mục", "Số khoản", "Chi tiêu", "So với tháng trước"))
+                detail_view.set_rows(rows[::-1], format_row=lambda i, r: (
+                    r[1], r[0], f"{r[3]:,}", f"{r[2]:,.0f}", "" if r[4] is None else f"{r[4]:+,.0f}"))
+
+            executor.submit(chi_tieu.get_category_monthly_series, start, month, cat,
+                            key="stats", on_done=show_category_series)
+
+    def search_descriptions():
+        """Tìm khoản chi theo mô tả, kết quả xếp theo độ liên quan rồi mới nhất trước."""
+        query = search_e.get().strip()
+        if not query:
+            update_stats_display(False)
+            return
+        set_detail_headings()
+        month = stats_month_e.get().strip()
+        cat = stats_cat_cb.get().strip()
+        months = month if mode_var.get() == "Theo tháng" and valid_month_format(month) else None
+        category = cat if mode_var.get() == "Theo danh mục" and cat else None
+
+        def show_hits(result):
+            count, total = result
+            shown.clear()
+            shown["kind"] = "search"
+            where = f" trong tháng {months}" if months else f" trong '{category}'" if category else ""
+            summary_label.config(text=f"Tìm '{query}'{where}: {count:,} kết quả | Tổng: {total:,.0f} VND")
+            detail_view.set_offset_source(
+                lambda offset, limit: chi_tieu.search_expenses(query, month_range=months, category=category,
+                                                                    offset=offset, limit=limit),
+                lambda: count,
+                format_row=lambda i, r: (i + 1, r[2], r[3], f"{r[4]:,.0f}", r[5]))
+
+        # Đếm + tổng có thể mất vài trăm ms với từ khóa phổ biến -> chạy trên luồng nền
+        executor.submit(chi_tieu.count_search_expenses, query, key="stats", on_done=show_hits,
+                        month_range=months, category=category)
 
     # Nút xuất Excel
     def export_excel():
@@ -372,18 +542,89 @@ def open_giao_dien():
         if not valid_month_format(m):
             messagebox.showerror("Lỗi", "Định dạng tháng không hợp lệ (MM-YYYY).")
             return
-        inc = database.get_income_for_month(m)
-        spent = chi_tieu.get_total_expense_by_month(m)
-        if (inc == 0) and (spent == 0):
-            messagebox.showinfo("Không có dữ liệu", f"Tháng {m} không có dữ liệu để xuất.")
+        # Xuất trên luồng nền; vẫn là báo cáo một tháng của export_to_excel (tiêu đề, thu nhập,
+        # bảng chi tiêu, TỔNG CHI / SỐ DƯ) — export_range_to_excel dùng bố cục khác
+        export_btn.state(["disabled"])
+        export_bar.grid(row=0, column=7, padx=6)
+        export_bar.start(15)
+
+        def finish():
+            export_bar.stop()
+            export_bar.grid_remove()
+            export_btn.state(["!disabled"])
+
+        def done(path):
+            finish()
+            messagebox.showinfo("Thành công", f"Đã xuất file Excel tháng {m}:\n{path}")
+
+        def failed(e):
+            finish()
+            if isinstance(e, ValueError):
+                # export_to_excel báo ValueError khi tháng không có thu nhập lẫn chi tiêu
+                messagebox.showinfo("Không có dữ liệu", f"Tháng {m} không có dữ liệu để xuất.")
+            else:
+                print("Lỗi khi xuất Excel:", e)
+                messagebox.showerror("Lỗi", "Không xuất được file Excel.")
+
+        def job():
+            import xuat_excel  # openpyxl chỉ được nạp khi thật sự xuất file
+            return xuat_excel.export_to_excel(m)
+
+        executor.submit(job, key="export", on_done=done, on_error=failed)
+
+    # CẬP NHẬT THEO SỰ KIỆN (su_kien): sửa đúng dòng / nhãn bị ảnh hưởng thay vì nạp lại tất cả
+    def schedule_stats_refresh():
+        """Tính lại bảng thống kê một lần cho cả loạt thay đổi dồn dập."""
+        debouncer.call("stats", lambda: update_stats_display(False))
+
+    def apply_expense_event(ev):
+        kind = shown["kind"]
+        if ev.action != su_kien.INSERT or kind not in ("month", "category"):
+            # Thay đổi hàng loạt, tổng hợp theo danh mục, xu hướng, kết quả tìm: tính lại (gộp)
+            if kind is not None:
+                schedule_stats_refresh()
             return
-        safe_export_to_excel(m)
-        messagebox.showinfo("Thành công", f"Đã xuất file Excel tháng {m} trong thư mục chương trình.")
+        new_rows = []
+        for r in ev.rows:
+            if kind == "month":
+                match = r["date_key"] // 100 == shown["month_key"]
+            else:
+                match = r["category"] == shown["category"]
+            if match:
+                shown["spent"] += r["amount"]
+                shown["count"] += 1
+                new_rows.append((r["id"], r["date_key"], r["category"], r["description"], r["amount"], r["date"]))
+        if new_rows:
+            render_summary()
+            detail_view.insert_rows(new_rows)
+
+    def apply_income_event(ev):
+        for r in ev.rows:
+            row = (r["month_key"], r["month"], r["amount"])
+            if ev.action == su_kien.INSERT:
+                income_view.insert_rows([row])
+            else:
+                income_view.update_rows([row])
+            if shown["kind"] == "month" and shown["month"] == r["month"]:
+                shown["inc"] = r["amount"]
+                render_summary()
+
+    def on_data_events(batch):
+        """Các sự kiện gom trong một nhịp poll, theo đúng thứ tự commit."""
+        for ev in batch:
+            if ev.topic == su_kien.EXPENSES:
+                apply_expense_event(ev)
+            elif ev.topic == su_kien.INCOMES:
+                apply_income_event(ev)
+            elif ev.topic == su_kien.CATEGORIES:
+                apply_category_event(ev)
+                refresh_cat_cb()
+                if ev.action == su_kien.DELETE and shown["kind"] is not None:
+                    schedule_stats_refresh()  # các khoản chi đã chuyển sang 'Khác'
+
+    events = su_kien.TkListener(root, on_data_events)
 
     # CÁC HÀM HỖ TRỢ KHỞI TẠO
-    def refresh_if_stats_visible():
-        if notebook.index("current") == stats_index:
-            update_stats_display(False)
 
     def initial_load():
         load_incomes()
@@ -391,5 +632,62 @@ def open_giao_dien():
         refresh_cat_cb()
         update_stats_display(False)
 
+    # BẢNG CHẨN ĐOÁN ẨN (Ctrl+Shift+D): số liệu SQL của chan_doan, bật/tắt đo khi đang chạy
+    diag = {"win": None, "after": None}  # after: id lần tự làm mới đang chờ của bảng chẩn đoán
+
+    def open_diagnostics(event=None):
+        if diag["win"] is not None and diag["win"].winfo_exists():
+            diag["win"].lift()
+            return
+        win = diag["win"] = tk.Toplevel(root)
+        win.title("Chẩn đoán SQLite")
+        win.geometry("1000x560")
+        bar = ttk.Frame(win)
+        bar.pack(fill="x", padx=8, pady=6)
+        text = tk.Text(win, wrap="none", font=("Consolas", 9))
+        text.pack(fill="both", expand=True, padx=8, pady=(0, 8))
+
+        def cancel_refresh():
+            if diag["after"] is not None:
+                root.after_cancel(diag["after"])
+                diag["after"] = None
+
+        def render():
+            # Các nút cũng gọi render(): hủy lần hẹn cũ trước khi hẹn lần mới, chỉ giữ một vòng lặp
+            cancel_refresh()
+            if not win.winfo_exists():
+                return
+            text.configure(state="normal")
+            text.delete("1.0", "end")
+            text.insert("end", chan_doan.report())
+            text.configure(state="disabled")
+            toggle_btn.configure(text="⏸ Tắt đo" if chan_doan.enabled() else "▶ Bật đo")
+            diag["after"] = win.after(2000, render)  # tự làm mới khi bảng còn mở
+
+        def toggle():
+            if chan_doan.enabled():
+                chan_doan.disable()
+            else:
+                chan_doan.enable()
+            render()
+
+        def clear():
+            chan_doan.reset()
+            render()
+
+        def close():
+            cancel_refresh()  # không để lần hẹn của bảng cũ chạy sau khi bảng mới được mở
+            win.destroy()
+
+        toggle_btn = ttk.Button(bar, command=toggle)
+        toggle_btn.pack(side="left", padx=4)
+        ttk.Button(bar, text="🧹 Xóa số liệu", command=clear).pack(side="left", padx=4)
+        ttk.Button(bar, text="🔄 Làm mới", command=render).pack(side="left", padx=4)
+        win.protocol("WM_DELETE_WINDOW", close)
+        render()
+
+    root.bind_all("<Control-Shift-D>", open_diagnostics)
+    root.bind_all("<Control-D>", open_diagnostics)  # một số bàn phím chỉ báo keysym 'D'
+
     initial_load()
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import chan_doan
+import database
+import ngan_sach
+
+# Hàng đợi ghi có group commit: nhiều luồng (giao diện, máy chủ, script) gửi lệnh ghi vào
+# một hàng đợi; một luồng ghi duy nhất gom các lệnh đến gần nhau và chạy cả nhóm trong MỘT
+# database.transaction() -> một lần commit (một lần ghi WAL / fsync) cho cả nhóm, và không
+# có hai kết nối tranh nhau khóa ghi của SQLite.
+#
+#     writes = WriteQueue()
+#     fut = writes.submit(chi_tieu.add_expense, "15-11-2025", cid, "Cơm trưa", 45000, check_budget=False)
+#     alerts = fut.result()   # trả về khi khoản chi ĐÃ được commit
+#     writes.close()
+
+
+class _Write:
+    __slots__ = ("fn", "args", "kwargs", "future")
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    """
+    - submit(fn, *args, **kwargs) -> concurrent.futures.Future; fn là một hàm ghi bất kỳ
+      (chi_tieu.add_expense, database.add_income, danh_muc.add_category...).
+    - Luồng ghi lấy mọi lệnh đang nằm trong hàng đợi (tối đa max_batch) rồi commit cả nhóm;
+      trong lúc nhóm này commit, các lệnh mới lại dồn vào hàng đợi cho nhóm sau. window_ms > 0:
+      chờ thêm tối đa chừng đó sau lệnh đầu tiên để gom nhóm lớn hơn — chỉ có lợi khi bên gửi
+      không chờ kết quả (gửi dồn dập); nếu mỗi bên gửi chờ Future của mình thì luồng ghi chỉ
+      ngồi chờ không (đo bằng benchmark.bench_ghi).
+    - Mỗi lệnh chạy trong SAVEPOINT riêng: lệnh lỗi chỉ hủy phần của nó và Future nhận
+      ngoại lệ; các lệnh khác trong nhóm vẫn được commit.
+    - Future chỉ có kết quả SAU KHI nhóm đã commit; commit lỗi thì mọi lệnh trong nhóm nhận lỗi.
+      Cảnh báo ngân sách (ngan_sach) cũng chỉ được gửi cho notifier sau khi nhóm đã commit.
+    """
+
+    def __init__(self, window_ms=0, max_batch=1000):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self.batches = 0       # số lần commit
+        self.writes = 0        # số lệnh đã chạy
+        self.largest = 0       # nhóm lớn nhất
+        self._thread = threading.Thread(target=self._worker, name="qlct-ghi-nhom", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if self._closed:
+            raise RuntimeError("WriteQueue đã đóng")
+        write = _Write(fn, args, kwargs)
+        self._queue.put(write)
+        return write.future
+
+    def flush(self):
+        """Chờ mọi lệnh đã gửi tới lúc này được commit."""
+        self.submit(lambda: None).result()
+
+    def close(self):
+        """Ghi nốt các lệnh còn trong hàng đợi rồi dừng luồng ghi."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "writes": self.writes, "largest": self.largest,
+                "pending": self._queue.qsize(),
+                "avg_batch": self.writes / self.batches if self.batches else 0.0}
+
+    # --- Luồng ghi ---
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.perf_counter()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # để vòng ngoài dừng sau khi ghi nhóm này
+                break
+            batch.append(item)
+        return batch
+
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [w for w in self._collect(first) if w.future.set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+        database.close_thread_conn()
+
+    def _commit(self, batch):
+        results = []
+        alerts = {}   # cảnh báo ngân sách của các lệnh thành công, gửi sau khi cả nhóm commit
+        try:
+            with chan_doan.action(f"ghi nhóm ({len(batch)})"), database.transaction():
+                for w in batch:
+                    try:
+                        # SAVEPOINT riêng cho từng lệnh; lệnh lỗi thì cảnh báo của nó bị bỏ
+                        with ngan_sach.held() as pending, database.transaction():
+                            results.append((True, w.fn(*w.args, **w.kwargs)))
+                    except Exception as e:
+                        results.append((False, e))
+                    else:
+                        alerts.update(pending)
+        except Exception as e:
+            for w in batch:
+                w.future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        self.largest = max(self.largest, len(batch))
+        for w, (ok, value) in zip(batch, results):
+            if ok:
+                w.future.set_result(value)
+            else:
+                w.future.set_exception(value)
+        try:
+            ngan_sach.send(alerts.values())
+        except Exception as e:
+            print("Lỗi khi gửi cảnh báo ngân sách:", e)
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import database
+import su_kien
+
+# Lưu trữ theo năm: chi tiêu của các năm đã kết thúc được chuyển sang file riêng
+# (QL_Chi_Tieu-2023.db, ...) cạnh file DB chính. File chính chỉ còn các năm đang dùng
+# nên B-tree / index nhỏ và nhanh; file năm cũ chỉ còn được đọc.
+# - Bảng tổng hợp expense_month_totals vẫn giữ đủ mọi tháng trong file chính, nên các
+#   thống kê (tổng tháng, theo danh mục, xu hướng, ngân sách) không cần mở file năm cũ.
+# - Truy vấn cần từng dòng (danh sách, xuất Excel, kiểm tra tổng...) gọi expense_tables /
+#   expenses_from: file năm liên quan được ATTACH vào kết nối khi cần lần đầu.
+# - Tìm kiếm toàn văn (expenses_fts) chỉ đánh index dữ liệu trong file chính.
+
+COLUMNS = "id, date, category_id, description, amount, date_key, import_hash"
+
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        category_id INTEGER,
+        description TEXT,
+        amount REAL NOT NULL,
+        date_key INTEGER,
+        import_hash INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_expenses_date_key ON expenses(date_key)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_cat_date ON expenses(category_id, date_key)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_import_hash ON expenses(import_hash) WHERE import_hash IS NOT NULL",
+)
+
+# SQLite mặc định cho ATTACH tối đa 10 file trên một kết nối
+MAX_ATTACHED = 10
+
+_local = threading.local()  # các file đã ATTACH vào kết nối của luồng này
+
+
+def archive_path(year: int) -> str:
+    """File lưu trữ của một năm: <tên DB>-<năm>.db cùng thư mục với DB chính."""
+    base, ext = os.path.splitext(os.path.abspath(database.DB_PATH))
+    return f"{base}-{year}{ext or '.db'}"
+
+
+def _alias(year: int) -> str:
+    return f"arc_{year}"
+
+
+def archived_years() -> dict:
+    """{năm: đường dẫn file} của các năm đã lưu trữ."""
+    cur = database.get_conn().cursor()
+    cur.execute("SELECT year, file FROM archives ORDER BY year")
+    folder = os.path.dirname(os.path.abspath(database.DB_PATH))
+    return {year: os.path.join(folder, name) for year, name in cur.fetchall()}
+
+
+def list_archives():
+    """list[dict] năm, file, số dòng, tổng tiền, thời điểm lưu trữ, dung lượng file."""
+    cur = database.get_conn().cursor()
+    cur.execute("SELECT year, file, rows, total, archived_at FROM archives ORDER BY year")
+    folder = os.path.dirname(os.path.abspath(database.DB_PATH))
+    result = []
+    for year, name, rows, total, at in cur.fetchall():
+        path = os.path.join(folder, name)
+        result.append({"year": year, "path": path, "rows": rows, "total": total, "archived_at": at,
+                       "size": os.path.getsize(path) if os.path.exists(path) else None})
+    return result
+
+
+def _attached(conn):
+    """Danh sách alias -> năm đã ATTACH (theo thứ tự dùng gần nhất) của kết nối hiện tại."""
+    state = getattr(_local, "state", None)
+    if state is None or state[0] is not conn:
+        # Kết nối mới (hoặc chan_doan vừa bọc lại kết nối cũ): đọc lại từ chính SQLite
+        attached = OrderedDict((name, None) for _, name, _ in conn.execute("PRAGMA database_list")
+                               if name.startswith("arc_"))
+        state = _local.state = (conn, attached)
+    return state[1]
+
+
+def attach(years, conn=None):
+    """
+    ATTACH file của các năm cần dùng (năm chưa lưu trữ bị bỏ qua). Trả về list alias.
+    Khi vượt MAX_ATTACHED, các file lâu không dùng tới bị DETACH trước.
+    Không gọi được khi kết nối đang mở transaction (giới hạn của SQLite).
+    """
+    conn = conn or database.get_conn()
+    known = archived_years()
+    years = sorted(y for y in set(years) if y in known)
+    if len(years) > MAX_ATTACHED:
+        raise ValueError(f"Truy vấn chạm {len(years)} năm lưu trữ, tối đa {MAX_ATTACHED} năm một lúc")
+    attached = _attached(conn)
+    aliases = []
+    for year in years:
+        path = known[year]
+        alias = _alias(year)
+        if alias in attached:
+            attached.move_to_end(alias)
+        else:
+            while len(attached) >= MAX_ATTACHED:
+                old = next(a for a in attached if a not in aliases)
+                conn.execute(f"DETACH DATABASE {old}")
+                del attached[old]
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            attached[alias] = None
+        aliases.append(alias)
+    return aliases
+
+
+def detach_all(conn=None):
+    conn = conn or database.get_conn()
+    attached = _attached(conn)
+    for alias in list(attached):
+        conn.execute(f"DETACH DATABASE {alias}")
+        del attached[alias]
+
+
+def expense_tables(lo_key=None, hi_key=None):
+    """
+    Các bảng expenses cần đọc cho khoảng date_key [lo_key, hi_key] (None = không giới hạn):
+    luôn có bảng chính, cộng bảng của các năm lưu trữ nằm trong khoảng (đã ATTACH sẵn).
+    """
+    years = [y for y in archived_years()
+             if (lo_key is None or y >= lo_key // 10000) and (hi_key is None or y <= hi_key // 10000)]
+    return ["expenses"] + [f"{alias}.expenses" for alias in attach(years)]
+
+
+def expenses_from(lo_key=None, hi_key=None) -> str:
+    """
+    Nguồn dữ liệu thay cho 'expenses' trong mệnh đề FROM: chính bảng expenses nếu khoảng
+    ngày không chạm năm lưu trữ nào, ngược lại là subquery UNION ALL (SQLite đẩy điều kiện
+    WHERE xuống từng nhánh nên mỗi file vẫn đọc theo index của nó).
+    """
+    tables = expense_tables(lo_key, hi_key)
+    if len(tables) == 1:
+        return "expenses"
+    return "(" + " UNION ALL ".join(f"SELECT {COLUMNS} FROM {t}" for t in tables) + ")"
+
+
+def _year_bounds(year):
+    return year * 10000 + 101, year * 10000 + 1231
+
+
+def archive_year(year: int, vacuum: bool = False) -> dict:
+    """
+    Chuyển chi tiêu của một năm đã kết thúc sang file lưu trữ của năm đó.
+    1. Chép các dòng sang file năm (file mới được ghi ra file tạm rồi os.replace), kiểm tra
+       lại số dòng + tổng tiền trong file năm.
+    2. Một transaction trên DB chính: xóa các dòng đã chép (giữ nguyên bảng tổng hợp tháng),
+       ghi năm vào bảng archives.
+    Lưu trữ lại một năm đã lưu trữ thì các dòng mới thêm vào năm đó được gộp vào file cũ.
+    vacuum=True: VACUUM DB chính sau đó để file thật sự nhỏ lại.
+    Trả về dict: year, path, rows, total, seconds.
+    """
+    t0 = time.perf_counter()
+    year = int(year)
+    if year >= datetime.now().year:
+        raise ValueError("Chỉ lưu trữ được năm đã kết thúc")
+    lo, hi = _year_bounds(year)
+    conn = database.get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM expenses WHERE date_key BETWEEN ? AND ?",
+                (lo, hi))
+    rows, total = cur.fetchone()
+    existing = archived_years().get(year)
+    if not rows:
+        if existing:
+            return {"year": year, "path": existing, "rows": 0, "total": 0.0,
+                    "seconds": time.perf_counter() - t0}
+        raise ValueError(f"Không có khoản chi nào trong năm {year}")
+
+    # 1. File năm: tạo mới trên file tạm, hoặc gộp vào file đã có
+    path = existing or archive_path(year)
+    target = path if existing else path + ".tmp"
+    if not existing and os.path.exists(target):
+        os.remove(target)
+    alias = "luu_tru_moi"
+    cur.execute(f"ATTACH DATABASE ? AS {alias}", (target,))
+    try:
+        with database.transaction():
+            for sql in ARCHIVE_SCHEMA:
+                cur.execute(sql.replace("EXISTS ", f"EXISTS {alias}.", 1))
+            cur.execute(f"INSERT OR IGNORE INTO {alias}.expenses ({COLUMNS}) "
+                        f"SELECT {COLUMNS} FROM main.expenses WHERE date_key BETWEEN ? AND ?", (lo, hi))
+        cur.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM(a.amount), 0) FROM {alias}.expenses a
+            WHERE a.id IN (SELECT id FROM main.expenses WHERE date_key BETWEEN ? AND ?)
+        """, (lo, hi))
+        copied, copied_total = cur.fetchone()
+        cur.execute(f"SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM {alias}.expenses")
+        arc_rows, arc_total = cur.fetchone()
+    finally:
+        cur.execute(f"DETACH DATABASE {alias}")
+    if copied != rows or abs(copied_total - total) > 0.005:
+        raise RuntimeError(f"Chép sang file lưu trữ năm {year} không khớp ({copied}/{rows} dòng)")
+    if not existing:
+        os.replace(target, path)
+
+    # 2. Bỏ các dòng đã chép khỏi DB chính; trigger xóa của bảng tổng hợp được gỡ tạm để
+    # số liệu tháng vẫn còn (dòng vẫn tồn tại, chỉ nằm ở file khác). Trigger FTS vẫn chạy.
+    trigger = "trg_expenses_totals_del"
+    with database.transaction():
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cur.execute("DELETE FROM expenses WHERE date_key BETWEEN ? AND ?", (lo, hi))
+        cur.execute(database.MONTH_TOTALS_TRIGGERS[trigger])
+        cur.execute("INSERT OR REPLACE INTO archives (year, file, rows, total, archived_at) VALUES (?, ?, ?, ?, ?)",
+                    (year, os.path.basename(path), arc_rows, arc_total, datetime.now().isoformat(timespec="seconds")))
+    if vacuum:
+        cur.execute("VACUUM")
+
+    su_kien.publish(su_kien.EXPENSES, su_kien.RELOAD, months=[f"{m:02d}-{year}" for m in range(1, 13)],
+                    count=rows)
+    return {"year": year, "path": path, "rows": rows, "total": total, "seconds": time.perf_counter() - t0}
+
+
+def restore_year(year: int) -> dict:
+    """Đưa chi tiêu của một năm lưu trữ trở lại DB chính rồi xóa file năm. Trả về dict như archive_year."""
+    t0 = time.perf_counter()
+    path = archived_years().get(int(year))
+    if path is None:
+        raise ValueError(f"Năm {year} chưa được lưu trữ")
+    conn = database.get_conn()
+    alias = attach([year], conn)[0]
+    cur = conn.cursor()
+    # Số liệu tháng của các dòng này đã có sẵn trong bảng tổng hợp -> gỡ tạm trigger INSERT
+    trigger = "trg_expenses_totals_ins"
+    try:
+        with database.transaction():
+            cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cur.execute(f"INSERT OR IGNORE INTO main.expenses ({COLUMNS}) SELECT {COLUMNS} FROM {alias}.expenses")
+            rows = cur.rowcount
+            cur.execute(database.MONTH_TOTALS_TRIGGERS[trigger])
+            cur.execute("DELETE FROM archives WHERE year = ?", (year,))
+    finally:
+        detach_all(conn)
+    os.remove(path)
+    su_kien.publish(su_kien.EXPENSES, su_kien.RELOAD, months=[f"{m:02d}-{year}" for m in range(1, 13)],
+                    count=rows)
+    return {"year": int(year), "path": path, "rows": rows, "seconds": time.perf_counter() - t0}
+
+
+def reassign_category(conn, old_id, new_id):
+    """
+    Xóa danh mục (danh_muc.delete_category_by_name): chuyển các dòng trong file lưu trữ sang
+    danh mục mới, và dồn các ô tổng hợp còn lại của danh mục cũ (chính là phần thuộc năm
+    lưu trữ, phần trong DB chính đã được trigger chuyển) sang danh mục mới.
+    Các file năm phải được ATTACH trước khi transaction bắt đầu (attach(archived_years())).
+    Trả về số dòng đã đổi trong các file năm.
+    """
+    moved = 0
+    for alias in _attached(conn):
+        moved += conn.execute(f"UPDATE {alias}.expenses SET category_id = ? WHERE category_id = ?",
+                              (new_id, old_id)).rowcount
+    conn.execute("""
+        INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+        SELECT month_key, ?, total, cnt FROM expense_month_totals WHERE category_id = ?
+        ON CONFLICT (month_key, category_id)
+        DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt
+    """, (new_id, old_id))
+    conn.execute("DELETE FROM expense_month_totals WHERE category_id = ?", (old_id,))
+    return moved
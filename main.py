@@ -1,6 +1,19 @@
-import database
-from giao_dien import open_giao_dien
+import sys
 
 if __name__ == "__main__":
-    database.init_db()
-    open_giao_dien()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        # Có tham số -> chạy dòng lệnh, không nạp tkinter / openpyxl (xem dong_lenh.py)
+        import dong_lenh
+        sys.exit(dong_lenh.main())
+
+    import chan_doan
+    import database
+    from giao_dien import open_giao_dien
+
+    chan_doan.enable_from_env()  # QLCT_PROFILE=1: đo SQL ngay từ đầu (xem bảng Ctrl+Shift+D)
+    database.init_db(progress=database.print_progress)
+    try:
+        open_giao_dien()
+    finally:
+        # Đóng các kết nối SQLite đang dùng lại (checkpoint WAL) khi thoát
+        database.close_all()
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import chan_doan
+import chi_tieu
+import database
+import ngan_sach
+
+# Máy chủ HTTP/JSON cục bộ (chỉ dùng thư viện chuẩn) để công cụ khác đọc số liệu chi tiêu
+# mà không cần giao diện Tk:
+#     python main.py serve --port 8765
+#     curl -s 'http://127.0.0.1:8765/api/summary?month=11-2025'
+# - Mỗi kết nối HTTP có một luồng riêng (giữ keep-alive) nhưng KHÔNG chạm vào SQLite: việc
+#   đọc DB được giao cho một pool cố định `workers` luồng, mỗi luồng một kết nối query_only
+#   (database.get_conn theo luồng) -> số kết nối SQLite không tăng theo số client.
+# - Phản hồi được lưu đệm theo URL; cả bộ đệm bị bỏ khi PRAGMA data_version đổi (có commit
+#   từ bất kỳ kết nối / tiến trình nào). ETag = hash nội dung, client gửi If-None-Match
+#   trùng thì nhận 304 không kèm nội dung.
+
+Response = namedtuple("Response", "body content_type etag filename")
+
+
+class DataVersion:
+    """
+    Số thế hệ dữ liệu: tăng mỗi khi file DB có commit mới. Hỏi PRAGMA data_version trên MỘT
+    kết nối riêng — giá trị của các kết nối khác nhau không so sánh được với nhau, nên không
+    dùng kết nối của từng luồng đọc (mỗi luồng sẽ báo đổi một lần cho cùng một
+    commit, làm bộ đệm bị xóa nhiều lần).
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._version = None
+        self.generation = 0
+
+    def current(self) -> int:
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._version:
+                if self._version is not None:
+                    self.generation += 1
+                self._version = version
+            return self.generation
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Bộ đệm LRU giới hạn theo tổng số byte. Các yêu cầu cùng URL đến lúc chưa có bản đệm
+    chỉ chạy truy vấn MỘT lần, các yêu cầu còn lại chờ kết quả đó (tránh dồn truy vấn ngay
+    sau khi bộ đệm bị xóa). max_bytes=0: không lưu đệm.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()   # key -> Response
+        self._size = 0
+        self._inflight = {}           # (key, generation) -> Future
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_build(self, key, generation, build):
+        with self._lock:
+            if generation != self.generation:
+                # Dữ liệu đã đổi: mọi bản đệm cũ đều không còn dùng được
+                self._items.clear()
+                self._size = 0
+                self.generation = generation
+                self.invalidations += 1
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item
+            flight = self._inflight.get((key, generation))
+            owner = flight is None
+            if owner:
+                flight = self._inflight[(key, generation)] = Future()
+                self.misses += 1
+        if not owner:
+            return flight.result()
+        try:
+            item = build()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[(key, generation)]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[(key, generation)]
+            # Chỉ lưu khi dữ liệu chưa đổi trong lúc dựng, và bản đệm không quá lớn
+            if generation == self.generation and len(item.body) <= self.max_bytes // 4:
+                self._store(key, item)
+        flight.set_result(item)
+        return item
+
+    def _store(self, key, item):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._size -= len(old.body)
+        self._items[key] = item
+        self._size += len(item.body)
+        while self._size > self.max_bytes:
+            _, dropped = self._items.popitem(last=False)
+            self._size -= len(dropped.body)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+
+# --- Tham số ---
+def _month(params, name="month"):
+    month = params.get(name)
+    if not month:
+        return None
+    try:
+        key = database.month_key(month)
+    except (ValueError, AttributeError):
+        raise ValueError(f"{name} phải có dạng MM-YYYY: {month}") from None
+    return f"{key % 100:02d}-{key // 100}"  # "3-2024" -> "03-2024"
+
+
+def _int(params, name, default, lo, hi=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ValueError(f"{name} phải là số nguyên") from None
+    if value < lo or (hi is not None and value > hi):
+        raise ValueError(f"{name} phải >= {lo}" if hi is None else f"{name} phải trong khoảng {lo}..{hi}")
+    return value
+
+
+# --- Các endpoint: nhận dict tham số query string, trả về dữ liệu JSON (hoặc Response) ---
+def api_incomes(params):
+    return [{"month": month, "amount": amount} for month, amount in database.get_all_incomes()]
+
+
+def api_summary(params):
+    month = _month(params) or date.today().strftime("%m-%Y")
+    income = database.get_income_for_month(month)
+    count, spent = chi_tieu.count_expenses(month=month)
+    return {"month": month, "income": income, "spent": spent, "balance": income - spent,
+            "count": count, "by_category": dict(chi_tieu.get_expense_summary_by_category_month(month)),
+            "alerts": [a._asdict() for a in ngan_sach.check_month(month, notify=False)]}
+
+
+def api_categories(params):
+    month = _month(params)
+    rows = (chi_tieu.get_expense_summary_by_category_month(month) if month
+            else chi_tieu.get_expense_by_category())
+    return [{"category": name, "total": total} for name, total in rows]
+
+
+def api_expenses(params):
+    """
+    Một trang chi tiêu (mới nhất trước). Trang sau: gửi lại after=<next> của trang trước
+    (keyset, nhanh ở mọi độ sâu); offset chỉ dùng khi không có after.
+    """
+    month, category = _month(params), params.get("category") or None
+    limit = _int(params, "limit", 50, 1, 500)
+    after = None
+    if params.get("after"):
+        try:
+            after = tuple(int(p) for p in params["after"].split(":"))
+            if len(after) != 2:
+                raise ValueError
+        except ValueError:
+            raise ValueError("after phải có dạng date_key:id") from None
+    offset = _int(params, "offset", 0, 0) if after is None else 0
+    rows = chi_tieu.get_expense_page(month=month, category=category, after=after, offset=offset, limit=limit)
+    count, total = chi_tieu.count_expenses(month=month, category=category)
+    return {"count": count, "total": total,
+            "items": [{"id": _id, "date": day, "category": cat, "description": desc, "amount": amount}
+                      for _id, _key, cat, desc, amount, day in rows],
+            "next": f"{rows[-1][1]}:{rows[-1][0]}" if len(rows) == limit else None}
+
+
+def api_export(params):
+    import xuat_excel  # nạp openpyxl ở lần xuất đầu tiên
+
+    start = _month(params, "start") or _month(params)
+    if not start:
+        raise ValueError("Cần tham số start (hoặc month) dạng MM-YYYY")
+    end = _month(params, "end") or start
+    name = f"chi_tieu-{start}.xlsx" if end == start else f"chi_tieu-{start}_{end}.xlsx"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = xuat_excel.export_range_to_excel(start, end, save_path=os.path.join(tmp, name))
+        with open(path, "rb") as f:
+            body = f.read()
+    return Response(body, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", None, name)
+
+
+ROUTES = {
+    "/api/incomes": api_incomes,
+    "/api/summary": api_summary,
+    "/api/categories": api_categories,
+    "/api/expenses": api_expenses,
+    "/api/export": api_export,
+}
+
+
+def _init_reader():
+    # Luồng của pool đọc: kết nối riêng của luồng, không cho phép ghi
+    database.get_conn().execute("PRAGMA query_only = ON")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive
+    server_version = "QLCT/1.0"
+    timeout = 30                    # đóng kết nối keep-alive rảnh quá 30 giây
+    head_only = False
+
+    def do_HEAD(self):
+        self.head_only = True
+        try:
+            self.do_GET()
+        finally:
+            self.head_only = False
+
+    def do_GET(self):
+        app = self.server.app
+        url = urlsplit(self.path)
+        params = dict(parse_qsl(url.query))
+        if url.path in ("/", "/api", "/api/"):
+            return self._send_json(200, {"endpoints": sorted(ROUTES) + ["/api/status"]})
+        if url.path == "/api/status":
+            return self._send_json(200, app.stats())
+        if url.path not in ROUTES:
+            return self._send_json(404, {"error": f"Không có endpoint {url.path}"})
+        try:
+            resp = app.respond(url.path, params)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            print("Lỗi máy chủ:", repr(e))
+            return self._send_json(500, {"error": "Lỗi máy chủ"})
+
+        if resp.etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            app.count(not_modified=True)
+            self.send_response(304)
+            self.send_header("ETag", resp.etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            return
+        app.count()
+        self.send_response(200)
+        self.send_header("Content-Type", resp.content_type)
+        self.send_header("Content-Length", str(len(resp.body)))
+        self.send_header("ETag", resp.etag)
+        self.send_header("Cache-Control", "no-cache")   # luôn hỏi lại, nhưng 304 nếu chưa đổi
+        if resp.filename:
+            self.send_header("Content-Disposition", f'attachment; filename="{resp.filename}"')
+        self.end_headers()
+        if not self.head_only:
+            self.wfile.write(resp.body)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not self.head_only:
+            self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        if self.server.app.verbose:
+            super().log_message(fmt, *args)
+
+
+class LedgerServer:
+    """
+    host/port: địa chỉ lắng nghe (port=0: hệ điều hành chọn cổng trống, xem .address);
+    workers: số luồng (= số kết nối SQLite) đọc DB; cache_bytes: dung lượng bộ đệm phản hồi.
+    serve_forever() chạy chặn; start() chạy trên luồng nền (dùng cho benchmark).
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, workers=4, cache_bytes=32 << 20, verbose=False):
+        self.verbose = verbose
+        self.workers = workers
+        self.versions = DataVersion(database.DB_PATH)
+        self.cache = ResponseCache(cache_bytes)
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="qlct-http",
+                                        initializer=_init_reader)
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.app = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.responses = 0
+        self.not_modified = 0
+
+    @property
+    def address(self):
+        return self._httpd.server_address[:2]
+
+    def respond(self, path, params) -> Response:
+        generation = self.versions.current()
+        key = path + "?" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        return self.cache.get_or_build(key, generation,
+                                       lambda: self._pool.submit(self._build, path, params).result())
+
+    def _build(self, path, params):
+        with chan_doan.action(f"http:{path}"):
+            data = ROUTES[path](params)
+        if not isinstance(data, Response):
+            data = Response(json.dumps(data, ensure_ascii=False).encode("utf-8"),
+                            "application/json; charset=utf-8", None, None)
+        return data._replace(etag='"%s"' % hashlib.blake2b(data.body, digest_size=12).hexdigest())
+
+    def count(self, not_modified=False):
+        with self._lock:
+            self.responses += 1
+            self.not_modified += not_modified
+
+    def stats(self) -> dict:
+        return {"generation": self.versions.generation, "workers": self.workers,
+                "responses": self.responses, "not_modified": self.not_modified,
+                "uptime_s": round(time.time() - self.started, 1), "cache": self.cache.stats()}
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="qlct-http-main", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Dừng nhận yêu cầu, chờ các truy vấn đang chạy rồi đóng pool."""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
+        self._pool.shutdown(wait=True)
+        self.versions.close()
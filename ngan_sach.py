@@ -0,0 +1,346 @@
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import database
+import danh_muc
+
+# Bộ máy cảnh báo ngân sách, tách khỏi tầng dữ liệu và giao diện:
+# - Giữ tổng chi đang chạy của từng tháng (tổng + theo danh mục) và thu nhập trong RAM,
+#   nạp một lần từ bảng expense_month_totals; mỗi lần ghi chỉ cộng thêm số tiền rồi so
+#   với hạn mức -> O(1), không chạy lại truy vấn tổng.
+# - Hạn mức lấy từ bảng budgets (theo tháng / theo danh mục), mặc định tổng chi > 90% thu nhập.
+# - Cảnh báo được gửi qua một Notifier (hộp thoại Tk, log, callback...) để các luồng
+#   nhập hàng loạt / dòng lệnh có thể gom lại hoặc tắt hẳn.
+
+DEFAULT_RATIO = 0.9   # khi chưa đặt hạn mức tổng: cảnh báo lúc tổng chi vượt 90% thu nhập
+MONTH_TOTAL = 0       # category_id trong bảng budgets ứng với tổng chi cả tháng
+ALL_MONTHS = 0        # month_key trong bảng budgets ứng với "mọi tháng"
+
+# month: MM-YYYY; category: tên danh mục (None = tổng chi cả tháng);
+# ratio: tổng chi / thu nhập (None nếu tháng chưa có thu nhập)
+Alert = namedtuple("Alert", "month category total limit income ratio")
+
+
+def format_alert(alert: Alert) -> str:
+    """Nội dung cảnh báo dạng một dòng chữ."""
+    if alert.category is None:
+        text = f"Tổng chi tiêu tháng {alert.month}: {alert.total:,.0f} VND (hạn mức {alert.limit:,.0f} VND)"
+    else:
+        text = (f"Danh mục '{alert.category}' tháng {alert.month}: {alert.total:,.0f} VND "
+                f"(hạn mức {alert.limit:,.0f} VND)")
+    if alert.ratio is not None:
+        text += f" - thu nhập {alert.income:,.0f} VND, tỉ lệ {alert.ratio:.0%}"
+    return text
+
+
+# --- Notifier: nơi nhận cảnh báo ---
+class Notifier:
+    """Giao diện chung: notify(danh sách Alert). Lớp con ghi đè notify."""
+
+    def notify(self, alerts):
+        raise NotImplementedError
+
+
+class NullNotifier(Notifier):
+    """Bỏ qua mọi cảnh báo."""
+
+    def notify(self, alerts):
+        pass
+
+
+class LogNotifier(Notifier):
+    """
+    Ghi cảnh báo ra logging (mặc định khi chạy không có giao diện).
+    logging chỉ được import khi có cảnh báo đầu tiên, để dòng lệnh khởi động nhanh.
+    """
+
+    def __init__(self, logger=None, level=None):
+        self.logger = logger
+        self.level = level
+
+    def notify(self, alerts):
+        import logging
+
+        logger = self.logger or logging.getLogger("ngan_sach")
+        for a in alerts:
+            logger.log(self.level or logging.WARNING, format_alert(a))
+
+
+class CallbackNotifier(Notifier):
+    """Chuyển danh sách cảnh báo cho một hàm tùy ý."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def notify(self, alerts):
+        self.callback(alerts)
+
+
+class TkNotifier(Notifier):
+    """Một hộp thoại cho mỗi lần notify. Chỉ gọi trên luồng Tkinter."""
+
+    def notify(self, alerts):
+        if not alerts:
+            return
+        from tkinter import messagebox  # chỉ nạp Tkinter khi thật sự hiện hộp thoại
+
+        messagebox.showwarning("⚠️ Cảnh báo vượt ngân sách", "\n".join(format_alert(a) for a in alerts))
+
+
+# --- Bộ máy tính toán ---
+class BudgetEngine:
+    """
+    Trạng thái (tổng chi theo tháng, thu nhập, hạn mức) được giữ riêng cho kết nối của
+    từng luồng. Trạng thái bị bỏ và nạp lại khi:
+    - kết nối KHÁC commit vào DB (PRAGMA data_version thay đổi), hoặc
+    - chính kết nối này ghi gì đó mà không báo qua record_expense (total_changes thay đổi),
+      vd: nhập hàng loạt, xóa danh mục, thêm thu nhập, sửa hạn mức.
+    """
+
+    def __init__(self, notifier=None):
+        self.notifier = notifier or LogNotifier()
+        self._local = threading.local()
+        self.hits = 0       # số lần đánh giá dùng được số liệu trong RAM
+        self.loads = 0      # số lần phải đọc một tháng từ DB
+
+    # Đồng bộ trạng thái với DB
+    def _sync(self, conn, since=None):
+        st = self._local
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        expected = conn.total_changes if since is None else since
+        if (getattr(st, "conn", None) is not conn or st.version != version
+                or st.changes != expected):
+            st.conn, st.version = conn, version
+            st.months = {}
+            st.rules = None
+        st.changes = conn.total_changes
+        if st.rules is None:
+            cur = conn.execute("SELECT category_id, month_key, limit_amount, limit_ratio FROM budgets")
+            st.rules = {(cid, mk): (amount, ratio) for cid, mk, amount, ratio in cur}
+        return st
+
+    def _load_month(self, conn, st, mk):
+        cur = conn.execute("SELECT category_id, total FROM expense_month_totals WHERE month_key = ?", (mk,))
+        # category_id 0 trong bảng tổng hợp = khoản chi không có danh mục
+        cats = {(cid or None): total for cid, total in cur}
+        row = conn.execute("SELECT amount FROM incomes WHERE month_key = ?", (mk,)).fetchone()
+        m = st.months[mk] = {"total": sum(cats.values()), "cats": cats,
+                             "income": float(row[0]) if row and row[0] is not None else 0.0}
+        self.loads += 1
+        return m
+
+    def _month(self, conn, st, mk):
+        m = st.months.get(mk)
+        if m is None:
+            return self._load_month(conn, st, mk)
+        self.hits += 1
+        return m
+
+    # Đánh giá hạn mức
+    @staticmethod
+    def _limit(rules, cid, mk, income):
+        rule = rules.get((cid, mk)) or rules.get((cid, ALL_MONTHS))
+        if rule is None:
+            if cid != MONTH_TOTAL:
+                return None
+            rule = (None, DEFAULT_RATIO)
+        amount, ratio = rule
+        if amount is not None:
+            return amount
+        if ratio is not None and income > 0:
+            return ratio * income
+        return None
+
+    def _evaluate(self, st, m, mk, category_ids):
+        alerts = []
+        month = f"{mk % 100:02d}-{mk // 100}"
+        income = m["income"]
+        for cid in category_ids:
+            spent = m["total"] if cid == MONTH_TOTAL else m["cats"].get(cid, 0.0)
+            limit = self._limit(st.rules, cid, mk, income)
+            if limit is not None and spent > limit:
+                name = None if cid == MONTH_TOTAL else danh_muc.get_category_name_by_id(cid)
+                alerts.append(Alert(month, name, spent, limit, income, spent / income if income > 0 else None))
+        return alerts
+
+    def _emit(self, alerts, notify):
+        if not alerts or not notify:
+            return
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            # Đang gom: cảnh báo sau cùng của mỗi (tháng, danh mục) thay cho cảnh báo trước
+            for a in alerts:
+                pending[(a.month, a.category)] = a
+        else:
+            self.notifier.notify(alerts)
+
+    # API
+    def record_expense(self, mk, category_id, amount, since, notify=True):
+        """
+        Gọi ngay sau khi commit một khoản chi mới (tháng mk = YYYYMM).
+        since = conn.total_changes đo TRƯỚC khi ghi: nếu giữa chừng không có thay đổi nào
+        khác thì chỉ cộng số tiền vào tổng đang chạy, không đọc lại DB.
+        Trả về danh sách Alert (rỗng nếu không vượt hạn mức).
+        """
+        conn = database.get_conn()
+        st = self._sync(conn, since)
+        m = st.months.get(mk)
+        if m is None:
+            # Nạp sau khi commit -> số liệu đã gồm khoản chi vừa thêm
+            m = self._load_month(conn, st, mk)
+        else:
+            self.hits += 1
+            m["total"] += amount
+            m["cats"][category_id] = m["cats"].get(category_id, 0.0) + amount
+        alerts = self._evaluate(st, m, mk, (MONTH_TOTAL, category_id) if category_id else (MONTH_TOTAL,))
+        self._emit(alerts, notify)
+        return alerts
+
+    def check_month(self, month: str, notify=True):
+        """Kiểm tra mọi hạn mức (tổng + các danh mục có hạn mức) của tháng MM-YYYY."""
+        mk = database.month_key(month)
+        conn = database.get_conn()
+        st = self._sync(conn)
+        m = self._month(conn, st, mk)
+        cats = sorted({cid for cid, rmk in st.rules if cid != MONTH_TOTAL and rmk in (mk, ALL_MONTHS)})
+        alerts = self._evaluate(st, m, mk, [MONTH_TOTAL] + cats)
+        self._emit(alerts, notify)
+        return alerts
+
+    @contextmanager
+    def batched(self):
+        """
+        Gom cảnh báo phát ra trong khối with (trên luồng hiện tại), mỗi (tháng, danh mục)
+        giữ một cảnh báo, rồi gửi cho notifier MỘT lần khi ra khỏi khối.
+        """
+        outer = getattr(self._local, "pending", None)
+        if outer is not None:  # đã đang gom ở khối ngoài
+            yield
+            return
+        pending = self._local.pending = {}
+        try:
+            yield
+        finally:
+            self._local.pending = None
+            if pending:
+                self.notifier.notify(list(pending.values()))
+
+    @contextmanager
+    def held(self):
+        """
+        Giữ lại cảnh báo phát ra trong khối with (trên luồng hiện tại), KHÔNG gửi cho notifier.
+        Khối nhận dict (tháng, danh mục) -> Alert; bên gọi tự gửi bằng send() khi phần việc
+        đã commit, hoặc bỏ đi nếu nó bị rollback (vd: hang_doi_ghi).
+        """
+        outer = getattr(self._local, "pending", None)
+        pending = self._local.pending = {}
+        try:
+            yield pending
+        finally:
+            self._local.pending = outer
+
+    def send(self, alerts):
+        """Gửi các cảnh báo đã giữ lại (held) cho notifier."""
+        if alerts:
+            self.notifier.notify(list(alerts))
+
+    def forget(self):
+        """Bỏ trạng thái của luồng hiện tại (vd: giao dịch vừa rollback); lần sau nạp lại từ DB."""
+        self._local.conn = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "loads": self.loads}
+
+
+_engine = BudgetEngine()
+database.on_rollback(_engine.forget)
+
+
+def set_notifier(notifier: Notifier):
+    """Đổi nơi nhận cảnh báo (vd: TkNotifier cho giao diện, NullNotifier để tắt)."""
+    _engine.notifier = notifier
+
+
+def get_notifier() -> Notifier:
+    return _engine.notifier
+
+
+def record_expense(mk, category_id, amount, since, notify=True):
+    return _engine.record_expense(mk, category_id, amount, since, notify)
+
+
+def check_month(month: str, notify=True):
+    return _engine.check_month(month, notify)
+
+
+def check_months(months, notify=True):
+    """Kiểm tra nhiều tháng, các cảnh báo được gửi chung một lần."""
+    alerts = []
+    with _engine.batched():
+        for month in months:
+            alerts.extend(_engine.check_month(month, notify))
+    return alerts
+
+
+def batched():
+    return _engine.batched()
+
+
+def held():
+    return _engine.held()
+
+
+def send(alerts):
+    _engine.send(alerts)
+
+
+def engine_stats() -> dict:
+    return _engine.stats()
+
+
+# --- Quản lý hạn mức ---
+def _budget_key(category=None, month=None):
+    cid = MONTH_TOTAL
+    if category:
+        cid = danh_muc.get_category_id_by_name(category)
+        if cid is None:
+            raise ValueError(f"Không có danh mục '{category}'")
+    return cid, database.month_key(month) if month else ALL_MONTHS
+
+
+def set_budget(limit_amount=None, ratio=None, category=None, month=None):
+    """
+    Đặt hạn mức: số tiền tuyệt đối (limit_amount, VND) HOẶC tỉ lệ thu nhập (ratio, vd 0.8).
+    category=None: tổng chi cả tháng; month=None (MM-YYYY): áp dụng mọi tháng.
+    Hạn mức của một tháng cụ thể được ưu tiên hơn hạn mức "mọi tháng".
+    """
+    if (limit_amount is None) == (ratio is None):
+        raise ValueError("Cần đúng một trong hai: số tiền hạn mức hoặc tỉ lệ thu nhập")
+    if (limit_amount is not None and limit_amount < 0) or (ratio is not None and ratio <= 0):
+        raise ValueError("Hạn mức phải là số dương")
+    cid, mk = _budget_key(category, month)
+    with database.transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO budgets (category_id, month_key, limit_amount, limit_ratio) "
+            "VALUES (?, ?, ?, ?)",
+            (cid, mk, None if limit_amount is None else float(limit_amount),
+             None if ratio is None else float(ratio)))
+
+
+def remove_budget(category=None, month=None) -> bool:
+    """Xóa hạn mức; trả về False nếu không có hạn mức đó."""
+    cid, mk = _budget_key(category, month)
+    with database.transaction() as conn:
+        cur = conn.execute("DELETE FROM budgets WHERE category_id = ? AND month_key = ?", (cid, mk))
+    return cur.rowcount > 0
+
+
+def get_budgets():
+    """Danh sách hạn mức đã đặt: dict category (None = tổng), month (None = mọi tháng), limit_amount, limit_ratio."""
+    cur = database.get_conn().execute(
+        "SELECT category_id, month_key, limit_amount, limit_ratio FROM budgets ORDER BY month_key, category_id")
+    return [{"category": None if cid == MONTH_TOTAL else danh_muc.get_category_name_by_id(cid),
+             "month": None if mk == ALL_MONTHS else f"{mk % 100:02d}-{mk // 100}",
+             "limit_amount": amount, "limit_ratio": ratio}
+            for cid, mk, amount, ratio in cur.fetchall()]
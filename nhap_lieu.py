@@ -0,0 +1,323 @@
+import csv
+import calendar
+import os
+import time
+from operator import itemgetter
+from datetime import date, datetime
+
+import database
+import danh_muc
+import luu_tru
+import su_kien
+
+# Nhập chi tiêu hàng loạt từ file CSV / XLSX (sao kê ngân hàng, file do xuat_excel tạo ra).
+# Các dòng được đọc dạng generator, xử lý theo lô và ghi bằng executemany
+# trong MỘT transaction; dòng trùng (đã nhập trước đó) bị bỏ qua nhờ import_hash.
+#
+# Tốc độ: mục tiêu 100k dòng/s mới đạt khi nhập lại (toàn dòng trùng). benchmark/bench_nhap_lieu.py
+# --rows 100000 trên máy đo (1 CPU) được ~74k dòng/s lần đầu, ~125k dòng/s khi nhập lại.
+# Riêng SQLite chèn 100k dòng vào bảng expenses KHÔNG có index nào đã mất ~1 s khi máy bận;
+# phần còn lại là 3 index (date_key, danh mục + ngày, import_hash), nạp index FTS, và phần
+# Python đọc / kiểm tra / băm từng dòng. Ngày được phân tích theo lô (parse_dates), kiểm tra
+# trùng cũng theo lô (INSERT OR IGNORE trên index UNIQUE), không truy vấn từng dòng.
+
+# Tên cột chấp nhận được (không phân biệt hoa thường) -> trường chuẩn
+HEADER_ALIASES = {
+    "ngày": "date", "date": "date",
+    "danh mục": "category", "category": "category",
+    "mô tả": "description", "description": "description",
+    "số tiền": "amount", "số tiền (vnd)": "amount", "amount": "amount",
+}
+FIELDS = ("date", "category", "description", "amount")
+
+BATCH_SIZE = 10000
+INSERT_TRIGGER = "trg_expenses_totals_ins"
+FTS_INSERT_TRIGGER = "trg_expenses_fts_ins"
+
+
+def _header_map(cells):
+    """Trả về {trường: vị trí cột} nếu dòng là dòng tiêu đề, ngược lại None."""
+    found = {}
+    for i, c in enumerate(cells):
+        key = HEADER_ALIASES.get(str(c).strip().lower()) if c is not None else None
+        if key and key not in found:
+            found[key] = i
+    return found if "date" in found and "amount" in found else None
+
+
+def _pick(cells, cols):
+    return tuple(cells[cols[f]] if f in cols and cols[f] < len(cells) else None for f in FIELDS)
+
+
+def iter_csv_rows(path, encoding="utf-8-sig"):
+    """
+    Đọc file CSV, yield từng dòng (ngày, danh mục, mô tả, số tiền) dạng thô.
+    Nếu dòng đầu là tiêu đề (Ngày, Danh mục, Mô tả, Số tiền) thì cột được nhận theo tên,
+    không có tiêu đề thì mặc định theo thứ tự đó.
+    """
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        cols = _header_map(first)
+        if cols is None:
+            cols = {f: i for i, f in enumerate(FIELDS)}
+            yield _pick(first, cols)
+        for cells in reader:
+            if cells:
+                yield _pick(cells, cols)
+
+
+def iter_xlsx_rows(path):
+    """
+    Đọc file Excel (chế độ read_only, không nạp cả file vào RAM), yield từng dòng thô.
+    Mỗi sheet được dò tìm dòng tiêu đề — hỗ trợ cả file do xuat_excel.export_to_excel tạo ra
+    (tiêu đề ở dòng 5, các dòng TỔNG CHI / SỐ DƯ không có ngày nên sẽ bị bỏ qua).
+    """
+    import openpyxl  # chỉ nạp khi thật sự nhập file Excel
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            cols = None
+            for cells in ws.iter_rows(values_only=True):
+                if cols is None:
+                    cols = _header_map(cells)
+                    continue
+                row = _pick(cells, cols)
+                if row[0] in (None, ""):
+                    continue
+                yield row
+    finally:
+        wb.close()
+
+
+def iter_rows(path):
+    """Chọn cách đọc theo đuôi file (.csv hoặc .xlsx)."""
+    ext = os.path.splitext(str(path))[1].lower()
+    if ext == ".csv":
+        return iter_csv_rows(path)
+    if ext in (".xlsx", ".xlsm"):
+        return iter_xlsx_rows(path)
+    raise ValueError(f"Không hỗ trợ định dạng file: {ext}")
+
+
+def _batches(rows, size):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _parse_date(value):
+    """
+    Đổi một giá trị ngày -> (chuỗi DD-MM-YYYY, date_key). Sai -> None.
+    Nhận: đối tượng date/datetime, DD-MM-YYYY hoặc D/M/YYYY, và ISO YYYY-MM-DD (có thể kèm
+    giờ: "2024-03-05 00:00:00", "2024-03-05T10:30"); phần giờ bị bỏ.
+    """
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        d, m, y = value.day, value.month, value.year
+    else:
+        text = str(value).strip().split(" ")[0].split("T")[0]
+        parts = text.replace("/", "-").split("-")
+        if len(parts) != 3:
+            return None
+        if len(parts[0]) == 4:  # ISO: năm đứng đầu
+            parts.reverse()
+        try:
+            d, m, y = (int(p) for p in parts)
+        except ValueError:
+            return None
+        if len(parts[2]) != 4 or not (1 <= m <= 12) or not (1 <= d <= calendar.monthrange(y, m)[1]):
+            return None
+    return f"{d:02d}-{m:02d}-{y:04d}", y * 10000 + m * 100 + d
+
+
+def parse_dates(values, cache):
+    """
+    Kiểm tra ngày cho cả một lô cùng lúc. Ngày trong sao kê lặp lại rất nhiều: chỉ các giá trị
+    chưa gặp của lô được phân tích (mỗi giá trị một lần, lưu vào cache cho các lô sau), phần
+    còn lại của lô là một lượt tra dict.
+    """
+    try:
+        new = set(values).difference(cache)
+    except TypeError:  # có giá trị không hash được
+        return [_parse_date(v) for v in values]
+    for v in new:
+        cache[v] = _parse_date(v)
+    return list(map(cache.__getitem__, values))
+
+
+def _parse_amount(value):
+    try:
+        return float(value)
+    except ValueError:
+        # Cho phép định dạng "1,250,000" như giao diện/Excel hiển thị
+        return float(str(value).strip().replace(",", ""))
+
+
+def _add_month_totals(cur, after_id):
+    """
+    Cộng các dòng vừa nhập (id > after_id) vào bảng tổng hợp, mỗi ô (tháng, danh mục) một lần.
+    Chỉ cộng thêm, không tính lại cả tháng từ bảng expenses: tháng thuộc năm đã lưu trữ
+    (luu_tru) còn các dòng nằm trong file năm, tính lại từ DB chính sẽ làm mất phần đó.
+    """
+    cur.execute("""
+        INSERT INTO expense_month_totals (month_key, category_id, total, cnt)
+        SELECT date_key / 100, COALESCE(category_id, 0), SUM(amount), COUNT(*)
+        FROM expenses
+        WHERE id > ? AND date_key IS NOT NULL
+        GROUP BY date_key / 100, COALESCE(category_id, 0)
+        ON CONFLICT (month_key, category_id)
+        DO UPDATE SET total = total + excluded.total, cnt = cnt + excluded.cnt
+    """, (after_id,))
+
+
+def _drop_archived(cur, params, archived):
+    """
+    Bỏ các dòng (thuộc năm đã lưu trữ) có import_hash đã nằm trong file năm đó —
+    index UNIQUE của DB chính không còn thấy các dòng đã chuyển sang file lưu trữ.
+    """
+    by_alias = {}
+    for p in params:
+        alias = archived.get(p[4] // 10000)
+        if alias is not None:
+            by_alias.setdefault(alias, []).append(p[5])
+    if not by_alias:
+        return params
+    seen = set()
+    for alias, hashes in by_alias.items():
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            cur.execute(f"SELECT import_hash FROM {alias}.expenses WHERE import_hash IN "
+                        f"({','.join('?' * len(chunk))})", chunk)
+            seen.update(h for (h,) in cur.fetchall())
+    return [p for p in params if p[5] not in seen] if seen else params
+
+
+def import_expenses(rows, batch_size=BATCH_SIZE, create_categories=True, check_budget=True):
+    """
+    Nhập hàng loạt chi tiêu từ một iterable các dòng (ngày, danh mục, mô tả, số tiền).
+    - Danh mục được tra một lần vào dict; danh mục chưa có sẽ được tạo (hoặc dồn vào 'Khác'
+      nếu create_categories=False)
+    - Ghi bằng executemany trong một transaction duy nhất; bảng tổng hợp tháng x danh mục
+      được cộng một lần cho các dòng mới (gộp theo tháng x danh mục) thay vì qua trigger từng dòng;
+      index tìm kiếm expenses_fts cũng được nạp một lần cho các dòng mới
+    - Dòng đã nhập trước đó (cùng nội dung) bị bỏ qua nhờ index UNIQUE trên import_hash
+      (dòng thuộc năm đã lưu trữ thì so với import_hash trong file của năm đó).
+      Các dòng giống hệt nhau trong cùng một file vẫn được giữ (đánh số lần xuất hiện).
+    - Cảnh báo ngân sách chạy một lần cho mỗi tháng bị ảnh hưởng, sau khi commit,
+      và được gửi cho notifier của ngan_sach trong một lần duy nhất
+    Trả về dict thống kê: read, inserted, duplicates, invalid, errors, months,
+    new_categories, seconds.
+    """
+    t0 = time.perf_counter()
+    conn = database.get_conn()
+    cur = conn.cursor()
+    cat_ids = {c["name"]: c["id"] for c in danh_muc.get_all_categories()}
+
+    date_cache = {}
+    occurrences = {}
+    month_keys = set()
+    stats = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "errors": []}
+    created = []  # danh mục mới tạo trong lần nhập này
+
+    content_hash = database.content_hash  # gọi trong vòng lặp nóng, tra tên một lần
+    sql = ("INSERT OR IGNORE INTO expenses (date, category_id, description, amount, date_key, import_hash) "
+           "VALUES (?, ?, ?, ?, ?, ?)")
+
+    def category_id(raw):
+        cid = cat_ids.get(raw)
+        if cid is None:
+            name = (str(raw).strip() if raw is not None else "") or "Khác"
+            cid = cat_ids.get(name)
+            if cid is None:
+                if not create_categories:
+                    name = "Khác"
+                cur.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (name,))
+                if cur.rowcount > 0:
+                    created.append(name)
+                cur.execute("SELECT id FROM categories WHERE name = ?", (name,))
+                cid = cur.fetchone()[0]
+            cat_ids[raw] = cid
+        return cid
+
+    # Năm đã lưu trữ (luu_tru): ATTACH file năm trước khi mở transaction để kiểm tra dòng trùng
+    # (chỉ MAX_ATTACHED năm gần nhất: giới hạn số file ATTACH của SQLite)
+    years = list(luu_tru.archived_years())[-luu_tru.MAX_ATTACHED:]
+    archived = dict(zip(years, luu_tru.attach(years, conn)))
+
+    with database.transaction():
+        # Bỏ trigger cộng dồn từng dòng trong transaction này (xem database.MONTH_TOTALS_TRIGGERS);
+        # bảng tổng hợp được cộng theo ô ở cuối, index FTS được nạp một lần cho id mới
+        cur.execute(f"DROP TRIGGER IF EXISTS {INSERT_TRIGGER}")
+        cur.execute(f"DROP TRIGGER IF EXISTS {FTS_INSERT_TRIGGER}")
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM expenses")
+        max_id = cur.fetchone()[0]
+        line = 0
+        for batch in _batches(rows, batch_size):
+            dates = parse_dates([r[0] for r in batch], date_cache)
+            params = []
+            for (raw_date, cat, desc, amount), parsed in zip(batch, dates):
+                line += 1
+                if parsed is None:
+                    stats["invalid"] += 1
+                    if len(stats["errors"]) < 20:
+                        stats["errors"].append(f"Dòng {line}: ngày không hợp lệ ({raw_date!r})")
+                    continue
+                try:
+                    amount = _parse_amount(amount)
+                except (TypeError, ValueError):
+                    stats["invalid"] += 1
+                    if len(stats["errors"]) < 20:
+                        stats["errors"].append(f"Dòng {line}: số tiền không hợp lệ ({amount!r})")
+                    continue
+                date_str, key = parsed
+                cid = category_id(cat)
+                desc = "" if desc is None else str(desc)
+                h = content_hash(key, cid, desc, amount)
+                n = occurrences.get(h, 0) + 1
+                occurrences[h] = n
+                params.append((date_str, cid, desc, amount, key, h if n == 1 else database.nth_hash(h, n)))
+                month_keys.add(key // 100)
+            # Sắp xếp theo ngày để các lần chèn vào index date_key nằm gần nhau
+            params.sort(key=itemgetter(4))
+            if archived:
+                params = _drop_archived(cur, params, archived)
+            stats["read"] += len(batch)
+            cur.executemany(sql, params)
+            # rowcount của executemany = số dòng thực sự được chèn (không tính dòng trùng)
+            stats["inserted"] += max(cur.rowcount, 0)
+        _add_month_totals(cur, max_id)
+        cur.execute(database.FILL_FTS_SQL + " WHERE id > ?", (max_id,))
+        cur.execute(database.MONTH_TOTALS_TRIGGERS[INSERT_TRIGGER])
+        cur.execute(database.FTS_TRIGGERS[FTS_INSERT_TRIGGER])
+    stats["duplicates"] = stats["read"] - stats["invalid"] - stats["inserted"]
+    stats["new_categories"] = created
+    if created:
+        danh_muc.invalidate_cache()
+    stats["months"] = [f"{mk % 100:02d}-{mk // 100}" for mk in sorted(month_keys)]
+    stats["seconds"] = time.perf_counter() - t0
+
+    # Nhập hàng loạt: không gửi từng dòng, chỉ báo các tháng / danh mục bị ảnh hưởng
+    if created:
+        su_kien.publish(su_kien.CATEGORIES, su_kien.RELOAD, names=created)
+    if stats["inserted"]:
+        su_kien.publish(su_kien.EXPENSES, su_kien.RELOAD, months=stats["months"], count=stats["inserted"])
+
+    if check_budget and stats["inserted"]:
+        import ngan_sach
+        ngan_sach.check_months(stats["months"])  # các cảnh báo được gửi chung một lần
+    return stats
+
+
+def import_file(path, **kwargs):
+    """Nhập chi tiêu từ file CSV/XLSX. Tham số giống import_expenses."""
+    return import_expenses(iter_rows(path), **kwargs)
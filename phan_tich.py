@@ -0,0 +1,316 @@
+import threading
+from collections import namedtuple
+from datetime import date, datetime
+
+import numpy as np
+
+import database
+import danh_muc
+import luu_tru
+
+# Phân tích chi tiêu trên dữ liệu dạng cột (NumPy), cho các phép tính vượt quá SUM/COUNT
+# của bảng tổng hợp: trung bình trượt theo ngày, phân vị theo danh mục, top ngày chi nhiều...
+# - Toàn bộ khoản chi được nạp MỘT lần vào các mảng gọn: ngày (int32, số ngày tính từ
+#   01-01-1970), danh mục (int16, 0 = không có danh mục), số tiền (float64) — khoảng 14 byte
+#   mỗi khoản, 1 triệu khoản ~ 14 MB.
+# - Những lần sau chỉ đọc các dòng có id > mốc (watermark) đã nạp. Xóa / sửa khoản chi cũ
+#   được phát hiện bằng cách so tổng (số khoản, số tiền) theo từng ô (tháng, danh mục) trong
+#   RAM với bảng expense_month_totals (vài trăm dòng); lệch -> nạp lại toàn bộ.
+#   Chỉ đổi ngày trong cùng một tháng thì không phát hiện được: gọi reload().
+# - Mọi phép tính là thao tác vector trên mảng (bincount, lexsort, cumsum), không có vòng
+#   lặp Python theo từng khoản chi, nên phân tích nhiều năm dữ liệu vẫn tương tác được.
+
+_ROW_DTYPE = np.dtype([("id", np.int64), ("date_key", np.int64), ("category", np.int16), ("amount", np.float64)])
+_EPOCH = date(1970, 1, 1)
+_WEEKDAYS = ("Thứ 2", "Thứ 3", "Thứ 4", "Thứ 5", "Thứ 6", "Thứ 7", "Chủ nhật")
+
+# Chuỗi theo ngày: days = số ngày (int32), daily = tổng chi từng ngày (đủ mọi ngày, ngày
+# không chi = 0), mean = trung bình trượt `window` ngày (NaN khi chưa đủ `window` ngày)
+DailySeries = namedtuple("DailySeries", "days daily mean")
+
+
+def keys_to_days(keys):
+    """Mảng date_key YYYYMMDD -> số ngày tính từ 01-01-1970 (int32), đổi bằng datetime64."""
+    keys = np.asarray(keys, dtype=np.int64)
+    months = (keys // 10000 - 1970) * 12 + (keys // 100 % 100 - 1)
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (keys % 100 - 1)
+    return days.astype(np.int32)
+
+
+def day_to_str(day) -> str:
+    """Số ngày (tính từ 01-01-1970) -> DD-MM-YYYY."""
+    y, m, d = str(np.datetime64(int(day), "D")).split("-")
+    return f"{d}-{m}-{y}"
+
+
+def _day_of(date_str):
+    """DD-MM-YYYY -> số ngày; None giữ nguyên (không lọc). Ngày không có thật -> ValueError."""
+    if date_str is None:
+        return None
+    try:
+        d = datetime.strptime(date_str.strip(), "%d-%m-%Y").date()
+    except (ValueError, AttributeError):
+        raise ValueError("Định dạng ngày phải là DD-MM-YYYY")
+    return (d - _EPOCH).days
+
+
+class ExpenseColumns:
+    """
+    Bản sao dạng cột của bảng expenses (các khoản có date_key), dùng chung giữa các luồng.
+    Mảng được cấp phát dư (gấp đôi khi đầy) nên ghi thêm không phải chép lại dữ liệu cũ;
+    người đọc chỉ nhìn đoạn [0, n) nên không bị ảnh hưởng khi luồng khác nạp thêm.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loads = 0       # số lần nạp lại toàn bộ
+        self.appends = 0     # số lần chỉ đọc thêm dòng mới
+        self._reset()
+
+    def _reset(self):
+        self._day = np.empty(0, np.int32)
+        self._cat = np.empty(0, np.int16)
+        self._amount = np.empty(0, np.float64)
+        self._n = 0
+        self._watermark = 0          # id lớn nhất đã nạp
+        self._cells = {}             # (month_key, category_id) -> [số khoản, tổng tiền]
+        self._seen = None            # (kết nối, data_version, total_changes) lần đồng bộ trước
+
+    # --- Đồng bộ với DB ---
+    def _read(self, conn, after_id):
+        # Gồm cả các năm đã lưu trữ sang file riêng (luu_tru)
+        cur = conn.execute(f"""
+            SELECT id, date_key, COALESCE(category_id, 0), amount FROM {luu_tru.expenses_from()}
+            WHERE id > ? AND date_key IS NOT NULL ORDER BY id
+        """, (after_id,))
+        return np.fromiter(cur, dtype=_ROW_DTYPE)
+
+    def _append(self, rows):
+        n, k = self._n, len(rows)
+        if n + k > len(self._day):
+            cap = max(n + k, 2 * len(self._day), 1024)
+            for name in ("_day", "_cat", "_amount"):
+                old = getattr(self, name)
+                new = np.empty(cap, old.dtype)
+                new[:n] = old[:n]
+                setattr(self, name, new)
+        self._day[n:n + k] = keys_to_days(rows["date_key"])
+        self._cat[n:n + k] = rows["category"]
+        self._amount[n:n + k] = rows["amount"]
+        self._n = n + k
+        self._watermark = max(self._watermark, int(rows["id"].max()))
+
+        # Cộng các dòng mới vào tổng theo ô (tháng, danh mục) để đối chiếu với bảng tổng hợp
+        cells, inverse = np.unique((rows["date_key"] // 100) * 65536 + rows["category"], return_inverse=True)
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=rows["amount"])
+        for cell, cnt, total in zip(cells.tolist(), counts.tolist(), totals.tolist()):
+            acc = self._cells.setdefault((cell // 65536, cell % 65536), [0, 0.0])
+            acc[0] += cnt
+            acc[1] += total
+
+    def _matches_totals(self, conn):
+        cur = conn.execute("SELECT month_key, category_id, cnt, total FROM expense_month_totals")
+        seen = 0
+        for mk, cid, cnt, total in cur:
+            acc = self._cells.get((mk, cid))
+            if acc is None or acc[0] != cnt or abs(acc[1] - total) > 0.5 + 1e-9 * abs(total):
+                return False
+            seen += 1
+        return seen == len(self._cells)
+
+    def refresh(self) -> int:
+        """Đọc các khoản chi mới (hoặc nạp lại nếu dữ liệu cũ bị sửa). Trả về số dòng vừa đọc."""
+        with self._lock:
+            conn = database.get_conn()
+            state = (conn, conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+            if state == self._seen:
+                return 0  # không có thay đổi nào kể từ lần trước
+            rows = self._read(conn, self._watermark)
+            if len(rows):
+                self._append(rows)
+                self.appends += 1
+            if not self._matches_totals(conn):
+                self._reset()
+                rows = self._read(conn, 0)
+                if len(rows):
+                    self._append(rows)
+                self.loads += 1
+            self._seen = state
+            return len(rows)
+
+    def forget(self):
+        """Lần refresh sau phải đối chiếu lại với DB (vd: giao dịch đã đọc vừa bị rollback)."""
+        self._seen = None
+
+    def reload(self) -> int:
+        """Bỏ dữ liệu trong RAM và nạp lại toàn bộ."""
+        with self._lock:
+            self._reset()
+        return self.refresh()
+
+    def __len__(self):
+        return self._n
+
+    # --- Lọc ---
+    def _columns(self, start=None, end=None, category=None):
+        """(ngày, danh mục, số tiền) sau khi lọc theo khoảng ngày DD-MM-YYYY và tên danh mục."""
+        self.refresh()
+        n = self._n
+        day, cat, amount = self._day[:n], self._cat[:n], self._amount[:n]
+        mask = None
+        lo, hi = _day_of(start), _day_of(end)
+        if lo is not None:
+            mask = day >= lo
+        if hi is not None:
+            mask = day <= hi if mask is None else mask & (day <= hi)
+        if category:
+            names, groups = self._category_groups(cat)
+            if category not in names:
+                mask = np.zeros(n, bool)
+            else:
+                cond = groups == names.index(category)
+                mask = cond if mask is None else mask & cond
+        if mask is None:
+            return day, cat, amount
+        return day[mask], cat[mask], amount[mask]
+
+    @staticmethod
+    def _category_groups(cat):
+        """
+        (danh sách tên, mảng chỉ số nhóm theo tên cho từng khoản). Khoản không có danh mục
+        (hoặc danh mục đã bị xóa) được gộp vào 'Khác' như các thống kê của chi_tieu.
+        """
+        rows = danh_muc.get_all_categories()
+        size = max([int(cat.max()) if len(cat) else 0] + [r["id"] for r in rows]) + 1
+        lookup = np.full(size, -1, np.int32)
+        index = {}
+        for r in rows:
+            lookup[r["id"]] = index.setdefault(r["name"], len(index))
+        lookup[lookup < 0] = index.setdefault("Khác", len(index))
+        return list(index), lookup[cat]
+
+    # --- Phép tính ---
+    def totals_by(self, by="month", start=None, end=None, category=None):
+        """
+        Gộp nhóm bằng bincount. by: 'day', 'month', 'year', 'weekday' hoặc 'category'.
+        Trả về list (nhãn, tổng chi, số khoản), sắp theo nhãn (category: theo tổng giảm dần).
+        Nhóm theo thời gian: cộng theo ngày trước (một bincount trên mọi khoản), rồi mới gộp
+        vài nghìn ngày thành tháng / năm / thứ — đổi lịch trên từng khoản chi chậm hơn nhiều.
+        """
+        day, cat, amount = self._columns(start, end, category)
+        if by == "category":
+            names, groups = self._category_groups(cat)
+            totals = np.bincount(groups, weights=amount, minlength=len(names))
+            counts = np.bincount(groups, minlength=len(names))
+            order = np.argsort(-totals, kind="stable")
+            return [(names[i], float(totals[i]), int(counts[i])) for i in order if counts[i]]
+        if not len(day):
+            return []
+        lo = int(day.min())
+        day_totals = np.bincount(day - lo, weights=amount)
+        day_counts = np.bincount(day - lo)
+        used = np.flatnonzero(day_counts)
+        day, day_totals, day_counts = used + lo, day_totals[used], day_counts[used]
+        if by == "weekday":
+            keys = (day + 3) % 7  # 01-01-1970 là thứ Năm
+            label = _WEEKDAYS.__getitem__
+        elif by == "day":
+            keys, label = day, day_to_str
+        elif by == "month":
+            keys = day.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            label = lambda k: f"{k % 12 + 1:02d}-{k // 12 + 1970}"
+        elif by == "year":
+            keys = day.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64)
+            label = lambda k: k + 1970
+        else:
+            raise ValueError(f"Không gộp nhóm được theo '{by}'")
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=day_totals, minlength=len(uniq))
+        counts = np.bincount(inverse, weights=day_counts, minlength=len(uniq))
+        return [(label(int(k)), float(t), int(c)) for k, t, c in zip(uniq, totals, counts)]
+
+    def daily_series(self, window=7, start=None, end=None, category=None) -> DailySeries:
+        """Tổng chi từng ngày (đủ mọi ngày trong khoảng) và trung bình trượt `window` ngày."""
+        day, _, amount = self._columns(start, end, category)
+        lo = _day_of(start) if start is not None else int(day.min()) if len(day) else 0
+        hi = _day_of(end) if end is not None else int(day.max()) if len(day) else -1
+        if hi < lo:
+            return DailySeries(np.empty(0, np.int32), np.empty(0), np.empty(0))
+        daily = np.bincount(day - lo, weights=amount, minlength=hi - lo + 1)[:hi - lo + 1]
+        mean = np.full(len(daily), np.nan)
+        if window > 0 and len(daily) >= window:
+            csum = np.cumsum(np.concatenate(([0.0], daily)))
+            mean[window - 1:] = (csum[window:] - csum[:-window]) / window
+        return DailySeries(np.arange(lo, hi + 1, dtype=np.int32), daily, mean)
+
+    def category_percentiles(self, q=(50, 90, 99), start=None, end=None):
+        """
+        Phân vị số tiền mỗi khoản chi theo danh mục: {tên: (số khoản, mảng phân vị theo q)}.
+        Gom các khoản theo danh mục bằng một lần sắp xếp ổn định trên mã nhóm int16 (radix
+        sort), rồi tính phân vị trên từng đoạn liền nhau.
+        """
+        _, cat, amount = self._columns(start, end)
+        names, groups = self._category_groups(cat)
+        groups = groups.astype(np.int16)
+        order = np.argsort(groups, kind="stable")
+        groups, amount = groups[order], amount[order]
+        bounds = np.searchsorted(groups, np.arange(len(names) + 1))
+        out = {}
+        for i, name in enumerate(names):
+            part = amount[bounds[i]:bounds[i + 1]]
+            if len(part):
+                out[name] = (len(part), np.percentile(part, q, method="linear"))
+        return out
+
+    def top_days(self, n=10, start=None, end=None, category=None):
+        """n ngày chi nhiều nhất: list (ngày DD-MM-YYYY, tổng chi, số khoản), nhiều nhất trước."""
+        day, _, amount = self._columns(start, end, category)
+        if not len(day):
+            return []
+        lo = int(day.min())
+        totals = np.bincount(day - lo, weights=amount)
+        counts = np.bincount(day - lo)
+        top = np.argsort(-totals, kind="stable")[:min(n, int(np.count_nonzero(counts)))]
+        return [(day_to_str(lo + int(i)), float(totals[i]), int(counts[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {"rows": self._n, "loads": self.loads, "appends": self.appends,
+                "bytes": self._n * (self._day.itemsize + self._cat.itemsize + self._amount.itemsize)}
+
+
+_columns = ExpenseColumns()
+database.on_rollback(_columns.forget)
+
+
+def refresh() -> int:
+    return _columns.refresh()
+
+
+def reload() -> int:
+    return _columns.reload()
+
+
+def totals_by(by="month", start=None, end=None, category=None):
+    return _columns.totals_by(by, start, end, category)
+
+
+def daily_series(window=7, start=None, end=None, category=None) -> DailySeries:
+    return _columns.daily_series(window, start, end, category)
+
+
+def rolling_averages(windows=(7, 30), start=None, end=None, category=None):
+    """{cửa sổ: DailySeries} cho nhiều độ dài cửa sổ (mặc định 7 và 30 ngày)."""
+    return {w: _columns.daily_series(w, start, end, category) for w in windows}
+
+
+def category_percentiles(q=(50, 90, 99), start=None, end=None):
+    return _columns.category_percentiles(q, start, end)
+
+
+def top_days(n=10, start=None, end=None, category=None):
+    return _columns.top_days(n, start, end, category)
+
+
+def stats() -> dict:
+    return _columns.stats()
@@ -0,0 +1,251 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database
+
+# Sao lưu khi chương trình đang chạy: chép file DB bằng API backup của SQLite (không chép file
+# thô — chép giữa lúc đang ghi có thể ra file hỏng, nhất là với WAL còn dữ liệu chưa checkpoint).
+# - Mỗi bản sao lưu (snapshot) là một thư mục <tên DB>-sao_luu/YYYYmmdd-HHMMSS/ chứa file DB
+#   chính và các file năm lưu trữ (luu_tru) mà nó đang trỏ tới; được dựng trong thư mục .tmp
+#   rồi đổi tên, nên thư mục nào có tên đúng dạng là bản sao lưu hoàn chỉnh, đã kiểm tra.
+# - Chép theo đợt PAGES_PER_STEP trang, nghỉ PAUSE_MS giữa hai đợt để giao diện và các kết nối
+#   khác vẫn chạy bình thường. Với WAL, cả quá trình đọc một snapshot cố định nên người ghi không
+#   bị chặn và bản sao lưu là trạng thái DB lúc bắt đầu chép. Nếu SQLite vẫn phải chép lại từ đầu
+#   (DB không ở WAL mà có ghi đồng thời) quá MAX_RESTARTS lần thì chép phần còn lại trong một bước.
+# - compact=True: VACUUM INTO — file sao lưu được dồn gọn (bỏ trang trống, index xếp lại),
+#   nhưng chạy trong MỘT câu lệnh nên không nghỉ giữa chừng / không dừng được.
+# - Khôi phục: đóng chương trình, chép các file trong thư mục snapshot về cạnh main.py.
+#
+#     res = sao_luu.snapshot()            # {"path", "bytes", "seconds", "mb_s", "integrity", ...}
+#     sao_luu.prune(keep=7)               # chỉ giữ 7 bản mới nhất
+#     sao_luu.SnapshotScheduler().start() # tự sao lưu mỗi EVERY_HOURS giờ (giao diện dùng)
+
+PAGES_PER_STEP = 256     # trang mỗi đợt (256 x 4 KB = 1 MB)
+PAUSE_MS = 5             # nghỉ giữa hai đợt
+MAX_RESTARTS = 3
+KEEP = 7                 # số bản sao lưu giữ lại khi xoay vòng
+EVERY_HOURS = 24         # sao lưu tự động: tạo bản mới khi bản gần nhất cũ hơn chừng này
+
+_STAMP = "%Y%m%d-%H%M%S"
+
+
+class BackupCancelled(Exception):
+    """Sao lưu bị dừng giữa chừng (cancel đã được đặt)."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def backup_dir() -> str:
+    """Thư mục chứa các bản sao lưu: <tên DB>-sao_luu cùng thư mục với DB chính."""
+    base, _ = os.path.splitext(os.path.abspath(database.DB_PATH))
+    return base + "-sao_luu"
+
+
+def _copy(src_path, dst_path, compact, pages, pause, cancel, progress):
+    """Chép một file DB sang dst_path (chưa tồn tại). Trả về số lần SQLite phải chép lại từ đầu."""
+    src = sqlite3.connect(src_path, timeout=database.BUSY_TIMEOUT_MS / 1000)
+    try:
+        if compact:
+            src.execute("VACUUM INTO ?", (dst_path,))
+            return 0
+        src.execute("PRAGMA query_only=ON")
+        restarts = 0
+        last = None
+
+        def step(status, remaining, total):
+            nonlocal restarts, last
+            if last is not None and remaining > last:
+                restarts += 1
+                if restarts > MAX_RESTARTS:
+                    raise _TooManyRestarts
+            last = remaining
+            if cancel is not None and cancel.is_set():
+                raise BackupCancelled("Đã dừng sao lưu")
+            if progress:
+                progress(total - remaining, total)
+            # Connection.backup(sleep=...) chỉ nghỉ khi gặp SQLITE_BUSY, nên tự nghỉ ở đây
+            if remaining and pause:
+                time.sleep(pause)
+
+        # Giữ một transaction đọc suốt quá trình chép: mọi đợt đọc cùng một snapshot WAL nên
+        # ghi của kết nối khác không làm SQLite chép lại từ đầu (người ghi vẫn không bị chặn,
+        # chỉ có checkpoint phải chờ tới khi chép xong). DB không ở chế độ WAL thì giữ khóa đọc
+        # sẽ chặn người ghi, nên chỉ làm vậy với WAL.
+        pinned = src.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if pinned:
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        dst = sqlite3.connect(dst_path)
+        try:
+            try:
+                src.backup(dst, pages=pages, progress=step)
+            except _TooManyRestarts:
+                src.backup(dst)
+        finally:
+            dst.close()
+            if pinned:
+                src.rollback()
+        return restarts
+    finally:
+        src.close()
+
+
+def _finish(path, verify):
+    """Chuyển file sao lưu về journal DELETE (một file duy nhất), chạy integrity_check."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=DELETE")
+        if not verify:
+            return None
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "ok" if rows == [("ok",)] else "; ".join(r[0] for r in rows[:5])
+
+
+def snapshot(dest_dir=None, compact=False, verify=True, pages=PAGES_PER_STEP, pause_ms=PAUSE_MS,
+             cancel=None, progress=None) -> dict:
+    """
+    Tạo một bản sao lưu trong dest_dir (mặc định backup_dir()).
+    - cancel: threading.Event, đặt lên thì dừng ở đợt kế tiếp (BackupCancelled), không để lại gì.
+    - progress(số trang đã chép, tổng số trang) sau mỗi đợt của từng file.
+    - verify: PRAGMA integrity_check từng file; file hỏng -> RuntimeError, bản sao lưu bị bỏ.
+    Trả về dict: path, files, bytes, seconds, mb_s, restarts, compact, integrity.
+    """
+    t0 = time.perf_counter()
+    root = dest_dir or backup_dir()
+    name = datetime.now().strftime(_STAMP)
+    final = os.path.join(root, name)
+    n = 1
+    while os.path.exists(final):
+        n += 1
+        final = os.path.join(root, f"{name}-{n}")
+    tmp = final + ".tmp"
+    os.makedirs(tmp)
+    src_folder = os.path.dirname(os.path.abspath(database.DB_PATH))
+    pause = pause_ms / 1000
+    try:
+        main_copy = os.path.join(tmp, os.path.basename(database.DB_PATH))
+        restarts = _copy(database.DB_PATH, main_copy, compact, pages, pause, cancel, progress)
+        files = [main_copy]
+        # Các file năm lưu trữ mà bản sao của DB chính đang trỏ tới
+        conn = sqlite3.connect(main_copy)
+        try:
+            archived = [r[0] for r in conn.execute("SELECT file FROM archives ORDER BY year")]
+        except sqlite3.OperationalError:
+            archived = []
+        finally:
+            conn.close()
+        for file in archived:
+            src = os.path.join(src_folder, file)
+            if os.path.exists(src):
+                files.append(os.path.join(tmp, file))
+                restarts += _copy(src, files[-1], compact, pages, pause, cancel, progress)
+
+        integrity = "ok"
+        for path in files:
+            result = _finish(path, verify)
+            if result not in (None, "ok"):
+                raise RuntimeError(f"Bản sao lưu {os.path.basename(path)} không qua integrity_check: {result}")
+            integrity = result or "không kiểm tra"
+        size = sum(os.path.getsize(p) for p in files)
+        os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    seconds = time.perf_counter() - t0
+    return {"path": final, "files": [os.path.join(final, os.path.basename(p)) for p in files],
+            "bytes": size, "seconds": seconds, "mb_s": size / 1e6 / seconds if seconds else 0.0,
+            "restarts": restarts, "compact": compact, "integrity": integrity}
+
+
+def list_snapshots(dest_dir=None):
+    """list[dict] name, path, created (datetime), bytes, files — mới nhất trước."""
+    root = dest_dir or backup_dir()
+    if not os.path.isdir(root):
+        return []
+    result = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            created = datetime.strptime(name[:15], _STAMP)
+        except ValueError:
+            continue
+        if name.endswith(".tmp") or not os.path.isdir(path):
+            continue
+        files = sorted(os.listdir(path))
+        result.append({"name": name, "path": path, "created": created, "files": files,
+                       "bytes": sum(os.path.getsize(os.path.join(path, f)) for f in files)})
+    result.sort(key=lambda s: s["name"], reverse=True)
+    return result
+
+
+def prune(keep=KEEP, dest_dir=None):
+    """Xóa các bản sao lưu cũ, chỉ giữ keep bản mới nhất. Trả về list đường dẫn đã xóa."""
+    removed = []
+    for s in list_snapshots(dest_dir)[max(keep, 1):]:
+        shutil.rmtree(s["path"], ignore_errors=True)
+        removed.append(s["path"])
+    return removed
+
+
+def snapshot_if_due(every_hours=EVERY_HOURS, keep=KEEP, dest_dir=None, **kwargs):
+    """
+    Sao lưu theo lịch (gọi định kỳ, hoặc từ cron: main.py backup --if-older 24): tạo bản mới
+    nếu bản gần nhất cũ hơn every_hours giờ rồi xoay vòng còn keep bản. Chưa tới hạn -> None.
+    """
+    snaps = list_snapshots(dest_dir)
+    if snaps and datetime.now() - snaps[0]["created"] < timedelta(hours=every_hours):
+        return None
+    res = snapshot(dest_dir, **kwargs)
+    res["pruned"] = prune(keep, dest_dir)
+    return res
+
+
+class SnapshotScheduler:
+    """
+    Luồng nền tự sao lưu khi chương trình đang mở: cứ check_seconds giây xem đã tới hạn
+    (snapshot_if_due) chưa; lần kiểm tra đầu sau first_check giây để không làm chậm khởi động.
+    stop() dừng luồng, bản sao lưu đang chép dở bị hủy ở đợt kế tiếp.
+    """
+
+    def __init__(self, every_hours=EVERY_HOURS, keep=KEEP, check_seconds=600, first_check=60, dest_dir=None):
+        self.every_hours = every_hours
+        self.keep = keep
+        self.check_seconds = check_seconds
+        self.first_check = first_check
+        self.dest_dir = dest_dir
+        self.last = None        # kết quả lần sao lưu gần nhất
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="qlct-sao-luu", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        delay = self.first_check
+        while not self._stop.wait(delay):
+            delay = self.check_seconds
+            try:
+                res = snapshot_if_due(self.every_hours, self.keep, self.dest_dir, cancel=self._stop)
+            except BackupCancelled:
+                break
+            except Exception as e:
+                self.last_error = e
+                print("Lỗi sao lưu tự động:", e)
+            else:
+                if res:
+                    self.last = res
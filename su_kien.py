@@ -0,0 +1,177 @@
+import threading
+from collections import deque, namedtuple
+
+# Kênh sự kiện trong tiến trình: tầng dữ liệu (chi_tieu, database, danh_muc, nhap_lieu)
+# phát một Event SAU KHI commit, kèm các dòng vừa thêm / sửa / xóa. Giao diện nghe các sự
+# kiện này để sửa đúng phần bị ảnh hưởng (thêm một dòng, đổi một nhãn tổng) thay vì xóa
+# sạch Treeview rồi truy vấn lại tất cả.
+# Trong database.transaction() các sự kiện được giữ lại (hold) trên luồng đang ghi và chỉ
+# được phát khi giao dịch ngoài cùng commit; rollback thì bỏ.
+
+# Chủ đề (topic)
+EXPENSES = "expenses"
+INCOMES = "incomes"
+CATEGORIES = "categories"
+
+# Loại thay đổi
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+RELOAD = "reload"  # thay đổi hàng loạt (vd: nhập file): bên nghe nên nạp lại phần liên quan
+
+
+# rows: các dòng (dict) bị ảnh hưởng; info: thông tin thêm, vd: các tháng bị ảnh hưởng khi
+# nhập hàng loạt. collections.namedtuple thay cho typing.NamedTuple: module này được nạp ở
+# mọi lệnh dòng lệnh, import typing tốn vài ms khởi động.
+Event = namedtuple("Event", "topic action rows info", defaults=((), {}))
+
+
+class EventBus:
+    """
+    subscribe(topic, fn) -> hàm hủy đăng ký; topic=None nghe mọi chủ đề.
+    publish(...) gọi các hàm nghe ngay trên luồng phát (thường là luồng nền của tac_vu);
+    giao diện Tk dùng TkListener để nhận sự kiện trên luồng Tk.
+    Lỗi trong một hàm nghe được in ra và không chặn các hàm nghe khác.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = ()   # tuple (topic, fn), thay mới khi đăng ký -> publish không cần khóa
+        self._local = threading.local()   # held: sự kiện đang giữ lại của luồng (None = phát ngay)
+        self.published = 0
+
+    def subscribe(self, topic, fn):
+        entry = (topic, fn)
+        with self._lock:
+            self._subs = self._subs + (entry,)
+
+        def unsubscribe():
+            with self._lock:
+                self._subs = tuple(s for s in self._subs if s is not entry)
+
+        return unsubscribe
+
+    def has_listeners(self, topic=None) -> bool:
+        return any(t is None or topic is None or t == topic for t, _ in self._subs)
+
+    def publish(self, topic, action, rows=(), **info):
+        if not self._subs:
+            return
+        event = Event(topic, action, tuple(rows), info)
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            held.append(event)
+            return
+        self._deliver(event)
+
+    # Giữ sự kiện trong giao dịch (database.transaction)
+    def hold(self):
+        """Bắt đầu giữ lại các sự kiện phát trên luồng hiện tại."""
+        self._local.held = []
+
+    def held_count(self) -> int:
+        return len(getattr(self._local, "held", None) or ())
+
+    def rewind(self, count):
+        """Bỏ các sự kiện giữ lại sau mốc count (SAVEPOINT bị rollback)."""
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            del held[count:]
+
+    def release(self, deliver=True):
+        """Thôi giữ: phát các sự kiện đã giữ theo đúng thứ tự (deliver=False: bỏ hết)."""
+        held, self._local.held = getattr(self._local, "held", None), None
+        if deliver:
+            for event in held or ():
+                self._deliver(event)
+
+    def _deliver(self, event):
+        self.published += 1
+        for t, fn in self._subs:
+            if t is None or t == event.topic:
+                try:
+                    fn(event)
+                except Exception as e:
+                    print("Lỗi khi xử lý sự kiện:", e)
+
+
+bus = EventBus()
+
+
+def subscribe(topic, fn):
+    return bus.subscribe(topic, fn)
+
+
+def publish(topic, action, rows=(), **info):
+    bus.publish(topic, action, rows, **info)
+
+
+class TkListener:
+    """
+    Nhận sự kiện từ mọi luồng, gom vào hàng đợi rồi gọi handler(list Event) trên luồng Tk
+    (root.after định kỳ) — Tkinter không an toàn khi gọi từ luồng khác. Các sự kiện đến
+    trong cùng một nhịp được giao chung một lần, giữ nguyên thứ tự.
+    """
+
+    def __init__(self, root, handler, topics=None, poll_ms=30):
+        self.root = root
+        self.handler = handler
+        self.poll_ms = poll_ms
+        self._events = deque()  # append / popleft của deque an toàn giữa các luồng
+        self._unsubs = [bus.subscribe(t, self._events.append) for t in (topics or (None,))]
+        self._after_id = root.after(poll_ms, self._poll)
+
+    def _poll(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        if events:
+            try:
+                self.handler(events)
+            except Exception as e:
+                print("Lỗi khi cập nhật giao diện:", e)
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    def close(self):
+        for unsub in self._unsubs:
+            unsub()
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            pass
+
+
+class Debouncer:
+    """
+    Gộp các lần gọi dồn dập: call(key, fn) hẹn gọi fn sau delay_ms; lần gọi mới cùng key
+    trong khoảng đó thay thế lần trước, nên cả loạt chỉ chạy đúng một lần (lần cuối).
+    Chỉ dùng trên luồng Tk.
+    """
+
+    def __init__(self, root, delay_ms=150):
+        self.root = root
+        self.delay_ms = delay_ms
+        self._pending = {}   # key -> after id
+        self.calls = 0       # số lần được yêu cầu
+        self.runs = 0        # số lần thật sự chạy
+
+    def call(self, key, fn, delay_ms=None):
+        self.calls += 1
+        old = self._pending.pop(key, None)
+        if old is not None:
+            self.root.after_cancel(old)
+
+        def run():
+            self._pending.pop(key, None)
+            self.runs += 1
+            fn()
+
+        self._pending[key] = self.root.after(self.delay_ms if delay_ms is None else delay_ms, run)
+
+    def cancel(self, key=None):
+        """Hủy các lần gọi đang chờ (của key, hoặc tất cả)."""
+        keys = [key] if key is not None else list(self._pending)
+        for k in keys:
+            after_id = self._pending.pop(k, None)
+            if after_id is not None:
+                self.root.after_cancel(after_id)
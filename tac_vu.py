@@ -0,0 +1,152 @@
+import itertools
+import queue
+import sqlite3
+import threading
+
+import chan_doan
+import database
+
+# Chạy các tác vụ truy cập dữ liệu (SQLite, openpyxl) trên một luồng nền để vòng lặp
+# Tkinter không bị treo. Tkinter không an toàn khi gọi từ luồng khác, nên kết quả được
+# đưa vào hàng đợi và luồng giao diện tự lấy ra định kỳ bằng root.after.
+
+
+class Cancelled(Exception):
+    """Tác vụ bị hủy (vd: có yêu cầu mới cùng loại thay thế)."""
+
+
+class Job:
+    """Một tác vụ trong hàng đợi. cancelled = True thì kết quả bị bỏ qua."""
+
+    def __init__(self, job_id, key, fn, args, kwargs, on_done, on_error, on_progress):
+        self.id = job_id
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancelled = False
+        self._results = None
+
+    def report(self, done, total):
+        """Báo tiến độ (gọi từ luồng nền). Nếu tác vụ đã bị hủy thì dừng luôn tại đây."""
+        if self.cancelled:
+            raise Cancelled()
+        if self.on_progress and self._results is not None:
+            self._results.put(("progress", self, (done, total)))
+
+
+class BackgroundExecutor:
+    """
+    Một luồng nền + hàng đợi tác vụ.
+    - submit(fn, *args, key=..., on_done=..., on_error=..., on_progress=...):
+      tác vụ mới có cùng key sẽ hủy tác vụ cũ còn chờ hoặc đang chạy
+      (truy vấn SQLite đang chạy bị ngắt bằng Connection.interrupt()).
+    - on_done / on_error / on_progress luôn được gọi trên luồng Tkinter.
+    - Nếu có on_progress, fn được gọi thêm tham số progress=job.report.
+    """
+
+    def __init__(self, root, poll_ms=30):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._ids = itertools.count(1)
+        self._latest = {}          # key -> Job mới nhất
+        self._lock = threading.Lock()
+        self._running = None       # Job đang chạy trên luồng nền
+        self._conn = None          # kết nối SQLite của luồng nền (để interrupt)
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="tac-vu-nen", daemon=True)
+        self._thread.start()
+        self._after_id = root.after(poll_ms, self._poll)
+
+    # --- Phía luồng giao diện ---
+    def submit(self, fn, *args, key=None, on_done=None, on_error=None, on_progress=None, **kwargs):
+        job = Job(next(self._ids), key, fn, args, kwargs, on_done, on_error, on_progress)
+        job._results = self._results
+        if on_progress:
+            job.kwargs["progress"] = job.report
+        if key is not None:
+            self.cancel(key)
+            self._latest[key] = job
+        self._jobs.put(job)
+        return job
+
+    def cancel(self, key):
+        """Hủy tác vụ đang chờ/đang chạy có key này."""
+        old = self._latest.pop(key, None)
+        if old is None:
+            return
+        old.cancelled = True
+        with self._lock:
+            if self._running is old and self._conn is not None:
+                self._conn.interrupt()
+
+    def busy(self, key):
+        """Còn tác vụ với key này chưa xong không."""
+        return key in self._latest
+
+    def shutdown(self):
+        """Hủy mọi tác vụ và dừng luồng nền (gọi khi đóng cửa sổ)."""
+        self._closed = True
+        for key in list(self._latest):
+            self.cancel(key)
+        self._jobs.put(None)
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            pass
+
+    def _poll(self):
+        while True:
+            try:
+                kind, job, value = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if job.cancelled:
+                continue
+            if kind == "progress":
+                job.on_progress(*value)
+                continue
+            if job.key is not None and self._latest.get(job.key) is job:
+                del self._latest[job.key]
+            callback = job.on_done if kind == "done" else job.on_error
+            if callback:
+                callback(value)
+            elif kind == "error":
+                print("Lỗi tác vụ nền:", value)
+        if not self._closed:
+            self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    # --- Phía luồng nền ---
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if job.cancelled:
+                continue
+            with self._lock:
+                self._running = job
+                self._conn = database.get_conn()
+            try:
+                # Khi bật chan_doan: mỗi tác vụ là một "thao tác" (số câu SQL, kết nối mở, thời gian)
+                name = getattr(job.fn, "__name__", "tác vụ")
+                with chan_doan.action(f"{job.key}:{name}" if job.key else name):
+                    result = job.fn(*job.args, **job.kwargs)
+                kind = "done"
+            except Cancelled:
+                continue
+            except sqlite3.OperationalError as e:
+                if job.cancelled:  # bị interrupt() vì có tác vụ mới thay thế
+                    continue
+                kind, result = "error", e
+            except Exception as e:
+                kind, result = "error", e
+            finally:
+                with self._lock:
+                    self._running = None
+            self._results.put((kind, job, result))
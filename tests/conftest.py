@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Các module của chương trình nằm phẳng ở thư mục gốc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Trỏ database sang một file DB tạm đã init_db(), trả về đường dẫn file."""
+    old_path = database.DB_PATH
+    path = str(tmp_path / "test.db")
+    database.set_db_path(path)
+    database.init_db()
+    yield path
+    database.set_db_path(old_path)
@@ -0,0 +1,145 @@
+import bisect
+
+import pytest
+
+from bang_ao import VirtualTreeview
+
+ROWS_VISIBLE = 10
+
+
+class FakeTree:
+    """Thay ttk.Treeview: chỉ giữ item -> values, chưa hiển thị nên cao ROWS_VISIBLE dòng."""
+
+    def __init__(self):
+        self.items = {}
+        self._next = 0
+
+    def bind(self, *args):
+        pass
+
+    def winfo_height(self):
+        return 1
+
+    def cget(self, option):
+        return ROWS_VISIBLE
+
+    def insert(self, parent, index):
+        self._next += 1
+        iid = f"I{self._next}"
+        self.items[iid] = None
+        return iid
+
+    def delete(self, iid):
+        del self.items[iid]
+
+    def item(self, iid, values):
+        self.items[iid] = values
+
+
+class FakeScrollbar:
+    def configure(self, **kw):
+        pass
+
+    def set(self, lo, hi):
+        pass
+
+
+class KeySource:
+    """Danh sách khóa số nguyên, lớn trước (như chi tiêu mới nhất lên đầu); đếm số lần truy vấn."""
+
+    def __init__(self, keys):
+        self.asc = sorted(keys)
+        self.fetches = 0
+
+    def rows(self):
+        return self.asc[::-1]
+
+    def fetch(self, after=None, before=None, offset=0, limit=50):
+        self.fetches += 1
+        rows = self.rows()
+        if after is not None:
+            rows = [k for k in rows if k < after]
+        elif before is not None:
+            rows = [k for k in rows if k > before][-limit:]
+            return rows
+        else:
+            rows = rows[offset:]
+        return rows[:limit]
+
+    def count(self):
+        return len(self.asc)
+
+    def add(self, key):
+        bisect.insort(self.asc, key)
+
+    def remove(self, key):
+        self.asc.remove(key)
+
+
+@pytest.fixture
+def view():
+    src = KeySource(range(0, 1000, 10))  # 100 dòng: 990, 980, ..., 0
+    tree = FakeTree()
+    v = VirtualTreeview(tree, FakeScrollbar())
+    v.set_source(src.fetch, src.count, lambda k: k, lambda pos, k: (pos, k))
+    v.scroll(40)
+    return v, src, tree
+
+
+def _shown(v, tree):
+    return [tree.items[iid] for iid in v._iids]
+
+
+def _expected(v, src):
+    rows = src.rows()
+    return [(pos, rows[pos]) for pos in range(v.top, min(v.top + ROWS_VISIBLE, len(rows)))]
+
+
+def test_insert_above_window_keeps_visible_rows_in_place(view):
+    v, src, tree = view
+    first = _shown(v, tree)[0][1]
+    fetches = src.fetches
+
+    for key in (995, 705):     # trên bộ đệm, trong phần đệm phía trên cửa sổ
+        src.add(key)
+        v.insert_rows([key])
+
+    assert (v.total, v.top) == (102, 42)
+    assert _shown(v, tree)[0][1] == first
+    assert _shown(v, tree) == _expected(v, src)
+    assert src.fetches == fetches
+
+
+def test_insert_inside_and_below_window(view):
+    v, src, tree = view
+    for key in (555, 5):       # giữa cửa sổ đang xem, dưới bộ đệm
+        src.add(key)
+        v.insert_rows([key])
+
+    assert (v.total, v.top) == (102, 40)
+    assert _shown(v, tree) == _expected(v, src)
+    v.scroll(1000)             # cuộn tới cuối: dòng dưới bộ đệm được lấy về đúng chỗ
+    assert _shown(v, tree) == _expected(v, src)
+    assert _shown(v, tree)[-1] == (101, 0)
+
+
+def test_delete_above_inside_and_outside_buffer(view):
+    v, src, tree = view
+    first = _shown(v, tree)[0][1]
+    for key in (990, 700):     # trên bộ đệm, trong phần đệm phía trên
+        src.remove(key)
+        v.delete_keys([key])
+
+    assert (v.total, v.top) == (98, 38)
+    assert _shown(v, tree)[0][1] == first
+
+    for key in (first, 10):    # dòng đang nhìn thấy, dòng dưới bộ đệm
+        src.remove(key)
+        v.delete_keys([key])
+
+    assert (v.total, v.top) == (96, 38)
+    assert _shown(v, tree) == _expected(v, src)
+    v.scroll(-1000)
+    assert _shown(v, tree) == _expected(v, src)
+    v.scroll(1000)
+    assert _shown(v, tree) == _expected(v, src)
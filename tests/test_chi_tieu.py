@@ -0,0 +1,62 @@
+import pytest
+
+import chi_tieu
+import danh_muc
+import database
+
+
+def test_search_filters_by_month_range(db):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    chi_tieu.add_expense("05-03-2024", cid, "Cà phê sáng", 25_000, check_budget=False)
+    chi_tieu.add_expense("05-04-2024", cid, "Cà phê chiều", 30_000, check_budget=False)
+
+    assert [r[3] for r in chi_tieu.search_expenses("ca phe", month_range="03-2024")] == ["Cà phê sáng"]
+    assert [r[3] for r in chi_tieu.search_expenses("ca phe", "04-2024")] == ["Cà phê chiều"]
+    assert chi_tieu.count_search_expenses("ca phe", month_range=("03-2024", "04-2024")) == (2, 55_000.0)
+    # months= là tên khác của month_range
+    assert chi_tieu.count_search_expenses("ca phe", months="03-2024") == (1, 25_000.0)
+
+
+def test_search_rejects_invalid_month(db):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    chi_tieu.add_expense("05-03-2024", cid, "Cà phê sáng", 25_000, check_budget=False)
+
+    for bad in ("13-2024", "2024-03", ("abc", "03-2024")):
+        with pytest.raises(ValueError):
+            chi_tieu.search_expenses("ca phe", month_range=bad)
+        with pytest.raises(ValueError):
+            chi_tieu.count_search_expenses("ca phe", month_range=bad)
+
+
+def _cells(month_key):
+    return database.get_conn().execute(
+        "SELECT category_id, total, cnt FROM expense_month_totals WHERE month_key = ? ORDER BY category_id",
+        (month_key,)).fetchall()
+
+
+def test_month_totals_follow_update_and_delete(db):
+
+    food = danh_muc.get_category_id_by_name("Ăn uống")
+    travel = danh_muc.get_category_id_by_name("Đi lại")
+    for day, amount in ((1, 10_000), (2, 20_000)):
+        chi_tieu.add_expense(f"{day:02d}-07-2024", food, "bữa", amount, check_budget=False)
+    assert _cells(202407) == [(food, 30_000.0, 2)]
+
+    conn = database.get_conn()
+    with database.transaction():
+        # Đổi số tiền, danh mục, rồi chuyển sang tháng khác
+        conn.execute("UPDATE expenses SET amount = 15000 WHERE date_key = 20240701")
+        conn.execute("UPDATE expenses SET category_id = ? WHERE date_key = 20240702", (travel,))
+    assert _cells(202407) == [(food, 15_000.0, 1), (travel, 20_000.0, 1)]
+
+    with database.transaction():
+        conn.execute("UPDATE expenses SET date_key = 20240815, date = '15-08-2024' WHERE date_key = 20240702")
+        conn.execute("DELETE FROM expenses WHERE date_key = 20240701")
+    # Ô không còn khoản nào bị xóa hẳn, không để lại dòng total = 0
+    assert _cells(202407) == []
+    assert _cells(202408) == [(travel, 20_000.0, 1)]
+
+    with database.transaction():
+        conn.execute("UPDATE expenses SET category_id = NULL")
+    assert _cells(202408) == [(0, 20_000.0, 1)]
+    assert chi_tieu.check_month_totals() == []
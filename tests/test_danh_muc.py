@@ -0,0 +1,72 @@
+import chi_tieu
+import danh_muc
+import database
+
+
+def test_deleting_khac_is_rejected_and_keeps_its_expenses(db):
+    cid = danh_muc.get_category_id_by_name("Khác")
+    chi_tieu.add_expense("02-05-2024", cid, "sửa xe", 120_000, check_budget=False)
+
+    before = database.get_conn().total_changes
+    assert danh_muc.delete_category_by_name("Khác") is False
+    # Bị chặn trước khi ghi, không phải nhờ lỗi khóa ngoại rồi rollback
+    assert database.get_conn().total_changes == before
+
+    assert danh_muc.get_category_id_by_name("Khác") == cid
+    assert chi_tieu.get_expense_summary_by_category_month("05-2024") == [("Khác", 120_000.0)]
+    assert chi_tieu.check_month_totals() == []
+
+
+def test_deleting_category_moves_expenses_to_khac(db):
+    danh_muc.add_category("Du lịch")
+    chi_tieu.add_expense("02-05-2024", danh_muc.get_category_id_by_name("Du lịch"), "vé tàu", 300_000,
+                         check_budget=False)
+    chi_tieu.add_expense("03-05-2024", danh_muc.get_category_id_by_name("Khác"), "sửa xe", 120_000,
+                         check_budget=False)
+
+    assert danh_muc.delete_category_by_name("Du lịch") is True
+
+    assert danh_muc.get_category_id_by_name("Du lịch") is None
+    assert chi_tieu.get_expense_summary_by_category_month("05-2024") == [("Khác", 420_000.0)]
+    assert chi_tieu.check_month_totals() == []
+
+
+def test_category_lookups_stay_in_memory(db):
+    danh_muc.get_category_id_by_name("Ăn uống")
+    statements = []
+    conn = database.get_conn()
+    conn.set_trace_callback(statements.append)
+    try:
+        before = danh_muc.cache_stats()
+        for _ in range(100):
+            danh_muc.get_category_id_by_name("Ăn uống")
+        after = danh_muc.cache_stats()
+    finally:
+        conn.set_trace_callback(None)
+
+    assert statements == []
+    assert after["hits"] - before["hits"] == 100 and after["misses"] == before["misses"]
+
+
+def test_only_category_writes_from_other_connections_reload(db, monkeypatch):
+    import sqlite3
+
+    danh_muc.get_all_categories()
+    reloads = danh_muc.cache_stats()["reloads"]
+    other = sqlite3.connect(db)
+    try:
+        # Khoản chi từ tiến trình khác: data_version đổi nhưng danh mục thì không
+        other.execute("INSERT INTO expenses (date, category_id, description, amount, date_key) "
+                      "VALUES ('01-06-2024', 1, 'x', 1.0, 20240601)")
+        other.commit()
+        monkeypatch.setattr(danh_muc._registry, "_checked", 0.0)  # tới hạn so chữ ký
+        danh_muc.get_all_categories()
+        assert danh_muc.cache_stats()["reloads"] == reloads
+
+        # Danh mục mới từ tiến trình khác: tra không thấy tên -> hỏi lại DB ngay
+        other.execute("INSERT INTO categories (name) VALUES ('Thú cưng')")
+        other.commit()
+        assert danh_muc.get_category_id_by_name("Thú cưng") is not None
+        assert danh_muc.cache_stats()["reloads"] == reloads + 1
+    finally:
+        other.close()
@@ -0,0 +1,68 @@
+import database
+
+
+def test_income_lookup_ignores_leading_zero_of_month(db):
+    database.add_income("03-2024", 12_000_000)
+
+    assert database.get_income_for_month("3-2024") == 12_000_000.0
+    assert database.get_income_for_month("03-2024") == 12_000_000.0
+    assert database.get_income_for_month("13-2024") == 0.0
+
+
+def test_add_income_keeps_one_row_per_month(db):
+    database.add_income("3-2024", 1_000_000)
+    database.add_income("03-2024", 500_000)
+
+    assert database.count_incomes() == 1
+    assert database.get_income_page() == [(202403, "03-2024", 1_500_000.0)]
+
+
+def test_nested_rollback_keeps_outer_work_and_holds_events_until_commit(db):
+    import chi_tieu
+    import danh_muc
+    import su_kien
+
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    seen = []
+    unsubscribe = su_kien.subscribe(su_kien.EXPENSES, seen.append)
+    try:
+        with database.transaction():
+            chi_tieu.add_expense("01-02-2024", cid, "giữ lại", 10_000, check_budget=False)
+            try:
+                with database.transaction():
+                    chi_tieu.add_expense("02-02-2024", cid, "bị hủy", 20_000, check_budget=False)
+                    raise RuntimeError("lỗi trong khối trong")
+            except RuntimeError:
+                pass
+            assert seen == []  # chưa commit: sự kiện còn được giữ
+        assert [e.rows[0]["description"] for e in seen] == ["giữ lại"]
+    finally:
+        unsubscribe()
+
+    rows = database.get_conn().execute("SELECT description FROM expenses").fetchall()
+    assert rows == [("giữ lại",)]
+    assert chi_tieu.get_total_expense_by_month("02-2024") == 10_000.0
+
+
+def test_outer_rollback_drops_events_and_runs_rollback_hooks(db, monkeypatch):
+    import chi_tieu
+    import danh_muc
+    import su_kien
+
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    hooks, seen = [], []
+    monkeypatch.setattr(database, "_rollback_hooks", database._rollback_hooks + [lambda: hooks.append(1)])
+    unsubscribe = su_kien.subscribe(None, seen.append)
+    try:
+        try:
+            with database.transaction():
+                chi_tieu.add_expense("01-02-2024", cid, "bị hủy", 10_000, check_budget=False)
+                raise RuntimeError("hủy cả nhóm")
+        except RuntimeError:
+            pass
+    finally:
+        unsubscribe()
+
+    assert seen == [] and hooks == [1]
+    assert database.get_conn().execute("SELECT COUNT(*) FROM expenses").fetchone()[0] == 0
+    assert not database.in_transaction()
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import chi_tieu
+import danh_muc
+import ngan_sach
+from hang_doi_ghi import WriteQueue
+
+
+@pytest.fixture
+def notified(db):
+    """Thay notifier bằng một hàm ghi lại (số khoản chi đã commit lúc nhận, các cảnh báo)."""
+    calls = []
+
+    def record(alerts):
+        other = sqlite3.connect(db)  # kết nối khác chỉ thấy dữ liệu đã commit
+        committed = other.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+        other.close()
+        calls.append((committed, [(a.category, a.total) for a in alerts]))
+
+    old = ngan_sach.get_notifier()
+    ngan_sach.set_notifier(ngan_sach.CallbackNotifier(record))
+    yield calls
+    ngan_sach.set_notifier(old)
+
+
+def test_budget_alerts_are_sent_once_after_the_batch_commits(notified):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    ngan_sach.set_budget(100_000, category="Ăn uống", month="03-2024")
+
+    def fail():
+        chi_tieu.add_expense("07-03-2024", cid, "bị hủy", 500_000)
+        raise RuntimeError("hủy")
+
+    writes = WriteQueue(window_ms=200)
+    try:
+        first = writes.submit(chi_tieu.add_expense, "05-03-2024", cid, "chợ", 80_000)
+        broken = writes.submit(fail)
+        last = writes.submit(chi_tieu.add_expense, "06-03-2024", cid, "chợ", 40_000)
+        assert first.result() == []
+        assert [a.total for a in last.result()] == [120_000.0]
+        with pytest.raises(RuntimeError):
+            broken.result()
+    finally:
+        writes.close()
+
+    assert writes.stats()["batches"] == 1
+    # Một lần gửi, sau commit, không có cảnh báo của lệnh bị rollback
+    assert notified == [(2, [("Ăn uống", 120_000.0)])]
@@ -0,0 +1,60 @@
+import os
+
+import chi_tieu
+import danh_muc
+import database
+import luu_tru
+
+
+def _main_rows(year):
+    lo, hi = year * 10000 + 101, year * 10000 + 1231
+    return database.get_conn().execute(
+        "SELECT COUNT(*) FROM main.expenses WHERE date_key BETWEEN ? AND ?", (lo, hi)).fetchone()[0]
+
+
+def test_archive_and_restore_round_trip(db):
+    food = danh_muc.get_category_id_by_name("Ăn uống")
+    for month in (1, 6, 12):
+        chi_tieu.add_expense(f"10-{month:02d}-2023", food, f"tháng {month}", month * 1_000, check_budget=False)
+    chi_tieu.add_expense("10-01-2024", food, "năm sau", 5_000, check_budget=False)
+    before = sorted(chi_tieu.get_all_expenses())
+
+    info = luu_tru.archive_year(2023)
+
+    assert (info["rows"], info["total"]) == (3, 19_000.0)
+    assert list(luu_tru.archived_years()) == [2023] and os.path.exists(info["path"])
+    assert _main_rows(2023) == 0 and _main_rows(2024) == 1
+    # Tổng tháng vẫn lấy từ bảng tổng hợp; danh sách từng dòng đọc thêm file năm
+    assert chi_tieu.get_total_expense_by_month("06-2023") == 6_000.0
+    assert [r[1] for r in chi_tieu.get_expenses_by_month("12-2023")] == ["tháng 12"]
+    assert sorted(chi_tieu.get_all_expenses()) == before
+    assert chi_tieu.check_month_totals() == []
+
+    # Lưu trữ lại năm đó: dòng mới thêm được gộp vào file cũ
+    chi_tieu.add_expense("20-06-2023", food, "thêm sau", 500, check_budget=False)
+    again = luu_tru.archive_year(2023)
+    assert again["path"] == info["path"] and again["rows"] == 1
+    assert luu_tru.list_archives()[0]["rows"] == 4
+
+    restored = luu_tru.restore_year(2023)
+
+    assert restored["rows"] == 4
+    assert luu_tru.archived_years() == {} and not os.path.exists(info["path"])
+    assert _main_rows(2023) == 4
+    assert chi_tieu.get_total_expense_by_month("06-2023") == 6_500.0
+    assert chi_tieu.check_month_totals() == []
+
+
+def test_deleting_category_reaches_archived_rows(db):
+    danh_muc.add_category("Tạm")
+    tmp = danh_muc.get_category_id_by_name("Tạm")
+    chi_tieu.add_expense("10-03-2023", tmp, "cũ", 7_000, check_budget=False)
+    luu_tru.archive_year(2023)
+
+    assert danh_muc.delete_category_by_name("Tạm")
+    luu_tru.restore_year(2023)
+
+    other = danh_muc.get_category_id_by_name("Khác")
+    assert database.get_conn().execute("SELECT category_id FROM expenses").fetchall() == [(other,)]
+    assert chi_tieu.get_expense_summary_by_category_month("03-2023") == [("Khác", 7_000.0)]
+    assert chi_tieu.check_month_totals() == []
@@ -0,0 +1,152 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import database
+
+TABLES = {"categories", "incomes", "expenses", "expense_month_totals", "expenses_fts", "budgets", "archives"}
+INDEXES = {"idx_expenses_date_key", "idx_expenses_cat_date", "idx_incomes_month_key", "idx_expenses_import_hash"}
+TRIGGERS = set(database.MONTH_TOTALS_TRIGGERS) | set(database.FTS_TRIGGERS)
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """Bản sao QL_Chi_Tieu.db đi kèm chương trình (lược đồ cũ, user_version = 0)."""
+    old_path = database.DB_PATH
+    path = str(tmp_path / "QL_Chi_Tieu.db")
+    shutil.copy(os.path.join(os.path.dirname(database.__file__), "QL_Chi_Tieu.db"), path)
+    database.set_db_path(path)
+    yield path
+    database.set_db_path(old_path)
+
+
+# Dữ liệu như bản cũ ghi ra: ngày không có số 0 đứng đầu, ngày sai, hai khoản giống hệt nhau,
+# thu nhập cùng tháng viết hai kiểu
+LEGACY_EXPENSES = [
+    ("05-03-2024", 1, "Cà phê sáng", 25_000),
+    ("5-3-2024", 1, "Phở bò", 50_000),
+    ("5-3-2024", 1, "Phở bò", 50_000),
+    ("31-03-2024", 2, "Đổ xăng", 100_000),
+    ("01-04-2024", 4, "Áo mưa", 80_000),
+    ("2024/13/45", 1, "ngày sai", 1),
+    ("abc", 3, "không phải ngày", 2),
+]
+LEGACY_INCOMES = [("3-2024", 1_000_000), ("03-2024", 500_000), ("04-2024", 2_000_000)]
+
+
+@pytest.fixture
+def legacy_db_with_rows(legacy_db):
+    """legacy_db có thêm chi tiêu / thu nhập ghi theo lược đồ cũ (chưa có date_key, month_key...)."""
+    conn = sqlite3.connect(legacy_db)
+    conn.executemany("INSERT INTO expenses (date, category_id, description, amount) VALUES (?, ?, ?, ?)",
+                     LEGACY_EXPENSES)
+    conn.executemany("INSERT INTO incomes (month, amount) VALUES (?, ?)", LEGACY_INCOMES)
+    conn.commit()
+    conn.close()
+    return legacy_db
+
+
+def _names(conn, kind):
+    return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def test_upgrade_creates_current_schema(legacy_db):
+    assert database.init_db() == database.SCHEMA_VERSION
+
+    conn = database.get_conn()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    assert TABLES <= _names(conn, "table")
+    assert INDEXES <= _names(conn, "index")
+    assert TRIGGERS <= _names(conn, "trigger")
+    assert "VIRTUAL TABLE" in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'expenses_fts'").fetchone()[0].upper()
+
+
+def test_init_db_on_current_schema_only_reads_version(legacy_db):
+    database.init_db()
+    statements = []
+    conn = database.get_conn()
+    conn.set_trace_callback(statements.append)
+    try:
+        assert database.init_db() == database.SCHEMA_VERSION
+    finally:
+        conn.set_trace_callback(None)
+
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_failed_step_rolls_back_whole_upgrade(legacy_db, monkeypatch):
+    def broken(cur, progress):
+        raise RuntimeError("bước nâng cấp hỏng")
+
+    steps = list(database.MIGRATIONS)
+    steps[3] = (steps[3][0], broken)
+    monkeypatch.setattr(database, "MIGRATIONS", steps)
+
+    with pytest.raises(RuntimeError):
+        database.init_db()
+
+    conn = sqlite3.connect(legacy_db)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(expenses)")}
+        assert "date_key" not in columns and "import_hash" not in columns
+        assert not _names(conn, "index") & INDEXES
+    finally:
+        conn.close()
+
+
+def test_upgrade_merges_duplicate_income_months(db):
+    conn = database.get_conn()
+    # Trạng thái của bản cũ: cộng dồn theo chuỗi month, không có ràng buộc trên month_key
+    conn.execute("DROP INDEX idx_incomes_month_key")
+    conn.executemany("INSERT INTO incomes (month, amount, month_key) VALUES (?, ?, ?)",
+                     [("3-2024", 1_000_000, 202403), ("03-2024", 500_000, 202403), ("4-2024", 7, 202404)])
+    steps = [migrate for _, migrate in database.MIGRATIONS]
+    conn.execute(f"PRAGMA user_version = {steps.index(database._migrate_unique_income_month)}")
+    conn.commit()
+
+    database.init_db()
+
+    assert database.get_income_page() == [(202404, "04-2024", 7.0), (202403, "03-2024", 1_500_000.0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO incomes (month, amount, month_key) VALUES ('x', 1, 202404)")
+
+
+def test_upgrade_backfills_legacy_rows(legacy_db_with_rows, monkeypatch):
+    import chi_tieu
+    import nhap_lieu
+
+    monkeypatch.setattr(database, "MIGRATION_CHUNK", 3)  # nhiều đợt với vài dòng
+    calls = []
+    database.init_db(progress=lambda label, done, total: calls.append((label, done, total)))
+
+    conn = database.get_conn()
+    keys = dict(conn.execute("SELECT description, date_key FROM expenses"))
+    assert keys["Phở bò"] == 20240305 and keys["Đổ xăng"] == 20240331
+    assert keys["ngày sai"] is None and keys["không phải ngày"] is None
+    assert database.get_income_page() == [(202404, "04-2024", 2_000_000.0), (202403, "03-2024", 1_500_000.0)]
+
+    assert chi_tieu.check_month_totals() == []
+    assert chi_tieu.get_total_expense_by_month("03-2024") == 225_000.0
+    assert [r[3] for r in chi_tieu.search_expenses("pho bo")] == ["Phở bò", "Phở bò"]
+    assert [r[3] for r in chi_tieu.search_expenses("xang")] == ["Đổ xăng"]
+
+    hashes = [h for (h,) in conn.execute("SELECT import_hash FROM expenses WHERE date_key IS NOT NULL")]
+    assert None not in hashes and len(set(hashes)) == len(hashes) == 5
+    # Nhập lại hai khoản giống hệt nhau đã có từ trước: cả hai đều bị bỏ qua
+    again = nhap_lieu.import_expenses([("5-3-2024", "Ăn uống", "Phở bò", 50_000)] * 2, check_budget=False)
+    assert again["inserted"] == 0
+
+    steps = [label for label, done, total in calls if total == 0]
+    assert steps == [f"v{n}: {d}" for n, (d, _) in enumerate(database.MIGRATIONS, 1)]
+    chunked = {}
+    for label, done, total in calls:
+        if total:
+            chunked.setdefault(label, []).append((done, total))
+    assert chunked["điền date_key"] == [(3, 7), (6, 7), (7, 7)]
+    for label in ("tổng hợp tháng", "index tìm kiếm"):
+        assert chunked[label][0] == (0, 7) and chunked[label][-1] == (7, 7)
+    assert chunked["điền import_hash"] == [(3, 5), (5, 5)]
@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import chi_tieu
+import danh_muc
+import database
+import ngan_sach
+
+
+def _insert(cid, amount, date_key=20240305):
+    """Ghi một khoản chi thẳng vào DB rồi báo cho engine như chi_tieu.add_expense."""
+    conn = database.get_conn()
+    before = conn.total_changes
+    with database.transaction():
+        conn.execute("INSERT INTO expenses (date, category_id, description, amount, date_key) "
+                     "VALUES (?, ?, '', ?, ?)",
+                     (f"{date_key % 100:02d}-{date_key // 100 % 100:02d}-{date_key // 10000}",
+                      cid, amount, date_key))
+    return before
+
+
+@pytest.fixture
+def engine(db):
+    return ngan_sach.BudgetEngine(ngan_sach.NullNotifier())
+
+
+def test_engine_adds_to_running_total_without_reloading(engine):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    database.add_income("03-2024", 1_000_000)
+
+    before = _insert(cid, 500_000)
+    assert engine.record_expense(202403, cid, 500_000, since=before) == []
+    before = _insert(cid, 450_000)
+    alerts = engine.record_expense(202403, cid, 450_000, since=before)
+
+    assert engine.stats() == {"hits": 1, "loads": 1}
+    assert [(a.category, a.total, a.limit) for a in alerts] == [(None, 950_000.0, 900_000.0)]
+
+
+def test_engine_reloads_after_untracked_write_on_same_connection(engine):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    database.add_income("03-2024", 1_000_000)
+    before = _insert(cid, 950_000)
+    assert len(engine.record_expense(202403, cid, 950_000, since=before)) == 1
+
+    # Thêm thu nhập không đi qua record_expense -> total_changes lệch, phải nạp lại
+    database.add_income("03-2024", 1_000_000)
+    before = _insert(cid, 10_000)
+
+    assert engine.record_expense(202403, cid, 10_000, since=before) == []
+    assert engine.stats()["loads"] == 2
+
+
+def test_engine_reloads_after_commit_from_other_connection(engine, db):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    database.add_income("03-2024", 1_000_000)
+    assert engine.check_month("03-2024") == []
+
+    other = sqlite3.connect(db)
+    with other:
+        other.execute("INSERT INTO budgets (category_id, month_key, limit_amount, limit_ratio) "
+                      "VALUES (?, ?, 100000, NULL)", (cid, 202403))
+        other.execute("INSERT INTO expenses (date, category_id, description, amount, date_key) "
+                      "VALUES ('05-03-2024', ?, '', 200000, 20240305)", (cid,))
+    other.close()
+
+    alerts = engine.check_month("03-2024")
+    assert [(a.category, a.total, a.limit) for a in alerts] == [("Ăn uống", 200_000.0, 100_000.0)]
+    assert engine.stats()["loads"] == 2
+
+
+def test_rollback_drops_running_total_of_shared_engine(db):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    ngan_sach.set_budget(100_000, category="Ăn uống", month="03-2024")
+    chi_tieu.add_expense("05-03-2024", cid, "", 60_000, check_budget=False)
+
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            alerts = chi_tieu.add_expense("06-03-2024", cid, "", 60_000, check_budget=False)
+            assert [a.total for a in alerts if a.category] == [120_000.0]
+            raise RuntimeError("hủy")
+
+    # on_rollback -> forget(): không còn cộng khoản chi đã bị hủy
+    assert ngan_sach.check_month("03-2024", notify=False) == []
@@ -0,0 +1,66 @@
+import chi_tieu
+import danh_muc
+import luu_tru
+import nhap_lieu
+
+
+def test_import_into_archived_year_keeps_month_totals(db):
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    for day in range(1, 11):
+        chi_tieu.add_expense(f"{day:02d}-03-2024", cid, f"chợ {day}", 30_000, check_budget=False)
+    luu_tru.archive_year(2024)
+
+    stats = nhap_lieu.import_expenses([("15-03-2024", "Ăn uống", "nhập thêm", 1)], check_budget=False)
+
+    assert stats["inserted"] == 1
+    assert chi_tieu.get_total_expense_by_month("03-2024") == 300_001.0
+    assert chi_tieu.check_month_totals() == []
+
+
+def test_reimport_of_exported_month_skips_hand_entered_rows(db):
+    import os
+    import xuat_excel
+
+    cid = danh_muc.get_category_id_by_name("Ăn uống")
+    for desc in ("cơm trưa", "cơm trưa", "cà phê"):
+        chi_tieu.add_expense("05-03-2024", cid, desc, 35_000, check_budget=False)
+    path = xuat_excel.export_to_excel("03-2024")
+    try:
+        stats = nhap_lieu.import_file(path, check_budget=False)
+    finally:
+        os.remove(path)
+
+    assert (stats["read"], stats["inserted"], stats["duplicates"]) == (3, 0, 3)
+    assert chi_tieu.get_total_expense_by_month("03-2024") == 105_000.0
+
+
+def test_upgrade_fills_import_hash_of_old_rows(db):
+    import database
+
+    cid = danh_muc.get_category_id_by_name("Đi lại")
+    conn = database.get_conn()
+    with database.transaction():
+        # Dòng nhập tay từ bản cũ: chưa có import_hash
+        conn.executemany("INSERT INTO expenses (date, category_id, description, amount, date_key) "
+                         "VALUES ('07-04-2024', ?, 'xe buýt', 7000.0, 20240407)", [(cid,), (cid,)])
+    steps = [migrate for _, migrate in database.MIGRATIONS]
+    conn.execute(f"PRAGMA user_version = {steps.index(database._migrate_fill_import_hash)}")
+    database.init_db()
+
+    assert conn.execute("SELECT COUNT(*) FROM expenses WHERE import_hash IS NULL").fetchone()[0] == 0
+    stats = nhap_lieu.import_expenses([("07-04-2024", "Đi lại", "xe buýt", 7000)] * 3, check_budget=False)
+    assert stats["inserted"] == 1
+
+
+def test_import_accepts_iso_and_day_first_dates(db):
+    from datetime import datetime
+
+    rows = [("2024-03-05", "Ăn uống", "iso", 1), ("2024-03-06 00:00:00", "Ăn uống", "iso giờ", 2),
+            ("7/3/2024", "Ăn uống", "d/m", 4), (datetime(2024, 3, 8, 9, 30), "Ăn uống", "datetime", 8),
+            ("2024-13-01", "Ăn uống", "sai", 16), ("05-03-24", "Ăn uống", "năm 2 số", 32)]
+
+    stats = nhap_lieu.import_expenses(rows, check_budget=False)
+
+    assert (stats["inserted"], stats["invalid"]) == (4, 2)
+    assert sorted(r[3] for r in chi_tieu.get_expenses_by_month("03-2024")) == [
+        "05-03-2024", "06-03-2024", "07-03-2024", "08-03-2024"]
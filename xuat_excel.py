@@ -1,8 +1,12 @@
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from datetime import datetime
+from collections import namedtuple
 import os
+import time
 import database
+import luu_tru
 
 def export_to_excel(month=None):
     """
@@ -16,19 +20,16 @@ def export_to_excel(month=None):
     income = database.get_income_for_month(month)
 
     # Lấy dữ liệu chi tiêu theo tháng
-    conn = database.get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT COALESCE(c.name, 'Khác') AS category, e.description, e.amount, e.date
-            FROM expenses e
-            LEFT JOIN categories c ON e.category_id = c.id
-            WHERE substr(e.date, 4, 7) = ?
-            ORDER BY substr(e.date,7,4) DESC, substr(e.date,4,2) DESC, substr(e.date,1,2) DESC
-        """, (month,))
-        expenses = cur.fetchall()
-    finally:
-        conn.close()
+    lo, hi = database.month_range(month)
+    cur = database.get_conn().cursor()
+    cur.execute(f"""
+        SELECT COALESCE(c.name, 'Khác') AS category, e.description, e.amount, e.date
+        FROM {luu_tru.expenses_from(lo, hi)} e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.date_key BETWEEN ? AND ?
+        ORDER BY e.date_key DESC, e.id DESC
+    """, (lo, hi))
+    expenses = cur.fetchall()
 
     if not income and not expenses:
         raise ValueError(f"Không có dữ liệu cho tháng {month}")
@@ -91,14 +92,275 @@ def export_to_excel(month=None):
         ws[f"{c}{max_row}"].font = bold
 
     # Lưu file, tránh trùng tên
+    save_path = _unique_save_path(f"chi_tieu-{month.replace('/', '-')}.xlsx")
+    wb.save(save_path)
+    return save_path
+
+
+def _unique_save_path(base_filename):
+    """Đường dẫn trong thư mục chương trình, thêm (1), (2)... nếu file đã tồn tại."""
     program_dir = os.path.dirname(os.path.abspath(__file__))
-    base_filename = f"chi_tieu-{month.replace('/', '-')}.xlsx"
     save_path = os.path.join(program_dir, base_filename)
     counter = 1
     while os.path.exists(save_path):
         name, ext = os.path.splitext(base_filename)
         save_path = os.path.join(program_dir, f"{name}({counter}){ext}")
         counter += 1
+    return save_path
 
-    wb.save(save_path)
+
+def _save_atomic(wb, save_path):
+    """
+    Ghi workbook ra file tạm cùng thư mục rồi os.replace sang tên thật: người đọc (hoặc lần
+    xuất song song khác) không bao giờ thấy file ghi dở; lỗi giữa chừng không để lại rác.
+    """
+    tmp = f"{save_path}.{os.getpid()}.tmp"
+    try:
+        wb.save(tmp)
+        os.replace(tmp, save_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
     return save_path
+
+
+# XUẤT DẠNG STREAMING (write_only) CHO THÁNG LỚN / NHIỀU THÁNG
+# Dữ liệu được đọc từ cursor theo từng đợt (fetchmany) và ghi thẳng ra file tạm của
+# openpyxl, nên bộ nhớ không tăng theo số dòng. Style được tạo sẵn một lần (NamedStyle)
+# và gán khi ghi từng ô, không phải duyệt lại toàn bộ sheet như export_to_excel.
+
+CHUNK_SIZE = 5000
+
+
+def _month_list(start_month, end_month):
+    """Danh sách tháng MM-YYYY từ start_month tới end_month (bao gồm cả hai đầu)."""
+    lo, hi = database.month_key(start_month), database.month_key(end_month)
+    if lo > hi:
+        lo, hi = hi, lo
+    months = []
+    mk = lo
+    while mk <= hi:
+        months.append(f"{mk % 100:02d}-{mk // 100}")
+        mk = mk + 1 if mk % 100 < 12 else (mk // 100 + 1) * 100 + 1
+    return months
+
+
+def _register_styles(wb):
+    """Tạo các NamedStyle dùng chung cho cả workbook (chỉ tạo một lần)."""
+    thin = Side(style="thin")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal="center", vertical="center")
+    right = Alignment(horizontal="right")
+
+    def style(name, **attrs):
+        ns = NamedStyle(name=name)
+        for k, v in attrs.items():
+            setattr(ns, k, v)
+        wb.add_named_style(ns)
+
+    style("ct_title", font=Font(bold=True, size=14, color="FFFFFF"), alignment=center,
+          fill=PatternFill(start_color="7A5C3E", end_color="7A5C3E", fill_type="solid"))
+    style("ct_header", font=Font(bold=True), alignment=center, border=border,
+          fill=PatternFill(start_color="C89F6D", end_color="C89F6D", fill_type="solid"))
+    style("ct_cell", alignment=center, border=border)
+    style("ct_money", alignment=right, border=border, number_format="#,##0")
+    style("ct_total", font=Font(bold=True), alignment=right, border=border, number_format="#,##0")
+
+
+def _cell(ws, value, style):
+    c = WriteOnlyCell(ws, value)
+    c.style = style
+    return c
+
+
+def _month_overview(months):
+    """{tháng: (thu nhập, tổng chi, số khoản chi)} đọc từ incomes + bảng tổng hợp."""
+    lo, hi = database.month_key(months[0]), database.month_key(months[-1])
+    cur = database.get_conn().cursor()
+    cur.execute("""
+        SELECT month_key, SUM(total), SUM(cnt) FROM expense_month_totals
+        WHERE month_key BETWEEN ? AND ? GROUP BY month_key
+    """, (lo, hi))
+    spent = {r[0]: (r[1], r[2]) for r in cur.fetchall()}
+    cur.execute("SELECT month_key, amount FROM incomes WHERE month_key BETWEEN ? AND ?", (lo, hi))
+    income = dict(cur.fetchall())
+    out = {}
+    for m in months:
+        mk = database.month_key(m)
+        total, cnt = spent.get(mk, (0.0, 0))
+        out[m] = (float(income.get(mk) or 0), float(total or 0), int(cnt or 0))
+    return out
+
+
+def export_range_to_excel(start_month, end_month=None, save_path=None,
+                          chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Xuất chi tiêu + thu nhập của một khoảng tháng (MM-YYYY) ra MỘT file Excel:
+    sheet "Tổng hợp" đầu tiên, sau đó mỗi tháng có dữ liệu một sheet.
+    - Dùng workbook write_only và đọc cursor theo đợt chunk_size dòng -> bộ nhớ cố định
+    - progress(số dòng đã ghi, tổng số dòng) được gọi sau mỗi đợt (nếu truyền vào)
+    Trả về đường dẫn file đã lưu.
+    """
+    months = _month_list(start_month, end_month or start_month)
+    overview = _month_overview(months)
+    months = [m for m in months if overview[m][0] or overview[m][2]]
+    if not months:
+        raise ValueError(f"Không có dữ liệu từ tháng {start_month} đến {end_month or start_month}")
+    total_rows = sum(overview[m][2] for m in months)
+
+    wb = openpyxl.Workbook(write_only=True)
+    _register_styles(wb)
+
+    # Sheet tổng hợp: số liệu lấy từ bảng tổng hợp nên ghi được trước các sheet chi tiết
+    ws = wb.create_sheet("Tổng hợp")
+    for col, width in zip("ABCDE", (14, 20, 20, 20, 14)):
+        ws.column_dimensions[col].width = width
+    ws.append([_cell(ws, f"TỔNG HỢP CHI TIÊU {months[0]} - {months[-1]}", "ct_title")])
+    ws.append([])
+    ws.append([_cell(ws, h, "ct_header") for h in ("Tháng", "Thu nhập", "Tổng chi", "Số dư", "Số khoản")])
+    sum_inc = sum_spent = 0.0
+    for m in months:
+        inc, spent, cnt = overview[m]
+        sum_inc += inc
+        sum_spent += spent
+        ws.append([_cell(ws, m, "ct_cell"), _cell(ws, inc, "ct_money"), _cell(ws, spent, "ct_money"),
+                   _cell(ws, inc - spent, "ct_money"), _cell(ws, cnt, "ct_cell")])
+    ws.append([_cell(ws, "TỔNG", "ct_header"), _cell(ws, sum_inc, "ct_total"),
+               _cell(ws, sum_spent, "ct_total"), _cell(ws, sum_inc - sum_spent, "ct_total"),
+               _cell(ws, total_rows, "ct_total")])
+
+    done = 0
+    cur = database.get_conn().cursor()
+    for m in months:
+        inc, spent, _ = overview[m]
+        ws = wb.create_sheet(f"Tháng {m}")
+        for col, width in zip("ABCDE", (18, 22, 35, 18, 14)):
+            ws.column_dimensions[col].width = width
+        ws.append([_cell(ws, f"BÁO CÁO CHI TIÊU THÁNG {m}", "ct_title")])
+        ws.append([])
+        ws.append(["Thu nhập (VND):", _cell(ws, inc, "ct_money")])
+        ws.append([])
+        ws.append([_cell(ws, h, "ct_header") for h in ("STT", "Danh mục", "Mô tả", "Số tiền (VND)", "Ngày")])
+
+        lo, hi = database.month_range(m)
+        cur.execute(f"""
+            SELECT COALESCE(c.name, 'Khác'), e.description, e.amount, e.date
+            FROM {luu_tru.expenses_from(lo, hi)} e
+            LEFT JOIN categories c ON e.category_id = c.id
+            WHERE e.date_key BETWEEN ? AND ?
+            ORDER BY e.date_key DESC, e.id DESC
+        """, (lo, hi))
+        i = 0
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            for cat, desc, amount, date in rows:
+                i += 1
+                ws.append([_cell(ws, i, "ct_cell"), _cell(ws, cat, "ct_cell"), _cell(ws, desc, "ct_cell"),
+                           _cell(ws, amount, "ct_money"), _cell(ws, date, "ct_cell")])
+            done += len(rows)
+            if progress:
+                progress(done, total_rows)
+
+        ws.append([])
+        ws.append(["", "", _cell(ws, "TỔNG CHI", "ct_total"), _cell(ws, spent, "ct_total")])
+        ws.append(["", "", _cell(ws, "SỐ DƯ", "ct_total"), _cell(ws, inc - spent, "ct_total")])
+
+    if save_path is None:
+        name = months[0] if len(months) == 1 else f"{months[0]}_{months[-1]}"
+        save_path = _unique_save_path(f"chi_tieu-{name}.xlsx")
+    return _save_atomic(wb, save_path)
+
+
+def export_year_to_excel(year, save_path=None, **kwargs):
+    """Xuất cả năm (12 sheet tháng + sheet tổng hợp) bằng export_range_to_excel."""
+    return export_range_to_excel(f"01-{year}", f"12-{year}", save_path=save_path, **kwargs)
+
+
+# XUẤT HÀNG LOẠT SONG SONG: mỗi tháng một file, chia cho nhiều tiến trình
+# Dựng workbook openpyxl là code Python thuần (tốn CPU, bị GIL giới hạn) nên luồng không
+# giúp được; mỗi tiến trình con có kết nối SQLite chỉ đọc riêng và tự ghi file của mình.
+# Tên file cố định theo tháng (chi_tieu-MM-YYYY.xlsx): chạy lại thì ghi đè nguyên tử,
+# không sinh thêm bản (1), (2)...
+
+# month: MM-YYYY; rows: số khoản chi; seconds / cpu_seconds: thời gian thực / thời gian CPU
+# để dựng + ghi file trong tiến trình con (khi số tiến trình > số lõi, seconds bị kéo dài
+# vì phải chờ CPU, còn cpu_seconds thì không)
+ExportResult = namedtuple("ExportResult", "month path rows seconds cpu_seconds")
+
+
+def batch_file_name(month):
+    return f"chi_tieu-{month}.xlsx"
+
+
+def months_with_data(start_month=None, end_month=None):
+    """Các tháng MM-YYYY có thu nhập hoặc chi tiêu (cũ nhất trước), trong khoảng nếu có."""
+    lo = database.month_key(start_month) if start_month else 0
+    hi = database.month_key(end_month or start_month) if start_month else 999999
+    lo, hi = min(lo, hi), max(lo, hi)
+    cur = database.get_conn().cursor()
+    cur.execute("""
+        SELECT month_key FROM expense_month_totals WHERE month_key BETWEEN ? AND ?
+        UNION
+        SELECT month_key FROM incomes WHERE month_key BETWEEN ? AND ?
+        ORDER BY 1
+    """, (lo, hi, lo, hi))
+    return [f"{mk % 100:02d}-{mk // 100}" for (mk,) in cur.fetchall()]
+
+
+def _init_export_worker(db_path):
+    database.set_db_path(db_path, read_only=True)
+
+
+def _export_month_file(month, out_dir):
+    """Chạy trong tiến trình con: xuất một tháng ra out_dir/chi_tieu-MM-YYYY.xlsx."""
+    t0, c0 = time.perf_counter(), time.process_time()
+    rows = []
+    path = export_range_to_excel(month, save_path=os.path.join(out_dir, batch_file_name(month)),
+                                 progress=lambda done, total: rows.append(done))
+    return ExportResult(month, path, rows[-1] if rows else 0,
+                        time.perf_counter() - t0, time.process_time() - c0)
+
+
+def export_months(months=None, out_dir=None, workers=None, progress=None):
+    """
+    Xuất mỗi tháng ra một file riêng, song song trên ProcessPoolExecutor.
+    - months: list MM-YYYY (mặc định: mọi tháng có dữ liệu); out_dir mặc định là thư mục chương trình
+    - workers: số tiến trình (mặc định: số CPU); workers=1 chạy ngay trong tiến trình hiện tại
+    - progress(ExportResult, số file đã xong, tổng số file) được gọi khi từng file xong
+    Tháng lớn được giao trước để các tiến trình kết thúc gần cùng lúc.
+    Trả về list ExportResult theo thứ tự tháng.
+    """
+    if months is None:
+        months = months_with_data()
+    out_dir = out_dir or os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(out_dir, exist_ok=True)
+    overview = _month_overview(sorted(months, key=database.month_key)) if months else {}
+    months = [m for m in months if overview[m][0] or overview[m][2]]
+    order = sorted(months, key=lambda m: -overview[m][2])
+    workers = max(1, min(workers or os.cpu_count() or 1, len(order) or 1))
+
+    results = {}
+
+    def finished(res):
+        results[res.month] = res
+        if progress:
+            progress(res, len(results), len(order))
+
+    if workers == 1:
+        for m in order:
+            finished(_export_month_file(m, out_dir))
+    else:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        # spawn: tiến trình con sạch (không thừa hưởng kết nối SQLite / luồng Tk của tiến trình cha)
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_export_worker,
+                                 initargs=(os.path.abspath(database.DB_PATH),)) as pool:
+            futures = [pool.submit(_export_month_file, m, out_dir) for m in order]
+            for fut in as_completed(futures):
+                finished(fut.result())
+    return [results[m] for m in months]